@@ -1,8 +1,13 @@
+import json
+import uuid
+
 import streamlit as st
 from streamlit_chat import message
 import requests
 
 FASTAPI_URL = "http://127.0.0.1:8000/query"
+FASTAPI_STREAM_URL = "http://127.0.0.1:8000/query/stream"
+FASTAPI_HEALTH_URL = "http://127.0.0.1:8000/healthz"
 
 st.set_page_config(page_title="SeaQuiller", page_icon=":bird:")
 st.markdown("<h1 style='text-align: center;'>SeaQuiller 🐦</h1>", unsafe_allow_html=True)
@@ -30,6 +35,21 @@ if 'host' not in st.session_state:
     st.session_state['host'] = []
 if 'port' not in st.session_state:
     st.session_state['port'] = []
+# Follow-up questions continue the same conversation thread on the server
+if 'thread_id' not in st.session_state:
+    st.session_state['thread_id'] = uuid.uuid4().hex
+
+
+def server_has_threads():
+    """Whether the server keeps conversation threads; asked once per session."""
+    if 'server_threads' not in st.session_state:
+        try:
+            health = requests.get(FASTAPI_HEALTH_URL, timeout=5).json()
+            st.session_state['server_threads'] = bool(health.get("threads"))
+        except (requests.exceptions.RequestException, ValueError):
+            # Unknown: ask without a thread rather than fail every question
+            return False
+    return st.session_state['server_threads']
 
 
 st.sidebar.title("Options")
@@ -50,6 +70,10 @@ else:
     port = db_expander.text_input("Enter port: ")
 
 
+# Follow-ups need the thread; without it repeated questions are answered from the server's cache
+remember = st.sidebar.checkbox("Remember the conversation", value=True,
+                               help="Lets follow-up questions refer to earlier ones.")
+
 clear_button = st.sidebar.button("Clear Conversation", key="clear")
 
 # Map model names to OpenAI model IDs
@@ -71,6 +95,20 @@ if clear_button:
     st.session_state['password'] = []
     st.session_state['host'] = []
     st.session_state['port'] = []
+    st.session_state['thread_id'] = uuid.uuid4().hex
+
+
+def iter_sse(response):
+    """Yields (event, data) pairs from a server-sent event response."""
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and event:
+            yield event, json.loads("\n".join(data) or "{}")
+            event, data = None, []
 
 
 def generate_response(prompt):
@@ -81,19 +119,46 @@ def generate_response(prompt):
             "model": model,
             "db_type": db_type,
             "database": database,
-            "api_key": api_key
+            "api_key": api_key,
         }
+        if remember and server_has_threads():
+            payload["thread_id"] = st.session_state['thread_id']
 
-        # Send POST request to FastAPI
+        # Stream progress from FastAPI and render it as it arrives
+        answer = ""
+        status = st.status("Thinking...", expanded=False)
+        answer_placeholder = st.empty()
         try:
-            response = requests.post(FASTAPI_URL, json=payload)
-
-            if response.status_code == 200:
-                data = response.json()
-                return data['response']
-                # st.success(data['response'])
-            else:
-                st.error(f"Error: {response.status_code} - {response.text}")
+            response = requests.post(FASTAPI_STREAM_URL, json=payload, stream=True)
+            if response.status_code == 400 and "thread_id" in payload and "threads are disabled" in response.text:
+                # Threads were turned off on the server since it was asked: continue without one
+                response.close()
+                st.session_state['server_threads'] = False
+                payload.pop("thread_id")
+                response = requests.post(FASTAPI_STREAM_URL, json=payload, stream=True)
+            with response:
+                if response.status_code != 200:
+                    st.error(f"Error: {response.status_code} - {response.text}")
+                    return None
+                for event, data in iter_sse(response):
+                    if event == "node":
+                        status.update(label=f"Running {data['node']}...")
+                    elif event == "sql":
+                        status.code(data["query"], language="sql")
+                    elif event == "rows":
+                        status.write(data["content"])
+                    elif event == "token":
+                        answer += data["text"]
+                        answer_placeholder.markdown(answer)
+                    elif event == "answer":
+                        answer = data["response"]
+                    elif event == "error":
+                        st.error(f"Error: {data['status_code']} - {data['detail']}")
+                        status.update(label="Failed", state="error")
+                        return None
+            status.update(label="Done", state="complete")
+            answer_placeholder.empty()
+            return answer
         except requests.exceptions.RequestException as e:
             st.error(f"An error occurred: {e}")
     else:
@@ -0,0 +1 @@
+"""Offline benchmark harness: fixtures, a scripted LLM and the runner."""
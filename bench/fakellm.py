@@ -0,0 +1,134 @@
+"""
+A deterministic, scripted stand-in for ChatOpenAI.
+
+It recognises which node is calling from the system prompt, answers with the SQL
+scripted for the question, and reports estimated token usage. Latency is simulated
+so concurrency behaves like it would against a remote model.
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English and SQL.
+    return max(len(text) // 4, 1)
+
+
+def _message_text(message: BaseMessage) -> str:
+    text = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tool_calls = getattr(message, "tool_calls", None)
+    return text + (json.dumps(tool_calls, default=str) if tool_calls else "")
+
+
+class LLMStats:
+    """Call counts and token sizes across every scripted model of a benchmark run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls: Dict[str, int] = {}
+            self.prompt_tokens: List[int] = []
+            self.completion_tokens = 0
+            self.rate_limited = 0
+
+    def record(self, role: str, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self.calls[role] = self.calls.get(role, 0) + 1
+            self.prompt_tokens.append(prompt_tokens)
+            self.completion_tokens += completion_tokens
+
+    def record_rate_limited(self) -> None:
+        with self._lock:
+            self.rate_limited += 1
+
+
+class ScriptedChatModel(BaseChatModel):
+    scenarios: Dict[str, Any]
+    stats: Any = None
+    # Simulated time to first token, and per generated token.
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ScriptedChatModel":
+        # Tool schemas only matter to a real model; the script already knows what to call.
+        return self
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        system = messages[0].content if messages and isinstance(messages[0], SystemMessage) else ""
+        last = messages[-1]
+        if "Double check" in system:
+            role = "query_check"
+            message = self._tool_call("query_db", {"query_string": last.content})
+        elif not system:
+            role = "get_schema"
+            message = self._tool_call("get_full_schema", {"input": ""})
+        else:
+            role = "query_gen"
+            message = self._query_gen(messages)
+
+        prompt_tokens = sum(estimate_tokens(_message_text(m)) for m in messages)
+        completion_tokens = estimate_tokens(_message_text(message))
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens}
+        if self.stats is not None:
+            self.stats.record(role, prompt_tokens, completion_tokens)
+        return message
+
+    def _query_gen(self, messages: List[BaseMessage]) -> AIMessage:
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        scenario = self.scenarios.get(question)
+        last = messages[-1]
+        if isinstance(last, ToolMessage) and last.name == "query_db" and not str(last.content).startswith("Error:"):
+            return self._tool_call("SubmitFinalAnswer", {"final_answer": f"The answer is {last.content}"})
+        if scenario is None:
+            return AIMessage(content="SELECT 1")
+        attempts = sum(1 for m in messages if isinstance(m, AIMessage) and not m.tool_calls and m.content)
+        if scenario.first_sql and attempts == 0:
+            return AIMessage(content=scenario.first_sql)
+        return AIMessage(content=scenario.sql)
+
+    @staticmethod
+    def _tool_call(name: str, args: Dict[str, Any]) -> AIMessage:
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args,
+                                                  "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}])
+
+    def _delay(self, message: AIMessage) -> float:
+        return self.latency + self.token_latency * message.usage_metadata["output_tokens"]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        message = self._reply(messages)
+        time.sleep(self._delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        message = self._reply(messages)
+        await asyncio.sleep(self._delay(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def scripted_llm_factory(scenarios: Dict[str, Any], stats: LLMStats, latency: float = 0.0,
+                         token_latency: float = 0.0):
+    """
+    Returns an llm_factory for build_entry / SQLAgentNodes that builds scripted models.
+    """
+    def factory(model: str, api_key: Optional[str] = None) -> ScriptedChatModel:
+        return ScriptedChatModel(scenarios=scenarios, stats=stats, latency=latency,
+                                 token_latency=token_latency)
+    return factory
@@ -0,0 +1,155 @@
+"""
+A local OpenAI-compatible server around the scripted model.
+
+It serves ``POST /v1/chat/completions``, streamed or not, with the replies of
+ScriptedChatModel, and can enforce its own requests- and tokens-per-minute limits by
+answering 429 with a Retry-After header, like the real API. With OPENAI_BASE_URL
+pointing at it, the graph runs through the real ChatOpenAI client, the shared client
+pool and the rate-limit scheduler (src/llmpool.py):
+
+    python -m bench.run --llm server --server-rpm 600
+"""
+import json
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_openai.chat_models.base import _convert_dict_to_message, _convert_message_to_dict
+
+from .fakellm import LLMStats, ScriptedChatModel, estimate_tokens
+
+
+class ServerLimits:
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        """
+        The provider's side of rate limiting: per-minute budgets that refill continuously.
+
+        Args:
+            requests_per_minute (int): Requests accepted per minute; 0 is unlimited.
+            tokens_per_minute (int): Prompt tokens accepted per minute; 0 is unlimited.
+        """
+        self.budgets = [[float(limit), float(limit), limit / 60.0] for limit in (requests_per_minute, tokens_per_minute)]
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, tokens: int) -> Optional[float]:
+        """Takes one request of ``tokens`` tokens, or returns the seconds until it would fit."""
+        with self._lock:
+            now = time.monotonic()
+            for budget in self.budgets:
+                if budget[0]:
+                    budget[1] = min(budget[0], budget[1] + (now - self.updated) * budget[2])
+            self.updated = now
+            wait = 0.0
+            for budget, amount in zip(self.budgets, (1, tokens)):
+                if budget[0] and budget[1] < amount:
+                    wait = max(wait, (min(amount, budget[0]) - budget[1]) / budget[2])
+            if wait:
+                return wait
+            for budget, amount in zip(self.budgets, (1, tokens)):
+                if budget[0]:
+                    budget[1] -= amount
+            return None
+
+
+def _messages(payload: Dict[str, Any]) -> List[BaseMessage]:
+    messages = [_convert_dict_to_message(m) for m in payload.get("messages", [])]
+    # Tool names are not sent back on the wire; the scripted model needs them
+    names = {tc["id"]: tc["name"] for m in messages if isinstance(m, AIMessage) for tc in m.tool_calls}
+    return [m.copy(update={"name": names.get(m.tool_call_id)}) if isinstance(m, ToolMessage) else m
+            for m in messages]
+
+
+def _usage(message: AIMessage) -> Dict[str, int]:
+    usage = message.usage_metadata or {}
+    return {"prompt_tokens": usage.get("input_tokens", 0), "completion_tokens": usage.get("output_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0)}
+
+
+def _completion(model: str, message: AIMessage) -> Dict[str, Any]:
+    reply = _convert_message_to_dict(message)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": reply,
+                     "finish_reason": "tool_calls" if reply.get("tool_calls") else "stop"}],
+        "usage": _usage(message),
+    }
+
+
+def _chunks(model: str, message: AIMessage, include_usage: bool):
+    """The reply as server-sent events: one delta with the whole message, then the usage."""
+    reply = _convert_message_to_dict(message)
+    delta: Dict[str, Any] = {"role": "assistant", "content": reply.get("content") or ""}
+    if reply.get("tool_calls"):
+        delta["tool_calls"] = [{**tc, "index": i} for i, tc in enumerate(reply["tool_calls"])]
+    base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model}
+    finish = "tool_calls" if reply.get("tool_calls") else "stop"
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': finish}]})}\n\n"
+    if include_usage:
+        yield f"data: {json.dumps({**base, 'choices': [], 'usage': _usage(message)})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def create_app(scenarios: Dict[str, Any], stats: LLMStats, latency: float = 0.0, token_latency: float = 0.0,
+               limits: Optional[ServerLimits] = None) -> FastAPI:
+    """
+    Builds the fake OpenAI API.
+
+    Args:
+        scenarios (Dict[str, Any]): Question to scripted scenario, as for scripted_llm_factory.
+        stats (LLMStats): Records calls, token sizes and 429s.
+        latency (float): Simulated seconds to first token.
+        token_latency (float): Simulated seconds per generated token.
+        limits (ServerLimits, optional): Rate limits to enforce with 429s.
+    """
+    model = ScriptedChatModel(scenarios=scenarios, stats=stats, latency=latency, token_latency=token_latency)
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        messages = _messages(payload)
+        if limits is not None:
+            prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+            wait = limits.take(prompt_tokens)
+            if wait is not None:
+                stats.record_rate_limited()
+                return JSONResponse(
+                    status_code=429,
+                    headers={"retry-after-ms": str(int(wait * 1000))},
+                    content={"error": {"message": "Rate limit reached.", "type": "requests",
+                                       "code": "rate_limit_exceeded", "param": None}})
+        result = await model._agenerate(messages)
+        message = result.generations[0].message
+        if payload.get("stream"):
+            include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(_chunks(payload.get("model", ""), message, include_usage),
+                                     media_type="text/event-stream")
+        return _completion(payload.get("model", ""), message)
+
+    return app
+
+
+def start_server(app: FastAPI, host: str = "127.0.0.1") -> Tuple[str, uvicorn.Server]:
+    """
+    Serves ``app`` on a free port from a background thread.
+
+    Returns:
+        Tuple[str, uvicorn.Server]: The base URL for OPENAI_BASE_URL (ending in /v1) and
+        the server; set its ``should_exit`` to stop it.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="fake-openai", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return f"http://{host}:{port}/v1", server
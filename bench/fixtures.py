@@ -0,0 +1,168 @@
+"""
+Generated SQLite fixtures for the benchmark.
+
+Every fixture has the same Chinook-like core (artists, albums, genres, tracks,
+customers, invoices, invoice_lines) so the same scripted questions work on all of
+them; sizes differ in row counts and in the number of unrelated filler tables,
+which is what stresses reflection and schema pruning.
+"""
+import os
+import random
+import sqlite3
+from typing import Dict, List, Optional
+
+# Bump when the generated layout changes so stale fixture files are rebuilt.
+FIXTURE_VERSION = 1
+
+FIXTURES = {
+    # name: (tracks, customers, invoices, invoice_lines, filler tables)
+    "small": (3500, 60, 400, 2200, 0),
+    "medium": (50000, 5000, 40000, 200000, 200),
+    "large": (200000, 50000, 300000, 1000000, 2000),
+}
+
+_DOMAINS = ["sales", "hr", "finance", "ops", "marketing", "support", "inventory", "billing",
+            "logistics", "audit"]
+_NOUNS = ["account", "ledger", "ticket", "shipment", "campaign", "employee", "vendor", "budget",
+          "asset", "contract", "forecast", "payment", "region", "warehouse", "survey", "lead"]
+_COUNTRIES = ["USA", "Canada", "Brazil", "France", "Germany", "United Kingdom", "Portugal",
+              "India", "Czech Republic", "Chile", "Australia", "Norway"]
+
+CORE_SCHEMA = """
+CREATE TABLE artists (artist_id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE albums (album_id INTEGER PRIMARY KEY, title TEXT NOT NULL,
+                     artist_id INTEGER NOT NULL REFERENCES artists(artist_id));
+CREATE TABLE genres (genre_id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE tracks (track_id INTEGER PRIMARY KEY, name TEXT NOT NULL,
+                     album_id INTEGER REFERENCES albums(album_id),
+                     genre_id INTEGER REFERENCES genres(genre_id),
+                     composer TEXT, milliseconds INTEGER NOT NULL, unit_price NUMERIC NOT NULL);
+CREATE TABLE customers (customer_id INTEGER PRIMARY KEY, first_name TEXT NOT NULL,
+                        last_name TEXT NOT NULL, country TEXT, email TEXT);
+CREATE TABLE invoices (invoice_id INTEGER PRIMARY KEY,
+                       customer_id INTEGER NOT NULL REFERENCES customers(customer_id),
+                       invoice_date TEXT NOT NULL, total NUMERIC NOT NULL);
+CREATE TABLE invoice_lines (invoice_line_id INTEGER PRIMARY KEY,
+                            invoice_id INTEGER NOT NULL REFERENCES invoices(invoice_id),
+                            track_id INTEGER NOT NULL REFERENCES tracks(track_id),
+                            unit_price NUMERIC NOT NULL, quantity INTEGER NOT NULL);
+"""
+
+
+def fixture_path(name: str, directory: str) -> str:
+    return os.path.join(directory, f"{name}-v{FIXTURE_VERSION}.sqlite3")
+
+
+def ensure_fixture(name: str, directory: str, seed: int = 7) -> str:
+    """
+    Returns the path of a fixture database, generating it on first use.
+
+    Args:
+        name (str): One of FIXTURES.
+        directory (str): Where fixture files are kept.
+        seed (int): Random seed, so every machine benchmarks the same data.
+
+    Returns:
+        str: The SQLite file path.
+    """
+    if name not in FIXTURES:
+        raise ValueError(f"Unknown fixture: {name}. Choose from {', '.join(FIXTURES)}")
+    path = fixture_path(name, directory)
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    _generate(tmp_path, *FIXTURES[name], rng=random.Random(seed))
+    os.replace(tmp_path, path)
+    return path
+
+
+def _generate(path: str, tracks: int, customers: int, invoices: int, invoice_lines: int,
+              filler_tables: int, rng: random.Random) -> None:
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(CORE_SCHEMA)
+
+        artists = max(tracks // 13, 1)
+        albums = max(tracks // 10, 1)
+        conn.executemany("INSERT INTO artists VALUES (?, ?)",
+                         ((i, f"Artist {i}") for i in range(1, artists + 1)))
+        conn.executemany("INSERT INTO albums VALUES (?, ?, ?)",
+                         ((i, f"Album {i}", rng.randint(1, artists)) for i in range(1, albums + 1)))
+        genres = ["Rock", "Jazz", "Metal", "Alternative & Punk", "Blues", "Latin", "Reggae", "Pop",
+                  "Soundtrack", "Classical", "Hip Hop/Rap", "Electronica/Dance"]
+        conn.executemany("INSERT INTO genres VALUES (?, ?)", enumerate(genres, start=1))
+        conn.executemany("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            (i, f"Track {i}", rng.randint(1, albums), rng.randint(1, len(genres)),
+             f"Composer {rng.randint(1, artists)}" if rng.random() < 0.7 else None,
+             rng.randint(60000, 600000), rng.choice((0.99, 1.99)))
+            for i in range(1, tracks + 1)))
+        conn.executemany("INSERT INTO customers VALUES (?, ?, ?, ?, ?)", (
+            (i, f"First{i}", f"Last{i}", rng.choice(_COUNTRIES), f"customer{i}@example.com")
+            for i in range(1, customers + 1)))
+        conn.executemany("INSERT INTO invoices VALUES (?, ?, ?, ?)", (
+            (i, rng.randint(1, customers),
+             f"{rng.randint(2009, 2013)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+             round(rng.uniform(0.99, 25.0), 2))
+            for i in range(1, invoices + 1)))
+        conn.executemany("INSERT INTO invoice_lines VALUES (?, ?, ?, ?, ?)", (
+            (i, rng.randint(1, invoices), rng.randint(1, tracks), rng.choice((0.99, 1.99)),
+             rng.randint(1, 3))
+            for i in range(1, invoice_lines + 1)))
+
+        for i in range(filler_tables):
+            table = f"{_DOMAINS[i % len(_DOMAINS)]}_{_NOUNS[(i // len(_DOMAINS)) % len(_NOUNS)]}_{i}"
+            conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, name TEXT, amount NUMERIC, "
+                         f"status TEXT, created_at TEXT)")
+            conn.executemany(f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?)", (
+                (j, f"{table} {j}", round(rng.uniform(0, 1000), 2), rng.choice(("open", "closed")),
+                 "2012-01-01") for j in range(1, 4)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class Scenario:
+    def __init__(self, question: str, sql: str, first_sql: Optional[str] = None):
+        """
+        A benchmark question and the SQL the scripted model answers it with.
+
+        Args:
+            question (str): The user question.
+            sql (str): The correct query.
+            first_sql (str, optional): A wrong first attempt, to exercise the retry path.
+        """
+        self.question = question
+        self.sql = sql
+        self.first_sql = first_sql
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("How many tracks are there?", "SELECT COUNT(*) FROM tracks"),
+    Scenario("Who composed the track 'Track 1'?", "SELECT composer FROM tracks WHERE name = 'Track 1'"),
+    Scenario("Which 5 countries have the most customers?",
+             "SELECT country, COUNT(*) AS customers FROM customers GROUP BY country "
+             "ORDER BY customers DESC LIMIT 5"),
+    Scenario("What are the top 5 genres by revenue?",
+             "SELECT g.name, SUM(il.unit_price * il.quantity) AS revenue FROM invoice_lines il "
+             "JOIN tracks t ON t.track_id = il.track_id JOIN genres g ON g.genre_id = t.genre_id "
+             "GROUP BY g.name ORDER BY revenue DESC LIMIT 5"),
+    Scenario("Which artist has the most albums?",
+             "SELECT ar.name, COUNT(*) AS albums FROM albums al JOIN artists ar ON ar.artist_id = al.artist_id "
+             "GROUP BY ar.name ORDER BY albums DESC LIMIT 1"),
+    Scenario("What is the total invoice revenue per year?",
+             "SELECT strftime('%Y', invoice_date) AS year, SUM(total) FROM invoices GROUP BY year ORDER BY year"),
+    Scenario("What is the average track length in minutes?",
+             "SELECT AVG(milliseconds) / 60000.0 FROM tracks",
+             first_sql="SELECT AVG(length_minutes) FROM tracks"),
+    Scenario("List 5 customers from Germany",
+             "SELECT first_name, last_name, email FROM customers WHERE country = 'Germany' LIMIT 5"),
+]
+
+
+def scenario_map() -> Dict[str, Scenario]:
+    return {scenario.question: scenario for scenario in SCENARIOS}
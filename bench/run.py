@@ -0,0 +1,350 @@
+"""
+Offline benchmark for SeaQuiller.
+
+Runs the compiled graph and the /query endpoint against generated SQLite fixtures
+with a scripted LLM, so no API key or network is needed:
+
+    python -m bench.run --fixtures small,medium --concurrency 1,8,32 --requests 64
+    python -m bench.run --save-baseline bench/baselines/local.json
+    python -m bench.run --compare bench/baselines/local.json
+    python -m bench.run --llm server --server-rpm 600
+
+With ``--llm server`` the graph talks to a local fake OpenAI server (bench/fakeopenai.py)
+through the real client pool and rate-limit scheduler; the server answers 429 past its
+own limits.
+
+Reports startup time, per-node latency, LLM call counts, prompt sizes, SQL time,
+throughput and p50/p95/p99 latency per concurrency level.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = os.path.join(".seaquiller", "bench")
+
+# The benchmark measures uncached work unless asked otherwise; settings are read at import.
+os.environ.setdefault("SEAQUILLER_SCHEMA_SNAPSHOT_DIR", os.path.join(BENCH_DIR, "snapshots"))
+if "--cache" not in sys.argv:
+    os.environ["SEAQUILLER_ANSWER_CACHE"] = "none"
+    os.environ["SEAQUILLER_RESULT_CACHE_MAX_ENTRIES"] = "0"
+
+from langchain_core.callbacks import BaseCallbackHandler  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from src.budget import RequestBudget  # noqa: E402
+from src.graph import arun_graph, extract_answer  # noqa: E402
+from src.registry import ConnectionProfile, build_entry  # noqa: E402
+
+from .fakellm import LLMStats, scripted_llm_factory  # noqa: E402
+from .fixtures import FIXTURES, SCENARIOS, ensure_fixture, scenario_map  # noqa: E402
+
+# Relative slowdown (or throughput drop) over the baseline reported as a regression.
+DEFAULT_THRESHOLD = 0.2
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Records the wall time of every graph node run."""
+
+    # Called on the event loop thread rather than via a thread pool hop per callback.
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started: Dict[Any, tuple] = {}
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    def on_chain_start(self, serialized: Any, inputs: Any, *, run_id: Any, metadata: Optional[dict] = None,
+                       **kwargs: Any) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            with self._lock:
+                self._started[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id: Any) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is not None:
+                self.durations[started[0]].append(time.perf_counter() - started[1])
+
+    def on_chain_end(self, outputs: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+
+class SQLTimer:
+    """Sums the time spent in DB-API execute calls of one engine."""
+
+    def __init__(self, engine: Any):
+        self._lock = threading.Lock()
+        self.seconds = 0.0
+        self.statements = 0
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.seconds, self.statements = 0.0, 0
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("bench_started")
+        if not started:
+            # The statement began before this timer was attached
+            return
+        elapsed = time.perf_counter() - started.pop()
+        with self._lock:
+            self.seconds += elapsed
+            self.statements += 1
+
+
+async def run_load(ask, questions: List[str], concurrency: int) -> Dict[str, Any]:
+    """
+    Sends every question through ``ask`` with at most ``concurrency`` in flight.
+
+    Returns:
+        Dict[str, Any]: Latency percentiles, throughput and error count.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(question: str):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await ask(question)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(question) for question in questions))
+    wall = time.perf_counter() - started
+    return {"requests": len(questions), "errors": errors, "seconds": wall,
+            "throughput": len(questions) / wall if wall else 0.0, **percentiles(latencies)}
+
+
+async def bench_fixture(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    path = ensure_fixture(name, os.path.join(BENCH_DIR, "fixtures"))
+    stats = LLMStats()
+    server = None
+    if args.llm == "server":
+        from .fakeopenai import ServerLimits, create_app, start_server
+        limits = ServerLimits(args.server_rpm, args.server_tpm) if args.server_rpm or args.server_tpm else None
+        base_url, server = start_server(create_app(scenario_map(), stats, latency=args.llm_latency / 1000,
+                                                   token_latency=args.token_latency / 1000, limits=limits))
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "bench")
+        # None builds the shared, rate-limited ChatOpenAI clients
+        factory = None
+    else:
+        factory = scripted_llm_factory(scenario_map(), stats, latency=args.llm_latency / 1000,
+                                       token_latency=args.token_latency / 1000)
+    profile = ConnectionProfile(db_type="sqlite", database=path, model="scripted")
+
+    # Cold start reflects the whole catalog; warm start loads the saved snapshot.
+    from sqlalchemy.engine import make_url
+    from src.engineoptions import sqlite_url
+    from src.schemasnapshot import SchemaSnapshotStore
+    # The same scope DatabaseTool.cache_scope renders, read-only URI filename included
+    scope = make_url(sqlite_url(path, profile.engine_options)).render_as_string(hide_password=True)
+    store = SchemaSnapshotStore.for_scope(scope)
+    if store is not None and os.path.exists(store.path):
+        os.remove(store.path)
+    started = time.perf_counter()
+    entry = build_entry(profile, llm_factory=factory)
+    cold_start = time.perf_counter() - started
+    entry.database_tools.refresh_thread.join()
+    entry.dispose()
+    started = time.perf_counter()
+    entry = build_entry(profile, llm_factory=factory)
+    warm_start = time.perf_counter() - started
+    entry.database_tools.refresh_thread.join()
+
+    sql_timer = SQLTimer(entry.database_tools.engine)
+    budget = RequestBudget()
+    questions = [SCENARIOS[i % len(SCENARIOS)].question for i in range(args.requests)]
+    report: Dict[str, Any] = {"fixture": name, "tables": len(entry.database_tools.db.get_usable_table_names()),
+                              "cold_start_seconds": cold_start, "warm_start_seconds": warm_start, "modes": {}}
+
+    if "graph" in args.modes:
+        timer = NodeTimer()
+
+        async def ask_graph(question: str) -> bool:
+            state = await arun_graph(entry.app, {"messages": [("user", question)]}, budget,
+                                     config={"callbacks": [timer]})
+            answer = extract_answer(state)
+            return answer is not None and not answer["partial"]
+
+        report["modes"]["graph"] = await bench_mode(ask_graph, questions, args, stats, sql_timer)
+        report["nodes"] = {node: {"calls": len(d), "mean": statistics.fmean(d), **percentiles(d)}
+                           for node, d in sorted(timer.durations.items())}
+
+    if "api" in args.modes:
+        import httpx
+        import main
+        from src.registry import registry
+
+        registry.clear()
+        registry.builder = lambda p: entry if p.key == profile.key else build_entry(p, llm_factory=factory)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def ask_api(question: str) -> bool:
+                response = await client.post("/query", json={"question": question, "db_type": "sqlite",
+                                                             "database": path, "model": "scripted"})
+                return response.status_code == 200 and not response.json().get("partial")
+
+            report["modes"]["api"] = await bench_mode(ask_api, questions, args, stats, sql_timer)
+        registry.clear()
+    else:
+        entry.dispose()
+    if server is not None:
+        server.should_exit = True
+    return report
+
+
+async def bench_mode(ask, questions: List[str], args: argparse.Namespace, stats: LLMStats,
+                     sql_timer: SQLTimer) -> Dict[str, Any]:
+    results = {}
+    for concurrency in args.concurrency:
+        stats.reset()
+        sql_timer.reset()
+        load = await run_load(ask, questions, concurrency)
+        load.update({
+            "llm_calls_per_request": sum(stats.calls.values()) / len(questions),
+            "llm_calls": dict(stats.calls),
+            "prompt_tokens_mean": statistics.fmean(stats.prompt_tokens) if stats.prompt_tokens else 0,
+            "prompt_tokens_max": max(stats.prompt_tokens, default=0),
+            "rate_limited_per_request": stats.rate_limited / len(questions),
+            "sql_seconds_per_request": sql_timer.seconds / len(questions),
+            "sql_statements_per_request": sql_timer.statements / len(questions),
+        })
+        results[str(concurrency)] = load
+    return results
+
+
+# (metric, True if higher is better)
+COMPARED_METRICS = [("p50", False), ("p95", False), ("p99", False), ("throughput", True),
+                    ("llm_calls_per_request", False), ("prompt_tokens_mean", False)]
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Lists metrics that got worse than the baseline by more than ``threshold``.
+    """
+    regressions = []
+    for name, fixture in report["fixtures"].items():
+        base_fixture = baseline.get("fixtures", {}).get(name)
+        if base_fixture is None:
+            continue
+        for mode, levels in fixture["modes"].items():
+            for concurrency, current in levels.items():
+                base = base_fixture.get("modes", {}).get(mode, {}).get(concurrency)
+                if base is None:
+                    continue
+                for metric, higher_is_better in COMPARED_METRICS:
+                    old, new = base.get(metric), current.get(metric)
+                    if not old or new is None:
+                        continue
+                    change = (new - old) / old
+                    if (-change if higher_is_better else change) > threshold:
+                        regressions.append(f"{name}/{mode}/c={concurrency} {metric}: "
+                                           f"{old:.4g} -> {new:.4g} ({change:+.0%})")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    for name, fixture in report["fixtures"].items():
+        print(f"\n== {name}: {fixture['tables']} tables, cold start {fixture['cold_start_seconds']:.2f}s, "
+              f"warm start {fixture['warm_start_seconds']:.2f}s")
+        for mode, levels in fixture["modes"].items():
+            print(f"  {mode:<5} {'conc':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                  f"{'llm/req':>7} {'prompt tok':>10} {'sql ms/req':>10} {'429/req':>7} {'errors':>6}")
+            for concurrency, r in levels.items():
+                print(f"  {'':<5} {concurrency:>4} {r['throughput']:>8.1f} {r['p50'] * 1000:>8.1f} "
+                      f"{r['p95'] * 1000:>8.1f} {r['p99'] * 1000:>8.1f} {r['llm_calls_per_request']:>7.2f} "
+                      f"{r['prompt_tokens_mean']:>10.0f} {r['sql_seconds_per_request'] * 1000:>10.2f} "
+                      f"{r.get('rate_limited_per_request', 0):>7.2f} {r['errors']:>6}")
+        for node, d in fixture.get("nodes", {}).items():
+            print(f"  node {node:<16} calls {d['calls']:>6}  mean {d['mean'] * 1000:>8.2f} ms  "
+                  f"p95 {d['p95'] * 1000:>8.2f} ms")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline SeaQuiller benchmark.")
+    parser.add_argument("--fixtures", default="small", help=f"Comma-separated subset of {', '.join(FIXTURES)}.")
+    parser.add_argument("--modes", default="graph,api", help="Comma-separated subset of graph, api.")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels.")
+    parser.add_argument("--requests", type=int, default=64, help="Questions sent per concurrency level.")
+    parser.add_argument("--llm-latency", type=float, default=50.0, help="Simulated LLM latency per call, ms.")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Simulated LLM latency per generated token, ms.")
+    parser.add_argument("--llm", choices=["scripted", "server"], default="scripted",
+                        help="Call the scripted model directly, or through ChatOpenAI and a local fake server.")
+    parser.add_argument("--server-rpm", type=int, default=0, help="Fake server requests per minute; 0 is unlimited.")
+    parser.add_argument("--server-tpm", type=int, default=0, help="Fake server tokens per minute; 0 is unlimited.")
+    parser.add_argument("--cache", action="store_true", help="Keep the answer and result caches enabled.")
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    parser.add_argument("--save-baseline", help="Write the report as a baseline to this file.")
+    parser.add_argument("--compare", help="Compare against this baseline; exits 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative change counted as a regression.")
+    args = parser.parse_args(argv)
+    args.fixtures = [f for f in args.fixtures.split(",") if f]
+    args.modes = [m for m in args.modes.split(",") if m]
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    return args
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = {"created_at": time.time(), "python": sys.version.split()[0],
+              "settings": {"requests": args.requests, "llm_latency_ms": args.llm_latency,
+                           "token_latency_ms": args.token_latency, "cache": args.cache,
+                           "llm": args.llm},
+              "fixtures": {}}
+    for name in args.fixtures:
+        report["fixtures"][name] = await bench_fixture(name, args)
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
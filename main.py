@@ -1,6 +1,23 @@
+import asyncio
 import json
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+
+from src.budget import RequestBudget
+from src.engineoptions import EngineOptions
+from src.settings import (BATCH_CONCURRENCY, BATCH_MAX_QUESTIONS, MAX_CONCURRENT_QUERIES,
+                          QUERY_QUEUE_TIMEOUT_SECONDS, RESULT_PAGE_MAX_SIZE, RESULT_PAGE_SIZE, THREADS_PATH)
+from src.warmup import Warmup, import_heavy_modules, load_profiles
+
+# LangChain, LangGraph and the database stack are imported on first use (or by the
+# warm-up thread), so the server binds its port before paying for them.
+
+logger = logging.getLogger(__name__)
 
 # Define a Pydantic model for input validation
 class QueryInput(BaseModel):
@@ -13,63 +30,328 @@ class QueryInput(BaseModel):
     password: str = None
     api_key: str = None
     port: str = None
+    budget: RequestBudget = Field(default_factory=RequestBudget)
+    engine_options: EngineOptions = Field(default_factory=EngineOptions)
+    thread_id: Optional[str] = Field(None, max_length=128,
+                                     description="Conversation thread; follow-up questions reuse its context.")
+
+    def to_profile(self):
+        from src.registry import ConnectionProfile
+        return ConnectionProfile(db_type=self.db_type,
+                                 database=self.database,
+                                 host=self.host,
+                                 port=self.port,
+                                 user=self.user,
+                                 model=self.model,
+                                 password=self.password,
+                                 api_key=self.api_key,
+                                 engine_options=self.engine_options)
+
+class BatchQueryInput(QueryInput):
+    questions: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUESTIONS)
+    concurrency: int = Field(min(BATCH_CONCURRENCY, MAX_CONCURRENT_QUERIES), ge=1, le=MAX_CONCURRENT_QUERIES)
+
+class FeedbackInput(QueryInput):
+    sql: str = Field(..., description="The SQL the answer to the question was based on.")
+    correct: bool = Field(True, description="False drops the question from the verified examples.")
+
+warmup = Warmup()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global warmup
+    warmup = Warmup(load_profiles()).start()
+    yield
+
 
 # Initialize FastAPI app
-app = FastAPI()
-
-# Load the initial config data
-def load_config():
-    with open('config.json', 'r') as f:
-        return json.load(f)
-
-# Update the config file
-def update_config(model: str, 
-                  db_type: str, 
-                  database: str,
-                  user: str,
-                  password: str,
-                  host: str,
-                  port: str,
-                  api_key: str):
-
-    with open('config.json', 'r+') as f:
-        data = json.load(f)
-        data['model'] = model
-        data['db_type'] = db_type
-        data['database'] = database
-        f.seek(0)
-        json.dump(data, f, indent=4)
-        f.truncate()
+app = FastAPI(lifespan=lifespan)
+
+# Caps how many questions this process works on at once
+query_slots = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+
+
+@asynccontextmanager
+async def query_slot():
+    try:
+        await asyncio.wait_for(query_slots.acquire(), timeout=QUERY_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server is busy, please retry later.")
+    try:
+        yield
+    finally:
+        query_slots.release()
+
+
+async def heavy_imports() -> None:
+    # Off the event loop: if the warm-up thread is mid-import this waits for it without
+    # stalling /healthz and /readyz.
+    await asyncio.to_thread(import_heavy_modules)
+
+
+async def get_entry(input: QueryInput):
+    # Look up (or build) the warm engine and compiled graph for this connection, held
+    # for the request: the caller must call entry.release() when done with it
+    def lookup():
+        from src.registry import registry
+        return registry.acquire(input.to_profile())
+
+    try:
+        return await asyncio.to_thread(lookup)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def graph_for(input: QueryInput, entry) -> tuple:
+    """
+    Picks the compiled graph and its config for a request.
+
+    Returns:
+        tuple: (app, config); the config selects the conversation thread if one was given.
+    """
+    if not input.thread_id:
+        return entry.app, {}
+    if entry.thread_app is None:
+        raise HTTPException(status_code=400, detail="Conversation threads are disabled on this server.")
+    from src.threads import thread_config
+    return entry.thread_app, thread_config(entry.profile.key, input.thread_id)
 
 
 @app.post("/query")
 async def query(input: QueryInput):
-    # Extract model, db_type, and database from user input
-    model = input.model
-    db_type = input.db_type
-    database = input.database
-    user = input.user
-    password = input.password
-    host = input.host
-    port = input.port
-    api_key = input.api_key
-
-    # Update the config with user-provided values
-    update_config(model, db_type, database, user, password, host, port, api_key)
-
-    # Load the app from your existing graph module
-    from src.graph import get_app
-    app_instance = get_app()
-
-    # Invoke the app with the user's question
-    messages = app_instance.invoke({"messages": [("user", input.question)]})
-
-    # Extract the final answer
+    await heavy_imports()
+    from src.cache import answer_cache
+    from src.graph import arun_graph, extract_answer
+    from src.metrics import RequestMetrics, answer_outcome
+
+    metrics = RequestMetrics("query", input.question, input.db_type)
+    entry = None
+    try:
+        entry = await get_entry(input)
+        graph, config = graph_for(input, entry)
+
+        async def run_graph():
+            async with query_slot():
+                # Invoke the app with the user's question, within the request budget
+                messages = await arun_graph(graph, {"messages": [("user", input.question)]}, input.budget,
+                                            config={**config, "callbacks": [metrics]})
+            return extract_answer(messages)
+
+        if input.thread_id:
+            # A follow-up's answer depends on the thread, so it bypasses the answer cache
+            result = await run_graph()
+        else:
+            # Identical questions are answered from the cache, and concurrent ones share one run
+            result = await answer_cache.get_or_compute(input.question, entry.profile.key,
+                                                       entry.database_tools.schema_fingerprint, run_graph)
+        if result is None:
+            raise HTTPException(status_code=500, detail="Failed to retrieve answer.")
+    except BaseException:
+        metrics.finish("error")
+        raise
+    finally:
+        if entry is not None:
+            entry.release()
+    metrics.finish(answer_outcome(result), result.get("sql"))
+    return {**with_result_id(result, entry), "thread_id": input.thread_id}
+
+
+def with_result_id(result: dict, entry) -> dict:
+    from src.results import result_store
+    # The full rows behind the answer can be downloaded from /results/{result_id}
+    result_id = result_store.register(entry.database_tools, result["sql"]) if result.get("sql") else None
+    return {**result, "result_id": result_id}
+
+
+@app.post("/query/stream")
+async def query_stream(input: QueryInput):
+    """
+    Answers a question like /query but streams progress as server-sent events.
+    """
+    async def event_source():
+        await heavy_imports()
+        from src.cache import answer_cache
+        from src.graph import aturn_inputs
+        from src.metrics import RequestMetrics, answer_outcome
+        from src.streaming import format_sse, stream_events
+
+        metrics = RequestMetrics("stream", input.question, input.db_type)
+        entry = None
+        try:
+            entry = await get_entry(input)
+            graph, config = graph_for(input, entry)
+            fingerprint = entry.database_tools.schema_fingerprint
+            cached = None if input.thread_id else answer_cache.get(input.question, entry.profile.key, fingerprint)
+            if cached is not None:
+                metrics.finish("cached", cached.get("sql"))
+                yield format_sse("answer", with_result_id({**cached, "cached": True}, entry))
+                yield format_sse("done", {})
+                return
+
+            result = {"response": None, "sql": None, "partial": False}
+            inputs = await aturn_inputs(graph, {"messages": [("user", input.question)]}, input.budget, config)
+            config = {**config, "recursion_limit": input.budget.recursion_limit(), "callbacks": [metrics]}
+            async with query_slot():
+                async for event, data in stream_events(graph, inputs, config):
+                    if event == "sql" and data["node"] != "query_gen":
+                        result["sql"] = data["query"]
+                    elif event == "answer":
+                        result["response"] = data["response"]
+                        result["partial"] = data["partial"]
+                        data = {**with_result_id({**data, "sql": result["sql"]}, entry), "thread_id": input.thread_id}
+                    yield format_sse(event, data)
+            if result["response"] is not None and not result["partial"] and not input.thread_id:
+                answer_cache.set(input.question, entry.profile.key, fingerprint, result)
+            metrics.finish(answer_outcome(result) if result["response"] is not None else "error", result["sql"])
+        except HTTPException as e:
+            metrics.finish("error")
+            yield format_sse("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            metrics.finish("error")
+            logger.exception("Streaming query failed")
+            yield format_sse("error", {"status_code": 500, "detail": str(e)})
+        finally:
+            if entry is not None:
+                entry.release()
+
+    return StreamingResponse(event_source(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/query/batch")
+async def query_batch(input: BatchQueryInput):
+    """
+    Answers many questions against one database and streams one JSON line per question
+    as it finishes, followed by a summary line.
+    """
+    await heavy_imports()
+    from src.batch import run_batch
+
+    # Connect now so a bad profile is a 400, but hold the entry only while the body
+    # streams: a generator that never starts (client gone first) never releases it
+    (await get_entry(input)).release()
+
+    async def lines():
+        entry = await get_entry(input)
+        try:
+            async for result in run_batch(entry, input.questions, input.budget, input.concurrency, query_slot):
+                if "response" in result:
+                    result = with_result_id(result, entry)
+                yield json.dumps(result, default=str) + "\n"
+        finally:
+            entry.release()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/feedback")
+async def feedback(input: FeedbackInput):
+    """
+    Confirms (or rejects) the SQL behind an answer. Confirmed question/SQL pairs become
+    few-shot examples and templates for later questions against the same database.
+
+    The SQL is run before it is stored and must return rows.
+    """
+    await heavy_imports()
+
+    entry = await get_entry(input)
+    try:
+        examples = entry.nodes.examples
+        if examples is None:
+            raise HTTPException(status_code=400, detail="Verified examples are disabled on this server.")
+        if not input.correct:
+            await asyncio.to_thread(examples.remove, input.question)
+            return {"stored": False}
+        result = await entry.database_tools.aquery(input.sql)
+        if not result.ok:
+            raise HTTPException(status_code=400, detail=result.error)
+        if not result.row_count:
+            raise HTTPException(status_code=400, detail="The query returned no rows.")
+        await asyncio.to_thread(examples.add, input.question, input.sql)
+        return {"stored": True}
+    finally:
+        entry.release()
+
+
+@app.get("/results/{result_id}")
+async def get_result(result_id: str, format: str = Query("csv", pattern="^(csv|arrow)$"),
+                     offset: int = Query(0, ge=0),
+                     limit: int = Query(RESULT_PAGE_SIZE, ge=1, le=RESULT_PAGE_MAX_SIZE)):
+    """
+    Streams one page of the full result of an executed query as CSV or Arrow IPC.
+
+    The query is re-run on a streaming cursor, so the rows reflect the current data. It
+    goes through the same cost guard as /query and must finish within the default
+    request timeout.
+    """
+    await heavy_imports()
+    from src.budget import RequestBudget
+    from src.costguard import LIMIT, REJECT
+    from src.results import iter_arrow, iter_csv, result_store
+
+    stored = result_store.get(result_id)
+    database_tools = stored.database_tools if stored is not None else None
+    if database_tools is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result id.")
+
+    decision = await asyncio.to_thread(database_tools.guard, stored.sql)
+    if decision.action == REJECT:
+        raise HTTPException(status_code=400, detail=decision.message)
+    headers = {"X-Result-Offset": str(offset)}
+    if decision.action == LIMIT:
+        # The cost guard capped the rows: pages past the cap would look like the end of the data
+        if offset >= decision.limit:
+            raise HTTPException(status_code=400, detail=f"The cost guard caps this result at {decision.limit} rows; "
+                                                        f"offset must be below that.")
+        limit = min(limit, decision.limit - offset)
+        headers.update({"X-Result-Guard": "limit", "X-Result-Guard-Rows": str(decision.limit)})
+    headers["X-Result-Limit"] = str(limit)
+    batches = database_tools.iter_result(decision.sql, offset=offset, limit=limit,
+                                         timeout=RequestBudget().timeout_seconds)
     try:
-        json_str = messages["messages"][-1].tool_calls[0]["args"]["final_answer"]
-        return {"response": json_str}
-    except (IndexError, KeyError):
-        raise HTTPException(status_code=500, detail="Failed to retrieve answer.")
+        # Run the query up front so SQL errors become a proper status code
+        columns = await asyncio.to_thread(next, batches)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            batches.close()
+            raise HTTPException(status_code=406, detail="Arrow export requires pyarrow.")
+        return StreamingResponse(iter_arrow(columns, batches), media_type="application/vnd.apache.arrow.stream",
+                                 headers=headers)
+    headers["Content-Disposition"] = f'attachment; filename="{result_id}.csv"'
+    return StreamingResponse(iter_csv(columns, batches), media_type="text/csv", headers=headers)
+
+
+@app.get("/metrics")
+async def metrics():
+    await heavy_imports()
+    from src.metrics import render_metrics
+
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness only: answers as soon as the port is bound, warm or not. Clients read
+    # "threads" to decide whether to send a thread_id.
+    return {"status": "ok", "threads": bool(THREADS_PATH)}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Reports warm-up progress; 503 until the heavy imports and configured profiles are warm.
+    """
+    status = warmup.status()
+    if not status["ready"]:
+        return JSONResponse(status, status_code=503)
+    return status
 
 
 @app.get("/")
@@ -82,26 +364,10 @@ if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000, reload=True)
 
 
-# import json
-
-# model = "gpt-3.5-turbo"
-# db_type = "sqlite"
-# database = "./Chinook.db"
-
-# with open('config.json', 'r+') as f:
-#         data = json.load(f)
-
-#         data['model'] = model
-#         data['db_type'] = db_type
-#         data['database'] = database
-
-#         f.seek(0)  
-#         json.dump(data, f)
-#         f.truncate()
-
-# from graph import get_app
+# from src.graph import get_app
+# from src.registry import ConnectionProfile
 
-# app = get_app()
+# app = get_app(ConnectionProfile(model="gpt-3.5-turbo", db_type="sqlite", database="./Chinook.db"))
 
 # messages = app.invoke(
 #     {"messages": [("user", "Who composed the track 'Go Down'?")]}
@@ -1 +1,10 @@
-from . import nodes, graph, prompts, databasetools
+import importlib
+
+# Submodules load on first use, so importing the package stays cheap for a fast server start.
+__all__ = ["nodes", "graph", "prompts", "databasetools"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from .budget import RequestBudget
+from .cache import answer_cache, normalize_question
+from .graph import arun_graph, extract_answer
+from .llmpool import BATCH, llm_priority
+from .metrics import RequestMetrics, answer_outcome
+
+logger = logging.getLogger(__name__)
+
+
+async def run_batch(entry: Any, questions: List[str], budget: RequestBudget, concurrency: int,
+                    slot: Callable[[], Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Answers many questions against one connection and yields results as they finish.
+
+    The schema context is computed once and handed to every graph run, identical
+    questions (after normalization) run once, and at most ``concurrency`` graph runs
+    are in flight. Each answer goes through the answer cache like a single /query.
+
+    Args:
+        entry (RegistryEntry): The warm connection to use.
+        questions (List[str]): The questions, in request order.
+        budget (RequestBudget): Budget applied to each question.
+        concurrency (int): Maximum questions answered at once.
+        slot: Async context manager factory that reserves a process-wide query slot.
+
+    Yields:
+        Dict[str, Any]: One result per question with its "index", "seconds" and either
+        the answer fields or an "error", then a final summary with "done": True.
+    """
+    started = time.perf_counter()
+    groups: Dict[str, List[int]] = {}
+    for index, question in enumerate(questions):
+        groups.setdefault(normalize_question(question), []).append(index)
+
+    database_tools = entry.database_tools
+    shared_schema = await database_tools._run_in_executor(entry.nodes.shared_schema_context)
+    fingerprint = database_tools.schema_fingerprint
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(indices: List[int]):
+        question = questions[indices[0]]
+        metrics = RequestMetrics("batch", question, entry.profile.db_type)
+
+        async def compute():
+            # Interactive requests go first when the LLM rate limits are tight
+            with llm_priority(BATCH):
+                async with slot():
+                    state = await arun_graph(entry.app, {"messages": [("user", question)],
+                                                         "shared_schema": shared_schema}, budget,
+                                             config={"callbacks": [metrics]})
+            return extract_answer(state)
+
+        async with semaphore:
+            metrics.started = question_started = time.perf_counter()
+            try:
+                result = await answer_cache.get_or_compute(question, entry.profile.key, fingerprint, compute)
+                if result is None:
+                    result = {"error": {"status_code": 500, "detail": "Failed to retrieve answer."}}
+            except Exception as e:
+                if not hasattr(e, "status_code"):
+                    logger.exception("Batch question failed")
+                result = {"error": {"status_code": getattr(e, "status_code", 500),
+                                    "detail": getattr(e, "detail", str(e))}}
+            metrics.finish("error" if "error" in result else answer_outcome(result), result.get("sql"))
+            return indices, result, time.perf_counter() - question_started
+
+    tasks = [asyncio.ensure_future(answer(indices)) for indices in groups.values()]
+    errors = 0
+    try:
+        for future in asyncio.as_completed(tasks):
+            indices, result, seconds = await future
+            for position, index in enumerate(indices):
+                errors += "error" in result
+                yield {"index": index, "question": questions[index], **result,
+                       "seconds": round(seconds, 3), "deduplicated": position > 0}
+    finally:
+        # The client went away or a result could not be sent: stop the remaining runs
+        for task in tasks:
+            task.cancel()
+
+    yield {"done": True, "questions": len(questions), "unique": len(groups), "errors": errors,
+           "seconds": round(time.perf_counter() - started, 3)}
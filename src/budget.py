@@ -0,0 +1,116 @@
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
+
+from .settings import (BUDGET_MAX_ITERATIONS, BUDGET_MAX_ITERATIONS_LIMIT, BUDGET_MAX_SQL_SECONDS,
+                       BUDGET_MAX_SQL_SECONDS_LIMIT, BUDGET_MAX_TOKENS, BUDGET_MAX_TOKENS_LIMIT,
+                       BUDGET_TIMEOUT_SECONDS, BUDGET_TIMEOUT_SECONDS_LIMIT)
+
+
+# State counters the budget is spent against; they accumulate over the turns of a thread.
+SPENT_KEYS = ("iterations", "tokens_used", "sql_seconds")
+
+# Highest value a request may set for each limit; 0 also allows unlimited.
+BUDGET_LIMITS = {
+    "max_iterations": BUDGET_MAX_ITERATIONS_LIMIT,
+    "timeout_seconds": BUDGET_TIMEOUT_SECONDS_LIMIT,
+    "max_tokens": BUDGET_MAX_TOKENS_LIMIT,
+    "max_sql_seconds": BUDGET_MAX_SQL_SECONDS_LIMIT,
+}
+
+
+class RequestBudget(BaseModel):
+    """
+    Limits for answering one question. Zero or None means unlimited.
+
+    Requests may only tighten the server's limits: a value above BUDGET_LIMITS, or an
+    unlimited one where the server has a limit, is rejected.
+    """
+    max_iterations: Optional[int] = Field(BUDGET_MAX_ITERATIONS, description="Maximum query_gen rounds.")
+    timeout_seconds: Optional[float] = Field(BUDGET_TIMEOUT_SECONDS, description="Wall-clock limit for the request.")
+    max_tokens: Optional[int] = Field(BUDGET_MAX_TOKENS, description="Maximum LLM tokens, prompt and completion.")
+    max_sql_seconds: Optional[float] = Field(BUDGET_MAX_SQL_SECONDS, description="Maximum total SQL execution time.")
+
+    @field_validator("max_iterations", "timeout_seconds", "max_tokens", "max_sql_seconds")
+    @classmethod
+    def _within_server_limits(cls, value: Optional[float], info: ValidationInfo) -> Optional[float]:
+        if value is not None and value < 0:
+            raise ValueError(f"{info.field_name} must not be negative")
+        limit = BUDGET_LIMITS[info.field_name]
+        if limit and not (value and value <= limit):
+            raise ValueError(f"{info.field_name} must be over 0 and at most {limit:g} on this server")
+        return value
+
+    def to_state(self, spent_before: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Converts the budget into the serializable form kept in the graph State.
+
+        Args:
+            spent_before (Mapping[str, Any], optional): State of a conversation thread before
+                this turn, so only what this turn spends counts against the budget.
+
+        Returns:
+            Dict[str, Any]: Limits with the timeout turned into an absolute deadline.
+        """
+        spent_before = spent_before or {}
+        return {
+            "max_iterations": self.max_iterations or None,
+            "deadline": time.time() + self.timeout_seconds if self.timeout_seconds else None,
+            "max_tokens": self.max_tokens or None,
+            "max_sql_seconds": self.max_sql_seconds or None,
+            "spent_before": {key: spent_before.get(key) or 0 for key in SPENT_KEYS},
+        }
+
+    def recursion_limit(self) -> int:
+        # Each round is at most query_gen -> correct_query -> execute_query, plus schema steps.
+        return 4 * (self.max_iterations or BUDGET_MAX_ITERATIONS or 25) + 10
+
+
+def spent(state: Mapping[str, Any], key: str) -> float:
+    """What this request has spent of one SPENT_KEYS counter."""
+    budget = state.get("budget") or {}
+    return state.get(key, 0) - (budget.get("spent_before") or {}).get(key, 0)
+
+
+def budget_exhausted(state: Mapping[str, Any]) -> Optional[str]:
+    """
+    Reports which limit, if any, the request has run out of.
+
+    Args:
+        state (Mapping[str, Any]): The graph State.
+
+    Returns:
+        Optional[str]: A short reason, or None while there is budget left.
+    """
+    budget = state.get("budget") or {}
+    if budget.get("max_iterations") and spent(state, "iterations") >= budget["max_iterations"]:
+        return f"reached the limit of {budget['max_iterations']} query attempts"
+    if budget.get("deadline") and time.time() >= budget["deadline"]:
+        return "ran out of time"
+    if budget.get("max_tokens") and spent(state, "tokens_used") >= budget["max_tokens"]:
+        return f"used the {budget['max_tokens']} token budget"
+    if budget.get("max_sql_seconds") and spent(state, "sql_seconds") >= budget["max_sql_seconds"]:
+        return f"used the {budget['max_sql_seconds']}s SQL time budget"
+    return None
+
+
+def remaining_seconds(state: Mapping[str, Any]) -> Optional[float]:
+    budget = state.get("budget") or {}
+    if not budget.get("deadline"):
+        return None
+    return max(budget["deadline"] - time.time(), 0.0)
+
+
+def sql_timeout(state: Mapping[str, Any]) -> Optional[float]:
+    """
+    Seconds the next SQL statement may run: the smaller of the SQL budget left and the time left.
+    """
+    budget = state.get("budget") or {}
+    limits = []
+    if budget.get("max_sql_seconds"):
+        limits.append(max(budget["max_sql_seconds"] - spent(state, "sql_seconds"), 0.0))
+    remaining = remaining_seconds(state)
+    if remaining is not None:
+        limits.append(remaining)
+    return min(limits) if limits else None
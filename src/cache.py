@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .settings import (ANSWER_CACHE_BACKEND, ANSWER_CACHE_MAX_ENTRIES,
+                       ANSWER_CACHE_PATH, ANSWER_CACHE_TTL_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question so trivially different phrasings share a cache entry.
+
+    Whitespace is collapsed, trailing punctuation dropped and text case-folded,
+    except inside quoted literals where case can change the SQL result.
+
+    Args:
+        question (str): The raw user question.
+
+    Returns:
+        str: The normalized question.
+    """
+    text = unicodedata.normalize("NFKC", question or "").strip()
+    parts = _QUOTED.split(text)
+    text = "".join(part if i % 2 else part.casefold() for i, part in enumerate(parts))
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip(" ?.!;")
+
+
+def schema_fingerprint(full_schema: Any) -> str:
+    """
+    Hashes a schema context so cached answers can be tied to the schema they were built on.
+
+    Args:
+        full_schema (Any): The value of DatabaseTool.full_schema.
+
+    Returns:
+        str: A hex digest of the schema.
+    """
+    payload = json.dumps(full_schema, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def make_cache_key(question: str, scope: str, fingerprint: str) -> str:
+    payload = json.dumps([normalize_question(question), scope, fingerprint])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CacheBackend:
+    """Storage interface for answer cache entries."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any], scope: str, fingerprint: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    def purge_stale(self, scope: str, fingerprint: str) -> int:
+        """Removes every entry of a scope that was built against a different schema fingerprint."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, _, _, expires_at = item
+            if expires_at and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], scope: str, fingerprint: str, ttl: float) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, scope, fingerprint, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def purge_stale(self, scope: str, fingerprint: str) -> int:
+        with self._lock:
+            stale = [key for key, (_, s, f, _) in self._entries.items() if s == scope and f != fingerprint]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(CacheBackend):
+    """Cache persisted in a local SQLite file so it survives restarts and is shared by workers."""
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answer_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, scope TEXT NOT NULL,"
+            " fingerprint TEXT NOT NULL, expires_at REAL, used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answer_cache_scope ON answer_cache (scope)")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM answer_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < now:
+                self._conn.execute("DELETE FROM answer_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE answer_cache SET used_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any], scope: str, fingerprint: str, ttl: float) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answer_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(value, default=str), scope, fingerprint, expires_at, now),
+            )
+            self._conn.execute(
+                "DELETE FROM answer_cache WHERE key IN ("
+                " SELECT key FROM answer_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def purge_stale(self, scope: str, fingerprint: str) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM answer_cache WHERE scope = ? AND fingerprint != ?", (scope, fingerprint)
+            )
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answer_cache")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key so only one of them does the work.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        while key in self._inflight:
+            future = self._inflight[key]
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader was cancelled, not us: take over the work.
+                if future.cancelled():
+                    continue
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting on it.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+
+class AnswerCache:
+    def __init__(self, backend: Optional[CacheBackend], ttl: float = ANSWER_CACHE_TTL_SECONDS):
+        """
+        Caches final answers and SQL per (question, connection profile, schema fingerprint).
+
+        Args:
+            backend (CacheBackend, optional): Where entries are stored; None disables caching
+                but keeps single-flight coalescing.
+            ttl (float): Seconds an entry stays valid; 0 keeps entries until evicted.
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.single_flight = SingleFlight()
+        self._fingerprints: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope_for(profile_key: tuple) -> str:
+        return hashlib.sha256(json.dumps(list(profile_key)).encode()).hexdigest()
+
+    def _check_fingerprint(self, scope: str, fingerprint: str) -> None:
+        if self._fingerprints.get(scope) != fingerprint:
+            if scope in self._fingerprints and self.backend is not None:
+                purged = self.backend.purge_stale(scope, fingerprint)
+                logger.info(f"Schema changed, purged {purged} cached answers")
+            self._fingerprints[scope] = fingerprint
+
+    def get(self, question: str, profile_key: tuple, fingerprint: str) -> Optional[Dict[str, Any]]:
+        if self.backend is None:
+            return None
+        scope = self.scope_for(profile_key)
+        self._check_fingerprint(scope, fingerprint)
+        value = self.backend.get(make_cache_key(question, scope, fingerprint))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, question: str, profile_key: tuple, fingerprint: str, value: Dict[str, Any]) -> None:
+        if self.backend is None:
+            return
+        scope = self.scope_for(profile_key)
+        self.backend.set(make_cache_key(question, scope, fingerprint), value, scope, fingerprint, self.ttl)
+
+    async def get_or_compute(self, question: str, profile_key: tuple, fingerprint: str,
+                             compute: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Dict[str, Any]:
+        """
+        Returns the cached answer or runs compute once for all identical in-flight questions.
+
+        Args:
+            question (str): The user question.
+            profile_key (tuple): ConnectionProfile.key of the target database.
+            fingerprint (str): Schema fingerprint of the target database.
+            compute: Coroutine factory producing {"response": ..., "sql": ...}; a None
+                result is returned as-is and not cached, and neither is a partial one.
+
+        Returns:
+            Dict[str, Any]: The answer, with "cached" set to whether it came from the cache.
+        """
+        cached = self.get(question, profile_key, fingerprint)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        scope = self.scope_for(profile_key)
+        key = make_cache_key(question, scope, fingerprint)
+
+        async def run():
+            result = await compute()
+            if result is not None and not result.get("partial"):
+                self.set(question, profile_key, fingerprint, result)
+            return result
+
+        result = await self.single_flight.do(key, run)
+        return result if result is None else {**result, "cached": False}
+
+
+def build_answer_cache() -> AnswerCache:
+    if ANSWER_CACHE_BACKEND == "sqlite":
+        backend = SQLiteCache(ANSWER_CACHE_PATH)
+    elif ANSWER_CACHE_BACKEND == "memory":
+        backend = MemoryCache()
+    elif ANSWER_CACHE_BACKEND in ("none", ""):
+        backend = None
+    else:
+        raise ValueError(f"Unsupported answer cache backend: {ANSWER_CACHE_BACKEND}")
+    return AnswerCache(backend)
+
+
+answer_cache = build_answer_cache()
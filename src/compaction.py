@@ -0,0 +1,165 @@
+"""
+History compaction for the query_gen loop.
+
+Every retry used to resend every earlier candidate query, error and result, so each
+prompt was larger than the last. The compact node runs before query_gen retries and
+rewrites the current turn in place: failed attempts older than the latest one collapse
+into a single summary message, and oversized tool results are truncated. The schema
+context is left untouched.
+"""
+import warnings
+from typing import Any, Dict, List, Optional
+
+from langchain_core._api.beta_decorator import LangChainBetaWarning
+from langchain_core.messages import AIMessage, RemoveMessage, ToolMessage
+from langgraph.graph.message import AnyMessage
+
+from .nodes import SCHEMA_TOOLS, State, turn_start
+from .settings import TOOL_RESULT_MAX_TOKENS
+
+# Name of the message that summarizes collapsed attempts; it is extended on later retries.
+SUMMARY_NAME = "failed_attempts"
+
+SUMMARY_HEADER = "Earlier attempts that failed (do not repeat them):"
+
+# Collapsed attempts listed in the summary, newest kept; older ones are dropped
+SUMMARY_MAX_ATTEMPTS = 3
+# Characters of a collapsed attempt's SQL and error kept in the summary
+SUMMARY_SQL_CHARS = 200
+SUMMARY_ERROR_CHARS = 150
+
+TRUNCATED = "\n... (truncated)"
+
+# Tools whose calls and results at the start of a turn form the schema context
+CONTEXT_TOOLS = SCHEMA_TOOLS + ("get_table_schema",)
+
+# RemoveMessage is what add_messages uses to delete history; it works, it is just marked beta.
+warnings.filterwarnings("ignore", message=".*RemoveMessage.*", category=LangChainBetaWarning)
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for SQL and tabular text."""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if not max_tokens or approx_tokens(text) <= max_tokens:
+        return text
+    return text[:max(max_tokens * 4 - len(TRUNCATED), 0)] + TRUNCATED
+
+
+def _one_line(text: str, limit: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _is_error(message: AnyMessage) -> bool:
+    return str(message.content).startswith("Error:")
+
+
+def _queries(message: AnyMessage) -> List[str]:
+    return [next(iter(tc["args"].values()), "") for tc in getattr(message, "tool_calls", None) or []
+            if tc["name"] == "query_db"]
+
+
+def _is_context(message: AnyMessage) -> bool:
+    if isinstance(message, ToolMessage):
+        return message.name in CONTEXT_TOOLS
+    tool_calls = getattr(message, "tool_calls", None)
+    return bool(tool_calls) and all(tc["name"] in CONTEXT_TOOLS for tc in tool_calls)
+
+
+def _searches(message: AnyMessage) -> bool:
+    return any(tc["name"] == "search_schema" for tc in getattr(message, "tool_calls", None) or [])
+
+
+def _attempts(turn: List[AnyMessage]) -> List[List[AnyMessage]]:
+    """
+    Splits the query loop of a turn into attempts: a query_gen message followed by the
+    check, execution and error messages it led to.
+
+    Only the schema block right after the question is context. A search_schema call
+    made later, and its result, belong to the attempt of the query_gen message that made it.
+    """
+    context_end = 1
+    while context_end < len(turn) and _is_context(turn[context_end]):
+        context_end += 1
+    attempts = []
+    for message in turn[context_end:]:
+        # query_gen answers with SQL text or a tool call; only the checker calls query_db
+        if not attempts or (isinstance(message, AIMessage) and not _queries(message)):
+            attempts.append([])
+        attempts[-1].append(message)
+    return attempts
+
+
+def _failed(attempt: List[AnyMessage]) -> bool:
+    # A schema search has no SQL to summarize; it is kept as it is
+    if attempt[0].name == SUMMARY_NAME or _searches(attempt[0]):
+        return False
+    succeeded = any(isinstance(m, ToolMessage) and m.name == "query_db" and not _is_error(m) for m in attempt)
+    return not succeeded and any(_is_error(m) for m in attempt)
+
+
+def _summary_line(attempt: List[AnyMessage]) -> str:
+    sql = next((query for m in attempt for query in _queries(m)), None) or str(attempt[0].content)
+    error = next((str(m.content) for m in reversed(attempt) if _is_error(m)), "")
+    error = error[len("Error:"):].strip()
+    return f"- {_one_line(sql, SUMMARY_SQL_CHARS)}\n  Error: {_one_line(error, SUMMARY_ERROR_CHARS)}"
+
+
+def _summary_entries(summary: Optional[AIMessage]) -> List[str]:
+    if summary is None:
+        return []
+    body = str(summary.content)[len(SUMMARY_HEADER):]
+    return ["- " + entry.lstrip("- ") for entry in body.split("\n- ") if entry.strip()]
+
+
+def compact_messages(messages: List[AnyMessage],
+                     max_tool_tokens: int = TOOL_RESULT_MAX_TOKENS) -> List[AnyMessage]:
+    """
+    Computes the message updates that compact the current turn.
+
+    Failed attempts except the latest are replaced by one summary message, which takes
+    the place of the first of them and lists the SUMMARY_MAX_ATTEMPTS most recent. The latest attempt
+    stays verbatim so the model sees the exact error it has to fix. Tool results over
+    ``max_tool_tokens`` are truncated.
+
+    Args:
+        messages (List[AnyMessage]): The whole message history.
+        max_tool_tokens (int): Approximate token cap per tool result; 0 disables it.
+
+    Returns:
+        List[AnyMessage]: Replacement messages (same id) and RemoveMessage markers for
+        the ``add_messages`` reducer; empty when there is nothing to compact.
+    """
+    turn = messages[turn_start(messages):]
+    attempts = _attempts(turn)
+    updates: List[AnyMessage] = []
+
+    summary: Optional[AIMessage] = next((a[0] for a in attempts if a[0].name == SUMMARY_NAME), None)
+    collapse = [attempt for attempt in attempts[:-1] if _failed(attempt)]
+    if collapse:
+        entries = _summary_entries(summary) + [_summary_line(attempt) for attempt in collapse]
+        removed = [m for attempt in collapse for m in attempt]
+        # The summary takes the id, and so the position, of the first collapsed message
+        summary_id = summary.id if summary is not None else removed.pop(0).id
+        content = "\n".join([SUMMARY_HEADER] + entries[-SUMMARY_MAX_ATTEMPTS:])
+        updates.append(AIMessage(content=content, name=SUMMARY_NAME, id=summary_id))
+        updates.extend(RemoveMessage(id=m.id) for m in removed)
+
+    collapsed = {m.id for attempt in collapse for m in attempt}
+    for attempt in attempts:
+        for message in attempt:
+            if isinstance(message, ToolMessage) and message.id not in collapsed:
+                content = truncate_to_tokens(str(message.content), max_tool_tokens)
+                if content != message.content:
+                    updates.append(message.copy(update={"content": content}))
+    return updates
+
+
+def compact_node(state: State) -> Dict[str, Any]:
+    """
+    Graph node run before each query_gen retry; keeps the prompt size flat as attempts pile up.
+    """
+    return {"messages": compact_messages(state["messages"])}
@@ -0,0 +1,297 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+
+from .settings import SQL_GUARD_LIMIT, SQL_GUARD_MAX_COST, SQL_GUARD_MAX_ROWS, SQL_GUARD_MODE
+from .validator import SQLGLOT_DIALECTS, extract_sql
+
+logger = logging.getLogger(__name__)
+
+ALLOW = "allow"
+LIMIT = "limit"
+REJECT = "reject"
+
+# Seconds a SQLite table size estimate is reused
+TABLE_ROWS_TTL_SECONDS = 60.0
+
+
+class PlanEstimate:
+    def __init__(self, rows: Optional[float] = None, cost: Optional[float] = None,
+                 full_scans: Optional[List[str]] = None):
+        """
+        What the database expects a query to cost, read from its EXPLAIN plan.
+
+        Args:
+            rows (float, optional): Largest number of rows any plan step is expected to produce.
+            cost (float, optional): Planner cost of the whole query (PostgreSQL and MySQL units).
+            full_scans (List[str], optional): Tables read without an index.
+        """
+        self.rows = rows
+        self.cost = cost
+        self.full_scans = full_scans or []
+
+    def __repr__(self) -> str:
+        return f"PlanEstimate(rows={self.rows!r}, cost={self.cost!r}, full_scans={self.full_scans!r})"
+
+
+class GuardDecision:
+    def __init__(self, action: str, sql: str, message: str = "", estimate: Optional[PlanEstimate] = None,
+                 limit: Optional[int] = None):
+        """
+        Outcome of the cost guard for one query.
+
+        Args:
+            action (str): ALLOW, LIMIT (run ``sql``, which had a LIMIT added) or REJECT.
+            sql (str): The query to run.
+            message (str): For the model: why the query was rejected or what was rewritten.
+            estimate (PlanEstimate, optional): The plan estimate the decision was based on.
+            limit (int, optional): For LIMIT, the number of rows ``sql`` is capped at.
+        """
+        self.action = action
+        self.sql = sql
+        self.message = message
+        self.estimate = estimate
+        self.limit = limit
+
+    def __repr__(self) -> str:
+        return f"GuardDecision({self.action!r}, {self.message!r})"
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _json_plan(rows: List[Any]) -> Any:
+    plan = rows[0][0] if rows and rows[0] else None
+    return json.loads(plan) if isinstance(plan, (str, bytes)) else plan
+
+
+def _walk(node: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def postgres_estimate(rows: List[Any]) -> PlanEstimate:
+    """Reads an ``EXPLAIN (FORMAT JSON)`` plan."""
+    plan = _json_plan(rows)
+    root = plan[0]["Plan"] if isinstance(plan, list) else plan["Plan"]
+    estimate = PlanEstimate(cost=_number(root.get("Total Cost")))
+    for node in _walk(root):
+        if "Plan Rows" in node:
+            estimate.rows = max(estimate.rows or 0, _number(node["Plan Rows"]) or 0)
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name"):
+            estimate.full_scans.append(node["Relation Name"])
+    return estimate
+
+
+def mysql_estimate(rows: List[Any]) -> PlanEstimate:
+    """Reads an ``EXPLAIN FORMAT=JSON`` plan."""
+    block = _json_plan(rows).get("query_block", {})
+    estimate = PlanEstimate(cost=_number(block.get("cost_info", {}).get("query_cost")))
+    for node in _walk(block):
+        table = node.get("table")
+        if not isinstance(table, dict):
+            continue
+        for key in ("rows_examined_per_scan", "rows_produced_per_join"):
+            if key in table:
+                estimate.rows = max(estimate.rows or 0, _number(table[key]) or 0)
+        if table.get("access_type") == "ALL" and table.get("table_name"):
+            estimate.full_scans.append(table["table_name"])
+    return estimate
+
+
+def sqlite_estimate(rows: List[Any], sources: Dict[str, str], table_rows) -> PlanEstimate:
+    """
+    Reads an ``EXPLAIN QUERY PLAN`` result, which has no row estimates of its own.
+
+    Every SCAN is costed at the size of its table and the scans of one loop nest are
+    multiplied, so a cross join of two large tables shows up as the product.
+
+    Args:
+        rows (List[Any]): The (id, parent, notused, detail) plan rows.
+        sources (Dict[str, str]): Table alias (lowercase) to table name, from the query.
+        table_rows: Returns the approximate row count of a table, or None if unknown.
+    """
+    children: Dict[int, List[Tuple[int, str]]] = {}
+    for row in rows:
+        children.setdefault(row[1], []).append((row[0], row[3]))
+    materialized: Dict[str, float] = {}
+    estimate = PlanEstimate()
+
+    def size(name: str) -> Optional[float]:
+        key = name.lower()
+        table = sources.get(key, name)
+        if table.lower() in materialized:
+            return materialized[table.lower()]
+        if key in materialized:
+            return materialized[key]
+        return table_rows(table)
+
+    def loop_rows(parent: int) -> float:
+        product = 1.0
+        for node_id, detail in children.get(parent, []):
+            words = detail.split()
+            if words[:1] in (["MATERIALIZE"], ["CO-ROUTINE"]) and len(words) > 1:
+                materialized[words[1].lower()] = loop_rows(node_id)
+                continue
+            if words[:1] == ["SCAN"] and len(words) > 1 and words[1] != "CONSTANT":
+                rows_in = size(words[1])
+                if rows_in is not None:
+                    product *= max(rows_in, 1)
+                    estimate.full_scans.append(sources.get(words[1].lower(), words[1]))
+            # Nested subqueries are their own loop nests
+            estimate.rows = max(estimate.rows or 0, loop_rows(node_id))
+        estimate.rows = max(estimate.rows or 0, product)
+        return product
+
+    loop_rows(0)
+    return estimate
+
+
+def _limit_stops_early(statement: exp.Expression) -> bool:
+    """
+    True when a LIMIT lets the database stop reading early: a plain SELECT without
+    sorting, grouping, DISTINCT, aggregates or window functions.
+    """
+    if not isinstance(statement, exp.Select):
+        return False
+    if any(statement.args.get(arg) for arg in ("order", "group", "distinct", "having")):
+        return False
+    for expression in statement.expressions:
+        if any(True for _ in expression.find_all(exp.AggFunc, exp.Window)):
+            return False
+    return True
+
+
+class CostGuard:
+    def __init__(self, database_tools: Any, mode: str = SQL_GUARD_MODE, max_rows: float = SQL_GUARD_MAX_ROWS,
+                 max_cost: float = SQL_GUARD_MAX_COST, limit: int = SQL_GUARD_LIMIT):
+        """
+        Stops generated SQL whose EXPLAIN plan is too expensive before it runs.
+
+        Args:
+            database_tools (DatabaseTool): The database the queries run on.
+            mode (str): "limit" adds a LIMIT where that makes the query cheap and rejects
+                otherwise, "reject" always rejects, "off" disables the guard.
+            max_rows (float): Largest acceptable row estimate of any plan step; 0 disables.
+            max_cost (float): Largest acceptable planner cost (PostgreSQL/MySQL); 0 disables.
+            limit (int): The LIMIT added in "limit" mode.
+        """
+        self.database_tools = database_tools
+        self.mode = mode
+        self.max_rows = max_rows
+        self.max_cost = max_cost
+        self.limit = limit
+        self.dialect = SQLGLOT_DIALECTS.get(database_tools.db_type)
+        self._table_rows: Dict[str, Tuple[float, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def check(self, sql: str) -> GuardDecision:
+        """
+        Decides whether a query may run as is, with a LIMIT added, or not at all.
+
+        Queries the guard cannot plan or parse are allowed; the statement timeout
+        still applies to them.
+
+        Args:
+            sql (str): The query about to run.
+
+        Returns:
+            GuardDecision: The decision, with the SQL to run.
+        """
+        if self.mode == "off" or not (self.max_rows or self.max_cost):
+            return GuardDecision(ALLOW, sql)
+        try:
+            statement = sqlglot.parse_one(extract_sql(sql), read=self.dialect)
+        except sqlglot.errors.SqlglotError:
+            statement = None
+        try:
+            estimate = self.estimate(sql, statement)
+        except Exception as e:
+            # The query itself is broken; executing it reports the error to the model.
+            logger.debug(f"Cost guard could not plan query: {e}")
+            return GuardDecision(ALLOW, sql)
+        if estimate is None:
+            return GuardDecision(ALLOW, sql)
+
+        over = self._over_limits(estimate)
+        if not over:
+            return GuardDecision(ALLOW, sql, estimate=estimate)
+        streams = statement is not None and _limit_stops_early(statement)
+        if streams and statement.args.get("limit"):
+            # The query's own LIMIT already stops it early
+            return GuardDecision(ALLOW, sql, estimate=estimate)
+        if self.mode == LIMIT and streams:
+            limited = statement.limit(self.limit).sql(dialect=self.dialect)
+            return GuardDecision(LIMIT, limited, estimate=estimate, limit=self.limit,
+                                 message=f"Note: the query was expected to be expensive ({over}), "
+                                         f"so only the first {self.limit} rows were read.")
+        scans = f"; full scans of {', '.join(dict.fromkeys(estimate.full_scans))}" if estimate.full_scans else ""
+        return GuardDecision(REJECT, sql, estimate=estimate,
+                             message=f"Query too expensive to run ({over}{scans}). Narrow it: filter with "
+                                     f"WHERE on indexed columns, join on keys instead of a cross join, aggregate, "
+                                     f"or add a LIMIT.")
+
+    def estimate(self, sql: str, statement: Optional[exp.Expression] = None) -> Optional[PlanEstimate]:
+        """
+        Returns:
+            Optional[PlanEstimate]: The plan estimate, or None if the dialect has no safe EXPLAIN.
+
+        Raises:
+            sqlalchemy.exc.DBAPIError: If the database rejects the query.
+        """
+        db_type = self.database_tools.db_type
+        plan = self.database_tools.explain(sql)
+        if plan is None:
+            return None
+        if db_type == "postgresql":
+            return postgres_estimate(plan)
+        if db_type == "mysql":
+            return mysql_estimate(plan)
+        if db_type == "sqlite":
+            sources = {}
+            if statement is not None:
+                sources = {table.alias_or_name.lower(): table.name for table in statement.find_all(exp.Table)}
+            return sqlite_estimate(plan, sources, self._sqlite_table_rows)
+        return None
+
+    def _over_limits(self, estimate: PlanEstimate) -> str:
+        if self.max_rows and estimate.rows is not None and estimate.rows > self.max_rows:
+            return f"estimated {estimate.rows:,.0f} rows, limit {self.max_rows:,.0f}"
+        if self.max_cost and estimate.cost is not None and estimate.cost > self.max_cost:
+            return f"estimated cost {estimate.cost:,.0f}, limit {self.max_cost:,.0f}"
+        return ""
+
+    def _sqlite_table_rows(self, table: str) -> Optional[float]:
+        # MAX(rowid) reads one b-tree leaf, unlike COUNT(*); deleted rows make it an upper bound.
+        key = table.lower()
+        now = time.monotonic()
+        with self._lock:
+            cached = self._table_rows.get(key)
+        if cached is not None and now - cached[0] < TABLE_ROWS_TTL_SECONDS:
+            return cached[1]
+        if key not in {name.lower() for name in self.database_tools.db.get_usable_table_names()}:
+            return None
+        quoted = '"' + table.replace('"', '""') + '"'
+        try:
+            with self.database_tools.engine.connect() as conn:
+                rows = float(conn.exec_driver_sql(f"SELECT MAX(rowid) FROM {quoted}").scalar() or 0)
+        except Exception:
+            # WITHOUT ROWID tables; leave their scans unpriced
+            rows = None
+        with self._lock:
+            self._table_rows[key] = (now, rows)
+        return rows
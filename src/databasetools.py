@@ -1,30 +1,143 @@
+import asyncio
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, create_engine, event
+from sqlalchemy.exc import SQLAlchemyError
 
-from langchain.tools import Tool, StructuredTool
 # from langchain_groq.chat_models import ChatGroq
+from langchain_community.tools.sql_database.prompt import QUERY_CHECKER
 from langchain_community.utilities.sql_database import SQLDatabase
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
 # from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.tools import tool
-from pydantic import BaseModel
+from langchain_core.tools import Tool
 
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Iterator, Optional
+
+from .cache import schema_fingerprint
+from .costguard import ALLOW, LIMIT, REJECT, CostGuard, GuardDecision
+from .dialects import with_hint
+from .engineoptions import EngineOptions, sqlite_url
+from .resultcache import make_data_version_probe, result_cache
+from .metrics import SQL_ERRORS, SQL_GUARD, SQL_ROWS, SQL_SECONDS
+from .results import QueryResult
+from .schemaindex import SchemaIndex
+from .schemasnapshot import SchemaSnapshot, SchemaSnapshotStore, table_fingerprints
+from .validator import INVALID, VALID, SQLValidator
+from .valueindex import ValueIndex
+from .settings import (RESULT_COUNT_MAX_ROWS, RESULT_FETCH_BATCH_SIZE, RESULT_PREVIEW_MAX_BYTES,
+                       RESULT_PREVIEW_MAX_ROWS, SCHEMA_PRUNE_MIN_TABLES, SCHEMA_SAMPLE_REFRESH_SECONDS,
+                       SQL_MAX_WORKERS,
+                       VALUE_INDEX_MAX_BYTES)
+
+# Dialects with an EXPLAIN that plans the query without running it
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN (FORMAT JSON) ',
+    'mysql': 'EXPLAIN FORMAT=JSON ',
+}
+# Plans are kept briefly: long enough for the validator and cost guard to share one
+PLAN_CACHE_MAX_ENTRIES = 128
+PLAN_CACHE_TTL_SECONDS = 30.0
 
 # Load environment variables
 load_dotenv()
 
+
+class InstalledSchema:
+    def __init__(self, db: SQLDatabase, table_info: Dict[str, str]):
+        """
+        Everything derived from one reflected schema. It is built in full before it is
+        installed and never changed afterwards, so a reader that holds it sees one
+        consistent schema while a refresh swaps in the next.
+
+        Args:
+            db (SQLDatabase): The database over the reflected metadata.
+            table_info (Dict[str, str]): Rendered table info (definition and sample rows) per table.
+        """
+        self.db = db
+        self.table_info = table_info
+        self.table_names = list(db.get_usable_table_names())
+        self.full_schema = db.get_context()
+        self.fingerprint = schema_fingerprint(self.full_schema)
+        self.index = SchemaIndex.from_metadata(db._metadata, self.table_names)
+
+
+def render_tables(tables: List[str]) -> str:
+    """Table names as the model sees them."""
+    return ", ".join(tables)
+
+
+def render_schema(schema: Dict[str, Any]) -> str:
+    """
+    A schema context (see get_full_schema) as the model sees it: the table definitions
+    and sample rows as plain text, not a JSON-escaped dict.
+    """
+    text = schema["table_info"]
+    if schema.get("omitted_tables"):
+        text += (f"\n\n({schema['omitted_tables']} less relevant tables are not shown; "
+                 f"use search_schema to look for others.)")
+    return text
+
+
+def render_table_schemas(schemas: Dict[str, str]) -> str:
+    return "\n\n".join(schemas.values())
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CANCELLED = "The query was cancelled."
+
+
+class StatementCancel:
+    """
+    Cancels the statements of one or more queries from another thread.
+
+    SQLite statements stop at their next progress-handler check and PostgreSQL ones
+    through the driver's cancel request. Elsewhere a cancelled statement runs on until
+    its statement timeout; only queries that have not started yet are skipped.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._connections: list = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._event.set()
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.cancel()
+            except Exception as e:
+                logger.debug(f"Could not cancel statement: {e}")
+
+    def attach(self, dbapi_connection: Any) -> None:
+        if not hasattr(dbapi_connection, "cancel"):
+            return
+        with self._lock:
+            self._connections.append(dbapi_connection)
+
+    def detach(self, dbapi_connection: Any) -> None:
+        with self._lock:
+            if dbapi_connection in self._connections:
+                self._connections.remove(dbapi_connection)
+
 
 class DatabaseTool:
     def __init__(self, llm, db_type: str, user: str = None,
                  password: str = None, host: str = None, port: str = None,
-                 database: str = None):
+                 database: str = None, engine_options: EngineOptions = None):
         """
         Initializes the DatabaseTool instance.
 
@@ -36,6 +149,7 @@ class DatabaseTool:
             host (str, optional): Hostname for the database (if applicable).
             port (str, optional): Port number for the database (if applicable).
             database (str): Name of the database.
+            engine_options (EngineOptions, optional): Pool and session settings; defaults from settings.
 
         Raises:
             ValueError: If the database type is unsupported.
@@ -46,14 +160,137 @@ class DatabaseTool:
         self.host = host
         self.port = port
         self.database = database
+        self.engine_options = engine_options or EngineOptions()
         self.engine = self.get_engine()
-        self.db = self.get_db()
+        self._local = threading.local()
+        self._install_statement_timeouts()
         self.llm = llm
-        self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
-        self.tools = self.toolkit.get_tools()
-        self.full_schema = self.db.get_context()
+        self.data_version = make_data_version_probe(self.db_type, self.engine, self.database)
+        self.cache_scope = self.engine.url.render_as_string(hide_password=True)
+        # Blocking DB-API calls from the async path run here so they never stall the event loop.
+        self.executor = ThreadPoolExecutor(max_workers=SQL_MAX_WORKERS, thread_name_prefix="seaquiller-sql")
+
+        self.validator = SQLValidator(self)
+        self.cost_guard = CostGuard(self)
+        # Recent EXPLAIN plans, so the validator and the cost guard plan each query once
+        self._plans: "OrderedDict[str, tuple]" = OrderedDict()
+        self._plans_lock = threading.Lock()
+
+        self.snapshot_store = SchemaSnapshotStore.for_scope(self.cache_scope)
+        self.snapshot = self.snapshot_store.load() if self.snapshot_store else None
+        self._refresh_lock = threading.Lock()
+        if self.snapshot is not None:
+            # Warm start: serve the saved schema now and re-check the catalog in the background.
+            self._install_schema(self.snapshot.metadata, self.snapshot.table_info)
+            self.refresh_thread = self._start_background(self.refresh_schema)
+            logger.info(f"Loaded schema snapshot with {len(self.snapshot.tables)} tables.")
+        else:
+            db = self.get_db()
+            table_info = {name: db.get_table_info([name]) for name in db.get_usable_table_names()}
+            self._install_schema(db._metadata, table_info)
+            self.refresh_thread = self._start_background(self.save_snapshot, table_info)
+        # Distinct values of low-cardinality text columns, for grounding question literals
+        self.value_index = ValueIndex(self) if VALUE_INDEX_MAX_BYTES else None
+        if self.value_index is not None:
+            self.value_index.start()
         logger.info("DatabaseTool initialized.")
 
+    def _install_schema(self, metadata: MetaData, table_info: Dict[str, str]) -> None:
+        """
+        Makes a reflected schema the one every tool and node reads from, in one assignment.
+        """
+        self.schema = InstalledSchema(self.get_db(metadata, table_info), table_info)
+
+    @property
+    def db(self) -> SQLDatabase:
+        return self.schema.db
+
+    @property
+    def full_schema(self) -> Dict[str, Any]:
+        return self.schema.full_schema
+
+    @property
+    def schema_index(self) -> SchemaIndex:
+        return self.schema.index
+
+    @property
+    def schema_fingerprint(self) -> str:
+        return self.schema.fingerprint
+
+    def _start_background(self, func, *args) -> threading.Thread:
+        def run():
+            try:
+                func(*args)
+            except Exception as e:
+                logger.warning(f"Background schema task failed: {e}")
+
+        thread = threading.Thread(target=run, name="seaquiller-schema", daemon=True)
+        thread.start()
+        return thread
+
+    def save_snapshot(self, table_info: Dict[str, str]) -> None:
+        """
+        Persists the current schema so the next process start skips reflection.
+
+        Args:
+            table_info (Dict[str, str]): Rendered table info per table.
+        """
+        if self.snapshot_store is None:
+            return
+        fingerprints = table_fingerprints(self.engine, list(table_info))
+        tables = {name: (fingerprints.get(name), info) for name, info in table_info.items()}
+        self.snapshot = SchemaSnapshot(self.schema.db._metadata, tables)
+        self.snapshot_store.save(self.snapshot)
+
+    def refresh_schema(self, sample_refresh_seconds: float = SCHEMA_SAMPLE_REFRESH_SECONDS) -> bool:
+        """
+        Re-reflects only the tables whose definition changed since the snapshot.
+
+        The saved sample rows of the other tables are kept, unless they are older than
+        ``sample_refresh_seconds``; then every table is rendered again.
+
+        Args:
+            sample_refresh_seconds (float): Age at which all sample rows are re-read; 0 never.
+
+        Returns:
+            bool: True if the schema changed and was swapped in.
+        """
+        with self._refresh_lock:
+            previous = self.snapshot.fingerprints
+            fingerprints = table_fingerprints(self.engine)
+            changed = [name for name, fp in fingerprints.items() if previous.get(name) != fp]
+            removed = set(previous) - set(fingerprints)
+            resample = bool(sample_refresh_seconds) and time.time() - self.snapshot.sampled_at >= sample_refresh_seconds
+            if not changed and not removed and not resample:
+                logger.info("Schema snapshot is up to date.")
+                return False
+
+            metadata = MetaData()
+            if changed:
+                metadata.reflect(self.engine, only=changed)
+            for table in self.snapshot.metadata.sorted_tables:
+                if table.name in fingerprints and table.name not in metadata.tables:
+                    table.to_metadata(metadata)
+
+            table_info = {} if resample else {name: info for name, info in self.snapshot.table_info.items()
+                                              if name in fingerprints and name not in changed}
+            db = self.get_db(metadata, table_info)
+            for name in db.get_usable_table_names():
+                if name not in table_info:
+                    table_info[name] = db.get_table_info([name])
+
+            sampled_at = time.time() if resample else self.snapshot.sampled_at
+            self.snapshot = SchemaSnapshot(metadata, {name: (fingerprints[name], table_info[name])
+                                                      for name in fingerprints}, sampled_at)
+            self.snapshot_store.save(self.snapshot)
+            if not changed and not removed and table_info == self.schema.table_info:
+                logger.info("Schema snapshot is up to date; sample rows are unchanged.")
+                return False
+            logger.info(f"Refreshing schema: {len(changed)} changed, {len(removed)} removed tables"
+                        + (", sample rows re-read." if resample else "."))
+            self._install_schema(metadata, table_info)
+            return True
+
     def get_engine(self) -> Any:
         """
         Creates a SQLAlchemy engine based on the specified database type.
@@ -76,61 +313,370 @@ class DatabaseTool:
             logger.error(f"Unsupported database type: {self.db_type}")
             raise ValueError(f"Unsupported database type: {self.db_type}")
 
-        url = db_url_map[self.db_type].format(self.user, self.password, self.host, self.port, self.database)
-        return create_engine(url)
+        options = self.engine_options
+        if self.db_type == 'sqlite':
+            url = sqlite_url(self.database, options)
+        else:
+            url = db_url_map[self.db_type].format(self.user, self.password, self.host, self.port, self.database)
+        kwargs: Dict[str, Any] = options.pool_arguments()
+        timeout_ms = options.statement_timeout_ms()
+        if self.db_type == 'postgresql':
+            # Session defaults sent at connect time, no extra round trip per checkout
+            settings = ["-c default_transaction_read_only=on"] if options.read_only else []
+            if timeout_ms:
+                settings.append(f"-c statement_timeout={timeout_ms}")
+            if settings:
+                kwargs["connect_args"] = {"options": " ".join(settings)}
+        elif self.db_type == 'mysql':
+            settings = ["SESSION transaction_read_only = 1"] if options.read_only else []
+            if timeout_ms:
+                settings.append(f"SESSION max_execution_time = {timeout_ms}")
+            if settings:
+                kwargs["connect_args"] = {"init_command": "SET " + ", ".join(settings)}
+        elif self.db_type == 'mssql' and options.read_only:
+            # Routes to a readable secondary when the server is in an availability group
+            url += "&ApplicationIntent=ReadOnly"
+        elif self.db_type == 'sqlite' and (not self.database or self.database == ":memory:"):
+            # An in-memory database exists per connection; a pool of them would be empty copies
+            kwargs = {}
+        engine = create_engine(url, **kwargs)
+        self._install_session_settings(engine)
+        return engine
 
-    def get_db(self) -> SQLDatabase:
+    def _install_session_settings(self, engine: Any) -> None:
+        """
+        Applies the read-only mode and statement timeout of dialects that cannot take
+        them as connect arguments.
+        """
+        options = self.engine_options
+        if self.db_type == 'mssql' and options.statement_timeout:
+            @event.listens_for(engine, "connect")
+            def set_query_timeout(dbapi_connection, connection_record):
+                dbapi_connection.timeout = max(int(options.statement_timeout), 1)
+
+        elif self.db_type == 'oracle':
+            if options.statement_timeout:
+                @event.listens_for(engine, "connect")
+                def set_call_timeout(dbapi_connection, connection_record):
+                    dbapi_connection.call_timeout = options.statement_timeout_ms()
+
+            if options.read_only:
+                @event.listens_for(engine, "begin")
+                def set_read_only(conn):
+                    conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+
+    def get_db(self, metadata: MetaData = None, table_info: Dict[str, str] = None) -> SQLDatabase:
         """
         Creates a SQLDatabase instance from the provided engine.
 
+        Args:
+            metadata (MetaData, optional): Already reflected metadata; tables missing from it
+                are reflected lazily on first use.
+            table_info (Dict[str, str], optional): Pre-rendered table info, which skips the
+                sample-row queries for those tables.
+
         Returns:
             SQLDatabase: An instance of SQLDatabase connected to the engine.
         """
-        return SQLDatabase(self.engine)
+        if metadata is None:
+            return SQLDatabase(self.engine)
+        return SQLDatabase(self.engine, metadata=metadata, custom_table_info=table_info,
+                           lazy_table_reflection=True)
     
     
-    def list_tables(self,input=None) -> List[str]:
+    def list_tables(self, input=None) -> List[str]:
         """
         Lists all tables in the database. No Inputs is required for this tool.
 
         Returns:
             List[str]: A list of table names in the database.
         """
-        print(f"tool called with input: {input}.")
-        list_tables_tool = next(tool for tool in self.tools if tool.name == "sql_db_list_tables")
-        # return {"tables" : list_tables_tool.invoke("")}
-        return list_tables_tool.invoke("")
+        return list(self.schema.table_names)
     
     
-    def get_table_schema(self, table_name: str) -> Dict[str, Any]:
+    def get_table_schema(self, table_name: str) -> Dict[str, str]:
         """
-        Retrieves the schema for a specific table.
+        Retrieves the schema for one table, or several separated by commas.
 
         Args:
             table_name (str): The name of the table to get the schema for.
 
         Returns:
-            Dict[str, Any]: The schema information of the specified table.
+            Dict[str, str]: Table name to its CREATE statement and sample rows.
+
+        Raises:
+            ValueError: If a table does not exist.
         """
-        get_schema_tool = next(tool for tool in self.tools if tool.name == "sql_db_schema")
-        return get_schema_tool.invoke(table_name)
+        requested = [name.strip() for name in table_name.split(",") if name.strip()]
+        schema = self.schema
+        missing = [name for name in requested if name not in schema.table_names]
+        if missing:
+            raise ValueError(f"table_names {set(missing)} not found in database")
+        return {name: self._get_table_info(name, schema) for name in requested}
     
     
-    def query(self, query_string: str) -> List[Dict[str, Any]]:
+    def query(self, query_string: str, timeout: float = None,
+              cancel: Optional["StatementCancel"] = None) -> QueryResult:
         """
         Executes a SQL query.
 
+        Only a bounded preview is fetched and returned; the full result can be streamed
+        later through its result id (see iter_result).
+
         Args:
             query_string (str): The SQL query to execute.
+            timeout (float, optional): Seconds the statement may run before it is cancelled.
+            cancel (StatementCancel, optional): Lets another thread cancel the statement.
+
+        Returns:
+            QueryResult: The result preview; a failed query has its ``error`` set.
+        """
+        if timeout is not None and timeout <= 0:
+            return QueryResult.failed("The SQL time budget for this request is exhausted.")
+        if cancel is not None and cancel.cancelled:
+            return QueryResult.failed(CANCELLED)
+        # Identical read-only queries are served from the result cache until the data changes
+        with self.statement_deadline(timeout), self.statement_cancel(cancel):
+            return result_cache.get_or_run(self.cache_scope, query_string, self.data_version,
+                                           self._run_preview, cacheable=lambda result: result.ok)
+
+    def guard(self, query_string: str) -> GuardDecision:
+        """
+        Runs the cost guard on a query and records what it decided.
 
         Returns:
-            List[Dict[str, Any]]: The result of the SQL query.
+            GuardDecision: Whether and how the query may run.
         """
-        query_sql_db_tool = next(tool for tool in self.tools if tool.name == "sql_db_query")
-        return query_sql_db_tool.invoke(query_string)
+        decision = self.cost_guard.check(query_string)
+        if decision.action != ALLOW:
+            SQL_GUARD.labels(decision.action).inc()
+            logger.info(f"Cost guard: {decision.action} {decision.estimate!r}")
+        return decision
+
+    def _run_preview(self, query_string: str) -> QueryResult:
+        decision = self.guard(query_string)
+        if decision.action == REJECT:
+            return QueryResult.failed(decision.message)
+        query_string = decision.sql
+        started = time.perf_counter()
+        try:
+            result = self.fetch(query_string)
+        except SQLAlchemyError as e:
+            SQL_ERRORS.inc()
+            # Full driver error text, so the model can fix the query, with a hint for its dialect
+            return QueryResult.failed(with_hint(self.db_type, str(e)))
+        finally:
+            SQL_SECONDS.observe(time.perf_counter() - started)
+        SQL_ROWS.observe(result.row_count)
+        if decision.action == LIMIT:
+            result.notice = decision.message
+        return result
+
+    def fetch(self, query_string: str, max_rows: int = RESULT_PREVIEW_MAX_ROWS,
+              max_bytes: int = RESULT_PREVIEW_MAX_BYTES, count_limit: int = RESULT_COUNT_MAX_ROWS) -> QueryResult:
+        """
+        Runs a query on a streaming cursor and keeps only the first rows.
+
+        Rows past the preview are counted, not kept, up to ``count_limit`` rows.
+
+        Args:
+            query_string (str): The SQL query to execute.
+            max_rows (int): Rows to keep.
+            max_bytes (int): Characters of row data the preview may render.
+            count_limit (int): Rows to count before giving up on an exact count.
+
+        Returns:
+            QueryResult: The preview and row count.
+
+        Raises:
+            sqlalchemy.exc.SQLAlchemyError: If the query fails.
+        """
+        columns, rows, row_count = [], [], 0
+        with self.engine.begin() as conn:
+            result = self._execute_streaming(conn, query_string)
+            try:
+                if result.returns_rows:
+                    columns = list(result.keys())
+                    while row_count < count_limit:
+                        batch = result.fetchmany(min(RESULT_FETCH_BATCH_SIZE, count_limit - row_count))
+                        if not batch:
+                            break
+                        if len(rows) < max_rows:
+                            rows.extend(tuple(row) for row in batch[:max_rows - len(rows)])
+                        row_count += len(batch)
+                    exact = row_count < count_limit or not result.fetchmany(1)
+                else:
+                    exact = True
+            finally:
+                result.close()
+        return QueryResult(columns, rows, row_count, exact_count=exact, max_rows=max_rows, max_bytes=max_bytes)
+
+    def iter_result(self, query_string: str, offset: int = 0, limit: Optional[int] = None,
+                    timeout: Optional[float] = None) -> Iterator[List[Any]]:
+        """
+        Streams a query result in batches without holding it in memory.
+
+        The first item is the list of column names, every following item a batch of rows.
+        Paging skips rows on the cursor rather than rewriting the SQL, which works on
+        every dialect.
+
+        Args:
+            query_string (str): The SQL query to execute; run it through guard first.
+            offset (int): Rows to skip.
+            limit (int, optional): Maximum rows to return.
+            timeout (float, optional): Seconds the whole export may take.
+
+        Yields:
+            List[Any]: The column names, then lists of row tuples.
+
+        Raises:
+            sqlalchemy.exc.SQLAlchemyError: If the query fails.
+            TimeoutError: If the export runs past ``timeout``.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+
+        def fetch(result: Any, size: int) -> List[Any]:
+            # The batches may be read from different threads, so the thread-local
+            # statement deadline only covers execution; fetching is checked here.
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"The export ran past its {timeout:g}s time limit.")
+            return result.fetchmany(size)
+
+        with self.engine.connect() as conn:
+            with self.statement_deadline(timeout):
+                result = self._execute_streaming(conn, query_string)
+            try:
+                if not result.returns_rows:
+                    yield []
+                    return
+                yield list(result.keys())
+                while offset > 0:
+                    skipped = fetch(result, min(RESULT_FETCH_BATCH_SIZE, offset))
+                    if not skipped:
+                        return
+                    offset -= len(skipped)
+                remaining = limit
+                while remaining is None or remaining > 0:
+                    size = RESULT_FETCH_BATCH_SIZE if remaining is None else min(RESULT_FETCH_BATCH_SIZE, remaining)
+                    batch = fetch(result, size)
+                    if not batch:
+                        return
+                    if remaining is not None:
+                        remaining -= len(batch)
+                    yield [tuple(row) for row in batch]
+            finally:
+                result.close()
+                conn.rollback()
+
+    def _execute_streaming(self, conn: Any, query_string: str) -> Any:
+        # Server-side cursor where the driver has one, and no bind-parameter parsing of the SQL
+        conn = conn.execution_options(stream_results=True, no_parameters=True)
+        return conn.exec_driver_sql(query_string)
+
+    @contextmanager
+    def statement_deadline(self, timeout: Optional[float]):
+        """
+        Cancels statements run by this thread once ``timeout`` seconds have passed.
+        """
+        previous = getattr(self._local, "deadline", None)
+        self._local.deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    @contextmanager
+    def statement_cancel(self, cancel: Optional["StatementCancel"]):
+        """
+        Lets ``cancel`` stop statements run by this thread.
+        """
+        previous = getattr(self._local, "cancel", None)
+        self._local.cancel = cancel
+        try:
+            yield
+        finally:
+            self._local.cancel = previous
+
+    def _install_statement_timeouts(self) -> None:
+        """
+        Hooks the engine so statement_deadline is enforced by the database driver.
+
+        SQLite checks the deadline, and the profile's statement timeout, from a progress
+        handler; PostgreSQL and MySQL get a statement timeout set just before each
+        statement, on top of the session default from get_engine. Other dialects only
+        stop at the graph level.
+        """
+        default_ms = self.engine_options.statement_timeout_ms()
+
+        def remaining_ms() -> Optional[int]:
+            deadline = getattr(self._local, "deadline", None)
+            if deadline is None:
+                return None
+            return max(int((deadline - time.monotonic()) * 1000), 1)
+
+        if self.db_type == 'sqlite':
+            def check_deadline() -> int:
+                now = time.monotonic()
+                deadline = getattr(self._local, "deadline", None)
+                statement_deadline = getattr(self._local, "statement_deadline", None)
+                cancel = getattr(self._local, "cancel", None)
+                return int((deadline is not None and now > deadline)
+                           or (statement_deadline is not None and now > statement_deadline)
+                           or (cancel is not None and cancel.cancelled))
+
+            @event.listens_for(self.engine, "connect")
+            def set_progress_handler(dbapi_connection, connection_record):
+                dbapi_connection.set_progress_handler(check_deadline, 10000)
+
+            @event.listens_for(self.engine, "before_cursor_execute")
+            def start_statement_clock(conn, cursor, statement, parameters, context, executemany):
+                # SQLite has no statement timeout of its own; the progress handler enforces this one
+                self._local.statement_deadline = time.monotonic() + default_ms / 1000 if default_ms else None
+
+        elif self.db_type in ('postgresql', 'mysql'):
+            setting = ("SET LOCAL statement_timeout = {}" if self.db_type == 'postgresql'
+                       else "SET SESSION MAX_EXECUTION_TIME = {}")
+
+            def set_timeout(conn, statement: str) -> None:
+                # A separate cursor: the statement's own may be a server-side (named) cursor
+                cursor = conn.connection.cursor()
+                try:
+                    cursor.execute(statement)
+                finally:
+                    cursor.close()
+
+            @event.listens_for(self.engine, "before_cursor_execute")
+            def set_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+                ms = remaining_ms()
+                if ms is not None:
+                    set_timeout(conn, setting.format(ms))
+                    conn.info["seaquiller_timeout"] = True
+                elif conn.info.pop("seaquiller_timeout", False) and self.db_type == 'mysql':
+                    # MySQL's setting is per session and would outlive this request otherwise.
+                    set_timeout(conn, setting.format(default_ms or 0))
+
+        if self.db_type == 'postgresql':
+            # psycopg sends a cancel request for the running statement from any thread
+            @event.listens_for(self.engine, "before_cursor_execute")
+            def attach_cancel(conn, cursor, statement, parameters, context, executemany):
+                cancel = getattr(self._local, "cancel", None)
+                if cancel is not None:
+                    cancel.attach(conn.connection.dbapi_connection)
+
+            @event.listens_for(self.engine, "after_cursor_execute")
+            def detach_cancel(conn, cursor, statement, parameters, context, executemany):
+                cancel = getattr(self._local, "cancel", None)
+                if cancel is not None:
+                    cancel.detach(conn.connection.dbapi_connection)
+
+            @event.listens_for(self.engine, "handle_error")
+            def detach_cancel_on_error(context):
+                cancel = getattr(self._local, "cancel", None)
+                if cancel is not None and context.connection is not None:
+                    cancel.detach(context.connection.connection.dbapi_connection)
     
     
-    def check_query(self, query_string: str) -> Dict[str, Any]:
+    def check_query(self, query_string: str) -> str:
         """
         Checks a SQL query for correctness.
 
@@ -138,12 +684,132 @@ class DatabaseTool:
             query_string (str): The SQL query to check.
 
         Returns:
-            Dict[str, Any]: The result of the query check, indicating validity.
+            str: The checked (possibly rewritten) query, or an error starting with "Error:".
         """
-        query_checker_tool = next(tool for tool in self.tools if tool.name == "sql_db_query_checker")
-        return query_checker_tool.invoke(query_string)
+        # Decide locally when possible; only undecided queries go to the LLM checker
+        result = self.validator.validate(query_string)
+        if result.status == VALID:
+            return result.sql
+        if result.status == INVALID:
+            return f"Error: {result.message}"
+        return self.llm.invoke(self._checker_prompt(query_string)).content
+
+    def _checker_prompt(self, query_string: str) -> str:
+        return QUERY_CHECKER.format(query=query_string, dialect=self.engine.dialect.name)
+
+    def explain(self, query_string: str) -> Optional[List[Any]]:
+        """
+        Plans a query with EXPLAIN inside a read-only transaction, without running it.
+
+        Args:
+            query_string (str): The SQL query to plan.
+
+        Returns:
+            Optional[List[Any]]: The plan rows, or None if the dialect has no safe EXPLAIN.
+
+        Raises:
+            sqlalchemy.exc.DBAPIError: If the database rejects the query.
+        """
+        prefix = EXPLAIN_PREFIX.get(self.db_type)
+        if prefix is None:
+            return None
+        with self._plans_lock:
+            cached = self._plans.get(query_string)
+        if cached is not None and time.monotonic() - cached[0] < PLAN_CACHE_TTL_SECONDS:
+            return cached[1]
+        with self.engine.connect() as conn:
+            conn = conn.execution_options(no_parameters=True)
+            if self.db_type in ('postgresql', 'mysql'):
+                conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+            try:
+                plan = conn.exec_driver_sql(prefix + query_string).fetchall()
+            finally:
+                conn.rollback()
+        with self._plans_lock:
+            self._plans[query_string] = (time.monotonic(), plan)
+            self._plans.move_to_end(query_string)
+            while len(self._plans) > PLAN_CACHE_MAX_ENTRIES:
+                self._plans.popitem(last=False)
+        return plan
     
     
+    @property
+    def prunes_schema(self) -> bool:
+        """Whether the database is large enough that the model only sees relevant tables."""
+        return len(self.schema.table_names) > SCHEMA_PRUNE_MIN_TABLES
+
+    def get_relevant_schema(self, question: str = "") -> Dict[str, Any]:
+        """
+        Gets the schema context of only the tables relevant to a question.
+
+        Small databases get the full schema; larger ones get the top-ranked tables from
+        the schema index and their foreign-key neighbours.
+
+        Args:
+            question (str): The user question.
+
+        Returns:
+            Dict[str, Any]: Same shape as get_full_schema, plus "omitted_tables" when pruned.
+        """
+        schema = self.schema
+        if not question or len(schema.table_names) <= SCHEMA_PRUNE_MIN_TABLES:
+            return schema.full_schema
+
+        selected = schema.index.relevant_tables(question)
+        return {
+            "table_info": "\n\n".join(self._get_table_info(name, schema) for name in selected),
+            "table_names": ", ".join(selected),
+            "omitted_tables": len(schema.table_names) - len(selected),
+        }
+
+    def _get_table_info(self, table_name: str, schema: Optional[InstalledSchema] = None) -> str:
+        schema = schema or self.schema
+        info = schema.table_info.get(table_name)
+        return info if info is not None else schema.db.get_table_info([table_name])
+
+    async def _run_in_executor(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def alist_tables(self, input=None) -> List[str]:
+        """Async version of list_tables, run on the SQL thread pool."""
+        return await self._run_in_executor(self.list_tables, input)
+
+    async def aget_table_schema(self, table_name: str) -> Dict[str, str]:
+        """Async version of get_table_schema, run on the SQL thread pool."""
+        return await self._run_in_executor(self.get_table_schema, table_name)
+
+    async def aquery(self, query_string: str, timeout: float = None,
+                     cancel: Optional["StatementCancel"] = None) -> QueryResult:
+        """Async version of query, run on the SQL thread pool."""
+        return await self._run_in_executor(self.query, query_string, timeout, cancel)
+
+    async def acheck_query(self, query_string: str) -> str:
+        """Async version of check_query; the LLM checker is called asynchronously."""
+        result = await self._run_in_executor(self.validator.validate, query_string)
+        if result.status == VALID:
+            return result.sql
+        if result.status == INVALID:
+            return f"Error: {result.message}"
+        return (await self.llm.ainvoke(self._checker_prompt(query_string))).content
+
+    async def aget_relevant_schema(self, question: str = "") -> Dict[str, Any]:
+        """Async version of get_relevant_schema, run on the SQL thread pool."""
+        return await self._run_in_executor(self.get_relevant_schema, question)
+
+    async def aget_full_schema(self, input=""):
+        """Async version of get_full_schema."""
+        return self.get_full_schema(input)
+
+    def close(self) -> None:
+        """
+        Disposes the engine's connection pool and shuts down the SQL thread pool.
+        """
+        if self.value_index is not None:
+            self.value_index.close()
+        self.executor.shutdown(wait=False)
+        self.engine.dispose()
+
     # def get_full_schema(self) -> Dict[str, Any]:
     def get_full_schema(self, input=""):
         """
@@ -152,28 +818,50 @@ class DatabaseTool:
         Returns:
             Dict[str, Any]: The full schema information of the database.
         """
-        print("db: ", self.full_schema)
         # return self.db.get_context()
         return self.full_schema
     
+    def _rendered(self, func: Callable, render: Callable[[Any], str]) -> tuple:
+        """
+        Wraps a typed method as a tool function: the result is rendered to text only here,
+        at the LLM boundary, and a ValueError becomes an "Error: ..." message for the model.
+
+        Returns:
+            tuple: (sync function, coroutine function running it on the SQL thread pool).
+        """
+        def run(*args):
+            try:
+                return render(func(*args))
+            except ValueError as e:
+                return f"Error: {e}"
+
+        async def arun(*args):
+            return await self._run_in_executor(run, *args)
+
+        return run, arun
+
     def create_tools(self) -> Dict[str, Tool]:
         tools = {}
         # tools =[]
 
         # Tool for listing tables
+        list_tables, alist_tables = self._rendered(self.list_tables, render_tables)
         tools["list_tables"] = Tool(
         # tools.append(Tool(
             name="list_tables",
-            func=self.list_tables,
+            func=list_tables,
+            coroutine=alist_tables,
             description="Lists all tables in the database. No input is required for this tool.",
             args=[]  # No arguments needed
         )
 
         # Tool for getting table schema
         # tools.append(Tool(
+        get_table_schema, aget_table_schema = self._rendered(self.get_table_schema, render_table_schemas)
         tools["get_table_schema"] = Tool(
             name="get_table_schema",
-            func=self.get_table_schema,
+            func=get_table_schema,
+            coroutine=aget_table_schema,
             description="Retrieves the schema for a specific table. \n"
                         "Arguments:\n"
                         "- `table_name` (str): The name of the table to get the schema for.\n"
@@ -182,10 +870,12 @@ class DatabaseTool:
         )
 
         # Tool for querying the database
+        query, aquery = self._rendered(self.query, QueryResult.to_prompt)
         tools["query_db"] = Tool(
         # tools.append(Tool(
             name="query_db",
-            func=self.query,
+            func=query,
+            coroutine=aquery,
             description="Executes a SQL query. \n"
                         "Arguments:\n"
                         "- `query_string` (str): The SQL query to execute.\n"
@@ -198,6 +888,7 @@ class DatabaseTool:
         # tools.append(Tool(
             name="check_query",
             func=self.check_query,
+            coroutine=self.acheck_query,
             description="Checks a SQL query for correctness. \n"
                         "Arguments:\n"
                         "- `query_string` (str): The SQL query to check.\n"
@@ -205,11 +896,25 @@ class DatabaseTool:
             args=[{"name": "query_string", "type": "str", "description": "The SQL query to check."}]
         )
 
+        get_full_schema, aget_full_schema = self._rendered(self.get_full_schema, render_schema)
         tools["get_full_schema"] = Tool(
             name="get_full_schema",
             description="Gets the full schema context of the database. No input is required for this tool.",
-            func=self.get_full_schema,
+            func=get_full_schema,
+            coroutine=aget_full_schema,
             args=[] # No arguments needed
         )
 
-        return tools
\ No newline at end of file
+        search_schema, asearch_schema = self._rendered(self.get_relevant_schema, render_schema)
+        tools["search_schema"] = Tool(
+            name="search_schema",
+            func=search_schema,
+            coroutine=asearch_schema,
+            description="Finds the tables relevant to a question and returns only their schema. \n"
+                        "Arguments:\n"
+                        "- `question` (str): The question or keywords to search the schema for.\n"
+                        "Example: `search_schema('tracks composed by AC/DC')`",
+            args=[{"name": "question", "type": "str", "description": "The question to search for."}]
+        )
+
+        return tools
@@ -0,0 +1,168 @@
+"""
+What the model needs to know about each database's SQL dialect.
+
+The prompts name the dialect and carry its notes (row limits, identifier quoting, date
+functions), so the first query is written for the right database. When a query still
+fails, the driver error gets a hint for the usual cross-dialect mistake behind it.
+"""
+import re
+from typing import Dict, List, Tuple
+
+DIALECT_NAMES = {
+    "sqlite": "SQLite",
+    "postgresql": "PostgreSQL",
+    "mysql": "MySQL",
+    "mssql": "SQL Server (T-SQL)",
+    "oracle": "Oracle",
+}
+
+DIALECT_NOTES: Dict[str, List[str]] = {
+    "sqlite": [
+        "Limit rows with LIMIT n.",
+        'Quote identifiers with double quotes: "Order Details".',
+        "Dates are stored as text: use date(), strftime('%Y', col) and julianday(); there is no EXTRACT or YEAR().",
+        "Concatenate strings with ||.",
+        "Example: SELECT name, total FROM invoices ORDER BY total DESC LIMIT 5",
+    ],
+    "postgresql": [
+        "Limit rows with LIMIT n.",
+        'Unquoted identifiers are folded to lowercase; quote mixed-case names with double quotes: "FirstName".',
+        "Dates: EXTRACT(YEAR FROM col), date_trunc('month', col), to_char(col, 'YYYY-MM'), col + INTERVAL '1 day', "
+        "CURRENT_DATE; there is no strftime() or YEAR().",
+        "LIKE is case-sensitive; use ILIKE to ignore case.",
+        "Integer division truncates; cast to numeric for ratios. Every selected column that is not aggregated "
+        "must be in GROUP BY.",
+        "Example: SELECT name, total FROM invoices ORDER BY total DESC LIMIT 5",
+    ],
+    "mysql": [
+        "Limit rows with LIMIT n.",
+        "Quote identifiers with backticks: `Order Details`; double quotes are for strings.",
+        "Dates: YEAR(col), MONTH(col), DATE_FORMAT(col, '%Y-%m'), DATE_ADD(col, INTERVAL 1 DAY), CURDATE(); "
+        "there is no strftime() or date_trunc().",
+        "Concatenate strings with CONCAT(a, b); || means OR.",
+        "Example: SELECT name, total FROM invoices ORDER BY total DESC LIMIT 5",
+    ],
+    "mssql": [
+        "There is no LIMIT: use SELECT TOP n, or ORDER BY ... OFFSET 0 ROWS FETCH NEXT n ROWS ONLY.",
+        "Quote identifiers with square brackets: [Order Details].",
+        "Dates: YEAR(col), DATEPART(month, col), FORMAT(col, 'yyyy-MM'), DATEADD(day, 1, col), "
+        "DATEDIFF(day, a, b), GETDATE(); there is no strftime(), EXTRACT or date_trunc().",
+        "Concatenate strings with + or CONCAT(a, b).",
+        "ORDER BY is not allowed in subqueries and CTEs unless they use TOP.",
+        "Example: SELECT TOP 5 name, total FROM invoices ORDER BY total DESC",
+    ],
+    "oracle": [
+        "There is no LIMIT: use FETCH FIRST n ROWS ONLY after ORDER BY.",
+        'Unquoted identifiers are folded to uppercase; quote mixed-case names with double quotes: "FirstName".',
+        "Dates: EXTRACT(YEAR FROM col), TO_CHAR(col, 'YYYY-MM'), TRUNC(col, 'MM'), col + 1, ADD_MONTHS(col, 1), "
+        "SYSDATE; there is no strftime() or YEAR().",
+        "Table aliases take no AS: FROM invoices i. A SELECT without a table reads FROM DUAL.",
+        "Concatenate strings with ||; an empty string is NULL.",
+        "Example: SELECT name, total FROM invoices ORDER BY total DESC FETCH FIRST 5 ROWS ONLY",
+    ],
+}
+
+# (pattern over the driver error, hint) per dialect; the first match wins
+ERROR_HINTS: Dict[str, List[Tuple[str, str]]] = {
+    "sqlite": [
+        (r"no such function: (extract|year|month|date_trunc|to_char|date_format|datepart|now|getdate)",
+         "SQLite has few date functions: use strftime('%Y', col), date(col) or julianday(col)."),
+        (r"no such column", "Check the column against the schema; string literals take single quotes."),
+    ],
+    "postgresql": [
+        (r"function (strftime|year|month|datepart|date_format|julianday|ifnull)\(",
+         "PostgreSQL has no such function: use EXTRACT(YEAR FROM col), date_trunc() or to_char(); "
+         "COALESCE instead of IFNULL."),
+        (r"function .* does not exist",
+         "No function matches these argument types; add explicit casts such as col::numeric or col::date."),
+        (r"operator does not exist", "The operands have different types; cast one of them, e.g. col::text."),
+        (r'column "?[^"\s]+"? does not exist',
+         "Unquoted identifiers are folded to lowercase; quote mixed-case names, e.g. \"FirstName\", "
+         "and use single quotes for strings."),
+        (r"must appear in the GROUP BY clause",
+         "Add every selected column that is not aggregated to GROUP BY, or aggregate it."),
+        (r"syntax error at or near \"(top|\[)", "PostgreSQL has no TOP or [brackets]: use LIMIT n and double quotes."),
+    ],
+    "mysql": [
+        (r"function \S*\.?(strftime|date_trunc|extract_year|datepart|to_char|julianday) does not exist",
+         "MySQL has no such function: use YEAR(col), DATE_FORMAT(col, '%Y-%m') or DATE_ADD()."),
+        (r"unknown column '[^']*' in", "Quote identifiers with backticks, not double quotes, and check the schema."),
+        (r"only_full_group_by|isn't in group by",
+         "Add every selected column that is not aggregated to GROUP BY, or aggregate it."),
+        (r"near '(top |\[|fetch first)", "MySQL has no TOP, FETCH FIRST or [brackets]: use LIMIT n and backticks."),
+        (r"error in your sql syntax", "Check dialect syntax: LIMIT n, backticks for identifiers, CONCAT() for strings."),
+    ],
+    "mssql": [
+        (r"near 'limit'|near the keyword 'limit'",
+         "SQL Server has no LIMIT: use SELECT TOP n, or ORDER BY ... OFFSET 0 ROWS FETCH NEXT n ROWS ONLY."),
+        (r"'(strftime|date_trunc|extract|to_char|date_format|now|ifnull|julianday)' is not a recognized",
+         "SQL Server has no such function: use YEAR(col), DATEPART(), FORMAT(col, 'yyyy-MM'), DATEADD(), "
+         "GETDATE() or ISNULL()."),
+        (r"order by clause is invalid in views, inline functions, derived tables, subqueries",
+         "Remove ORDER BY from the subquery or CTE, or give it a TOP."),
+        (r"invalid column name", "Check the column against the schema; quote names with [brackets] and strings "
+                                 "with single quotes."),
+        (r"near '`'|near '\"'", "Quote identifiers with [brackets]."),
+        (r"ambiguous column name", "Qualify the column with its table alias."),
+        (r"not contained in either an aggregate function or the group by clause",
+         "Add every selected column that is not aggregated to GROUP BY, or aggregate it."),
+    ],
+    "oracle": [
+        (r"ora-00933", "Oracle has no LIMIT and table aliases take no AS: use FETCH FIRST n ROWS ONLY and FROM t a."),
+        (r"ora-00923", "Every SELECT needs FROM; use FROM DUAL when there is no table."),
+        (r"ora-00904",
+         "Unquoted identifiers are folded to uppercase; quote mixed-case names, and check the schema."),
+        (r"ora-00937|ora-00979", "Add every selected column that is not aggregated to GROUP BY, or aggregate it."),
+        (r"ora-00936", "An expression is missing; Oracle has no strftime(), TOP or LIMIT: use EXTRACT(), TO_CHAR() "
+                       "and FETCH FIRST n ROWS ONLY."),
+    ],
+}
+
+_COMPILED = {db_type: [(re.compile(pattern, re.IGNORECASE), hint) for pattern, hint in hints]
+             for db_type, hints in ERROR_HINTS.items()}
+
+
+def dialect_name(db_type: str) -> str:
+    return DIALECT_NAMES.get(db_type, db_type)
+
+
+def dialect_notes(db_type: str) -> str:
+    """
+    Returns:
+        str: The dialect notes as a prompt section, or "" for an unknown dialect.
+    """
+    notes = DIALECT_NOTES.get(db_type)
+    if not notes:
+        return ""
+    return f"\n{dialect_name(db_type)} rules:\n" + "\n".join(f"- {note}" for note in notes) + "\n"
+
+
+def prompt_dialect(db_type: str) -> Dict[str, str]:
+    """Values of the {dialect} and {dialect_notes} prompt variables."""
+    return {"dialect": dialect_name(db_type), "dialect_notes": dialect_notes(db_type)}
+
+
+def error_hint(db_type: str, error: str) -> str:
+    """
+    Picks the hint for a failed query's error.
+
+    Args:
+        db_type (str): DatabaseTool.db_type of the database that raised it.
+        error (str): The driver error text.
+
+    Returns:
+        str: A one-line fix for the model, or "" when no pattern matches.
+    """
+    for pattern, hint in _COMPILED.get(db_type, []):
+        if pattern.search(error):
+            return hint
+    return ""
+
+
+def with_hint(db_type: str, error: str) -> str:
+    """
+    Returns:
+        str: The error followed by a "Hint for <dialect>: ..." line when one applies.
+    """
+    hint = error_hint(db_type, error)
+    return f"{error}\nHint for {dialect_name(db_type)}: {hint}" if hint else error
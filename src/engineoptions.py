@@ -0,0 +1,82 @@
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+from .settings import (DB_READ_ONLY, POOL_MAX_OVERFLOW, POOL_MAX_OVERFLOW_LIMIT, POOL_PRE_PING,
+                       POOL_RECYCLE_SECONDS, POOL_SIZE, POOL_SIZE_LIMIT, POOL_TIMEOUT_SECONDS,
+                       SQL_STATEMENT_TIMEOUT_SECONDS)
+
+
+class EngineOptions(BaseModel):
+    """
+    Connection pool and session settings of one connection profile.
+
+    Requests may only tighten the server's safety settings: read_only cannot be turned
+    off and statement_timeout cannot be removed or raised.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    pool_size: int = Field(POOL_SIZE, ge=1, le=POOL_SIZE_LIMIT, description="Connections kept open.")
+    max_overflow: int = Field(POOL_MAX_OVERFLOW, ge=0, le=POOL_MAX_OVERFLOW_LIMIT,
+                              description="Extra connections opened under load.")
+    pool_timeout: float = Field(POOL_TIMEOUT_SECONDS, gt=0, description="Seconds to wait for a free connection.")
+    pool_recycle: int = Field(POOL_RECYCLE_SECONDS, description="Reopen connections older than this; -1 never.")
+    pool_pre_ping: bool = Field(POOL_PRE_PING, description="Test connections before handing them out.")
+    read_only: bool = Field(DB_READ_ONLY, description="Open sessions in the dialect's read-only mode.")
+    statement_timeout: Optional[float] = Field(SQL_STATEMENT_TIMEOUT_SECONDS,
+                                               description="Per-statement time limit in seconds; 0 disables it.")
+    sqlite_immutable: bool = Field(False, description="Open SQLite files as immutable: no locking at all.")
+
+    @field_validator("read_only")
+    @classmethod
+    def _keep_read_only(cls, value: bool) -> bool:
+        if DB_READ_ONLY and not value:
+            raise ValueError("read_only cannot be turned off on this server")
+        return value
+
+    @field_validator("statement_timeout")
+    @classmethod
+    def _keep_statement_timeout(cls, value: Optional[float]) -> Optional[float]:
+        if value is not None and value < 0:
+            raise ValueError("statement_timeout must not be negative")
+        if SQL_STATEMENT_TIMEOUT_SECONDS and not (value and value <= SQL_STATEMENT_TIMEOUT_SECONDS):
+            raise ValueError(f"statement_timeout must be over 0 and at most {SQL_STATEMENT_TIMEOUT_SECONDS:g} seconds "
+                             f"on this server")
+        return value
+
+    def pool_arguments(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: create_engine keyword arguments for a QueuePool.
+        """
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pool_pre_ping,
+        }
+
+    def statement_timeout_ms(self) -> Optional[int]:
+        return int(self.statement_timeout * 1000) if self.statement_timeout else None
+
+
+def sqlite_url(path: Optional[str], options: EngineOptions) -> str:
+    """
+    Builds the SQLite URL, as a read-only (or immutable) URI filename when asked to.
+
+    A read-only connection never takes a write lock, so with the database in WAL mode
+    any number of them read concurrently while a writer is active.
+
+    Args:
+        path (str, optional): The database file.
+        options (EngineOptions): The profile's engine options.
+
+    Returns:
+        str: The SQLAlchemy URL.
+    """
+    if not path or path == ":memory:" or not (options.read_only or options.sqlite_immutable):
+        return f"sqlite:///{path or ''}"
+    mode = "immutable=1" if options.sqlite_immutable else "mode=ro"
+    return f"sqlite:///file:{quote(path)}?{mode}&uri=true"
@@ -0,0 +1,344 @@
+"""
+Verified question -> SQL pairs of each database, for few-shot prompts and template reuse.
+
+Questions are embedded as hashed word, word-pair and character-trigram TF-IDF vectors
+in NumPy, so retrieval needs no external service and a search is one matrix-vector
+product.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import sqlglot
+from sqlglot import exp
+
+from .cache import normalize_question
+from .schemaindex import tokenize, trigrams
+from .settings import EXAMPLES_MAX_ENTRIES, EXAMPLES_MIN_SIMILARITY, EXAMPLES_PATH, EXAMPLES_TOP_K
+
+logger = logging.getLogger(__name__)
+
+# Width of the hashed feature vectors
+VECTOR_DIMENSIONS = 2048
+# Longest literal a template accepts from a new question
+TEMPLATE_MAX_LITERAL_CHARS = 100
+# Words a question must share with a template outside its literals
+TEMPLATE_MIN_FIXED_TOKENS = 2
+# Nearest examples tried as templates; a new literal lowers similarity, so no threshold applies
+TEMPLATE_CANDIDATES = 5
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def features(question: str) -> List[str]:
+    """Words, adjacent word pairs and character trigrams of a question."""
+    tokens = tokenize(question)
+    grams = [f"w:{token}" for token in tokens]
+    grams += [f"p:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        grams += [f"c:{gram}" for gram in trigrams(token)]
+    return grams
+
+
+def term_frequencies(question: str) -> np.ndarray:
+    """Log-scaled hashed term frequencies of a question."""
+    vector = np.zeros(VECTOR_DIMENSIONS, dtype=np.float32)
+    for gram in features(question):
+        vector[zlib.crc32(gram.encode()) % VECTOR_DIMENSIONS] += 1.0
+    np.log1p(vector, out=vector)
+    return vector
+
+
+class Example:
+    def __init__(self, question: str, sql: str, similarity: float = 0.0):
+        """
+        A question that was answered correctly, with the SQL that answered it.
+
+        Args:
+            question (str): The question as asked.
+            sql (str): The query whose result the answer was based on.
+            similarity (float): Cosine similarity to the searched question.
+        """
+        self.question = question
+        self.sql = sql
+        self.similarity = similarity
+
+    def __repr__(self) -> str:
+        return f"Example({self.question!r}, similarity={self.similarity:.2f})"
+
+
+def render_examples(examples: List[Example]) -> str:
+    """Few-shot text for the query_gen system prompt; empty without examples."""
+    if not examples:
+        return ""
+    parts = ["\nQuestions answered correctly on this database before, with their SQL:"]
+    for example in examples:
+        parts.append(f"Question: {example.question}\nSQL: {example.sql}")
+    return "\n\n".join(parts) + "\n"
+
+
+def result_answer(result: Any) -> str:
+    """
+    Plain-text answer built from a query result, for template answers that skip the LLM.
+
+    Args:
+        result (QueryResult): A non-empty result preview.
+    """
+    rows = result.rows[:result.max_rows]
+    if len(result.columns) == 1:
+        answer = ", ".join(str(row[0]) for row in rows)
+    else:
+        answer = "; ".join(", ".join(f"{column}: {value}" for column, value in zip(result.columns, row))
+                           for row in rows)
+    if result.truncated:
+        total = result.row_count if result.exact_count else f"more than {result.row_count}"
+        answer += f" (first {len(rows)} of {total} rows)"
+    return answer
+
+
+def _literal_key(literal: exp.Literal) -> Tuple[bool, str]:
+    return literal.is_string, literal.this
+
+
+def fill_template(template_question: str, template_sql: str, question: str,
+                  dialect: Optional[str] = None) -> Optional[str]:
+    """
+    Reuses a stored query for a question that differs from its question only in literals.
+
+    Literals of the SQL that appear in the stored question become capture groups; if the
+    new question matches the rest word for word, the captured values replace the
+    literals. "Who composed 'Go Down'?" with ``... WHERE Name = 'Go Down'`` fills in
+    "Who composed 'Thunderstruck'?".
+
+    Args:
+        template_question (str): The stored question.
+        template_sql (str): Its verified SQL.
+        question (str): The new question.
+        dialect (str, optional): sqlglot dialect of the SQL.
+
+    Returns:
+        Optional[str]: The SQL for the new question, or None if it does not fit the template.
+    """
+    try:
+        statement = sqlglot.parse_one(template_sql, read=dialect)
+    except sqlglot.errors.SqlglotError:
+        return None
+    stored = " ".join(template_question.split()).rstrip(" ?.!;")
+    literals: Dict[Tuple[bool, str], Tuple[int, int]] = {}
+    for literal in statement.find_all(exp.Literal):
+        key = _literal_key(literal)
+        if key in literals or not key[1]:
+            continue
+        found = re.search(rf"(?<!\w){re.escape(key[1])}(?!\w)", stored, re.IGNORECASE)
+        if found is not None:
+            literals[key] = found.span()
+    spans = sorted((span, key) for key, span in literals.items())
+    # Overlapping literals ("5" inside "2015") would make the pattern ambiguous
+    if not spans or any(a[0][1] > b[0][0] for a, b in zip(spans, spans[1:])):
+        return None
+
+    pattern, fixed, position = "", "", 0
+    for (start, end), (is_string, _) in spans:
+        fixed += stored[position:start] + " "
+        pattern += r"\s+".join(map(re.escape, stored[position:start].split(" ")))
+        pattern += r"(.+?)" if is_string else r"(-?\d+(?:\.\d+)?)"
+        position = end
+    fixed += stored[position:]
+    pattern += r"\s+".join(map(re.escape, stored[position:].split(" ")))
+    if len(tokenize(fixed)) < TEMPLATE_MIN_FIXED_TOKENS:
+        return None
+    match = re.fullmatch(pattern, " ".join(question.split()).rstrip(" ?.!;"), re.IGNORECASE)
+    if match is None:
+        return None
+
+    values = {}
+    for (_, key), value in zip(spans, match.groups()):
+        if not value.strip() or len(value) > TEMPLATE_MAX_LITERAL_CHARS:
+            return None
+        values[key] = value
+
+    def substitute(node: exp.Expression) -> exp.Expression:
+        if isinstance(node, exp.Literal) and _literal_key(node) in values:
+            value = values[_literal_key(node)]
+            return exp.Literal.string(value) if node.is_string else exp.Literal.number(value)
+        return node
+
+    return statement.transform(substitute).sql(dialect=dialect)
+
+
+class ExampleIndex:
+    def __init__(self, store: "ExampleStore", scope: str, rows: List[Tuple[str, str]]):
+        """
+        In-memory TF-IDF index over the examples of one database.
+
+        Args:
+            store (ExampleStore): Where additions and removals are persisted.
+            scope (str): Connection identity, e.g. the engine URL without password.
+            rows (List[Tuple[str, str]]): Stored (question, sql) pairs, oldest first.
+        """
+        self.store = store
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._examples: Dict[str, Example] = {}
+        self._frequencies: Dict[str, np.ndarray] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+        for question, sql in rows:
+            self._insert(question, sql)
+
+    def __len__(self) -> int:
+        return len(self._examples)
+
+    def _insert(self, question: str, sql: str) -> None:
+        key = normalize_question(question)
+        self._examples.pop(key, None)
+        self._examples[key] = Example(question, sql)
+        self._frequencies[key] = term_frequencies(question)
+        while len(self._examples) > self.store.max_entries:
+            oldest = next(iter(self._examples))
+            del self._examples[oldest], self._frequencies[oldest]
+        self._matrix = None
+
+    def add(self, question: str, sql: str) -> None:
+        """Stores a verified pair, replacing an earlier one for the same question."""
+        with self._lock:
+            self._insert(question, sql)
+        self.store.save(self.scope, normalize_question(question), question, sql)
+
+    def remove(self, question: str) -> None:
+        """Drops a pair whose SQL no longer works, e.g. after a schema change."""
+        key = normalize_question(question)
+        with self._lock:
+            if self._examples.pop(key, None) is not None:
+                del self._frequencies[key]
+                self._matrix = None
+        self.store.delete(self.scope, key)
+
+    def _vectors(self) -> Tuple[List[str], Optional[np.ndarray], Optional[np.ndarray]]:
+        # Rebuilt lazily after changes: IDF weights depend on the whole collection
+        if self._matrix is None and self._examples:
+            self._keys = list(self._examples)
+            frequencies = np.stack([self._frequencies[key] for key in self._keys])
+            document_frequency = np.count_nonzero(frequencies, axis=0)
+            self._idf = (np.log((1 + len(self._keys)) / (1 + document_frequency)) + 1).astype(np.float32)
+            matrix = frequencies * self._idf
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.maximum(norms, 1e-9)
+        return self._keys, self._matrix, self._idf
+
+    def search(self, question: str, k: int = EXAMPLES_TOP_K,
+               min_similarity: float = EXAMPLES_MIN_SIMILARITY) -> List[Example]:
+        """
+        Returns the stored examples most similar to a question.
+
+        Args:
+            question (str): The new question.
+            k (int): Maximum number of examples.
+            min_similarity (float): Cosine similarity an example needs, 0 to 1.
+
+        Returns:
+            List[Example]: The examples, most similar first.
+        """
+        if not k:
+            return []
+        with self._lock:
+            keys, matrix, idf = self._vectors()
+            if matrix is None:
+                return []
+            vector = term_frequencies(question) * idf
+            norm = np.linalg.norm(vector)
+            if not norm:
+                return []
+            similarities = matrix @ (vector / norm)
+            best = np.argsort(-similarities)[:k]
+            return [Example(self._examples[keys[i]].question, self._examples[keys[i]].sql, float(similarities[i]))
+                    for i in best if similarities[i] >= min_similarity]
+
+    def match_template(self, question: str, dialect: Optional[str] = None) -> Optional[Tuple[Example, str]]:
+        """
+        Finds a stored question the new one differs from only in literals.
+
+        Returns:
+            Optional[Tuple[Example, str]]: The template and the SQL filled in for the new
+            question, or None.
+        """
+        for example in self.search(question, k=TEMPLATE_CANDIDATES, min_similarity=0.0):
+            sql = fill_template(example.question, example.sql, question, dialect)
+            if sql is not None:
+                return example, sql
+        return None
+
+
+class ExampleStore:
+    """
+    Persists verified examples of every database in a local SQLite file.
+    """
+
+    def __init__(self, path: str = EXAMPLES_PATH, max_entries: int = EXAMPLES_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS examples ("
+            " scope TEXT NOT NULL, key TEXT NOT NULL, question TEXT NOT NULL, sql TEXT NOT NULL,"
+            " created_at REAL NOT NULL, PRIMARY KEY (scope, key))"
+        )
+        self._indexes: Dict[str, ExampleIndex] = {}
+
+    def index(self, scope: str) -> ExampleIndex:
+        """Returns the index of one database, loading it on first use."""
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None:
+                rows = self._conn.execute(
+                    "SELECT question, sql FROM examples WHERE scope = ? ORDER BY created_at DESC LIMIT ?",
+                    (scope, self.max_entries),
+                ).fetchall()
+                index = self._indexes[scope] = ExampleIndex(self, scope, list(reversed(rows)))
+        return index
+
+    def save(self, scope: str, key: str, question: str, sql: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO examples VALUES (?, ?, ?, ?, ?)",
+                               (scope, key, question, sql, time.time()))
+            self._conn.execute(
+                "DELETE FROM examples WHERE scope = ? AND key IN ("
+                " SELECT key FROM examples WHERE scope = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (scope, scope, self.max_entries),
+            )
+
+    def delete(self, scope: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM examples WHERE scope = ? AND key = ?", (scope, key))
+
+
+def example_index(database_tools: Any) -> Optional[ExampleIndex]:
+    """The example index of a DatabaseTool's database, or None when examples are disabled."""
+    store = get_example_store()
+    return store.index(database_tools.cache_scope) if store is not None else None
+
+
+def get_example_store(path: str = EXAMPLES_PATH) -> Optional[ExampleStore]:
+    """
+    Returns the process-wide example store, or None when examples are disabled.
+    """
+    global _store
+    if not path:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ExampleStore(path)
+        return _store
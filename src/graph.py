@@ -1,58 +1,255 @@
-from typing import Literal
+import asyncio
+from typing import Any, Dict, Literal, Optional
 
-from nodes import (get_tool_nodes, 
-                    model_check_query, 
+from .budget import RequestBudget, budget_exhausted, remaining_seconds
+from .compaction import compact_node
+from .nodes import (SQLAgentNodes,
+                    answer_query,
+                    budget_exhausted_answer,
                     first_tool_call,
-                    model_get_schema,
-                    query_gen_node,
-                    SubmitFinalAnswer, 
+                    SubmitFinalAnswer,
                     State)
 
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import START, END, StateGraph, MessagesState
 
-workflow = StateGraph(State)
+from .settings import GRAPH_MODE, QUERY_CHECK_MODE, TEMPLATE_REUSE
+from .threads import is_thread
 
-tool_node_dicts = get_tool_nodes()
-list_tables_tool_node = tool_node_dicts["list_tables_tool_node"]
-get_full_schema_tool_node = tool_node_dicts["get_full_schema_tool_node"]
-query_db_tool_node = tool_node_dicts["query_db_tool_node"]
 
-def should_continue(state: State) -> Literal[END, "correct_query", "query_gen"]: # type: ignore
+def should_continue(state: State) -> Literal[END, "correct_query", "compact", "give_up", "query_gen"]: # type: ignore
     messages = state["messages"]
     last_message = messages[-1]
     # If there is a tool call, then we finish
     if getattr(last_message, "tool_calls", None):
         return END
-    if last_message.content.startswith("Error:"):
+    if budget_exhausted(state):
+        return "give_up"
+    if isinstance(last_message, ToolMessage) and last_message.name == "search_schema" and \
+            not last_message.content.startswith("Error:"):
+        # The model looked up tables the schema context left out; let it write the query now
         return "query_gen"
+    if last_message.content.startswith("Error:"):
+        return "compact"
     else:
         return "correct_query"
 
-# Define nodes
-workflow.add_node("first_tool_call", first_tool_call)
-workflow.add_node("list_tables_tool", list_tables_tool_node)
-workflow.add_node("get_schema_tool", get_full_schema_tool_node)
-workflow.add_node("model_get_schema", model_get_schema)
-workflow.add_node("query_gen", query_gen_node)
-workflow.add_node("correct_query", model_check_query)
-workflow.add_node("execute_query", query_db_tool_node)
-
-
-# Define edges
-workflow.add_edge(START, "first_tool_call")
-workflow.add_edge("first_tool_call", "list_tables_tool")
-workflow.add_edge("list_tables_tool", "model_get_schema")
-workflow.add_edge("model_get_schema", "get_schema_tool")
-workflow.add_edge("get_schema_tool", "query_gen")
-workflow.add_conditional_edges(
-    "query_gen",
-    should_continue,
-)
-workflow.add_edge("correct_query", "execute_query")
-workflow.add_edge("execute_query", "query_gen")
-
-# Compile the workflow into a runnable
-app = workflow.compile()
-
-def get_app():
-    return app
\ No newline at end of file
+
+def after_check(state: State) -> Literal["execute_query", "compact", "give_up"]:
+    # A local validation error already answered the tool call, so skip execution
+    if isinstance(state["messages"][-1], ToolMessage):
+        return "give_up" if budget_exhausted(state) else "compact"
+    return "execute_query"
+
+
+def after_execute(state: State) -> Literal["compact", "give_up"]:
+    # Retries go through compact so the query_gen prompt does not grow with every attempt
+    return "give_up" if budget_exhausted(state) else "compact"
+
+
+def after_speculate(state: State) -> Literal["compact", "give_up", "query_gen"]:
+    if budget_exhausted(state):
+        return "give_up"
+    # Without a candidate result there is nothing to retry with; query_gen writes the next query
+    return "compact" if isinstance(state["messages"][-1], ToolMessage) else "query_gen"
+
+
+def latest_attempt_failed(state: State) -> bool:
+    return str(state["messages"][-1].content).startswith("Error:")
+
+
+def build_workflow(nodes: SQLAgentNodes, mode: str = GRAPH_MODE) -> StateGraph:
+    """
+    Builds the SQL agent workflow.
+
+    Args:
+        nodes (SQLAgentNodes): Nodes bound to one database.
+        mode (str): "fast" injects the table list and schema without an LLM call;
+            "agentic" lets the model request the schema through model_get_schema.
+            Independently, nodes.candidates > 1 retries failed attempts with speculate.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode not in ("fast", "agentic"):
+        raise ValueError(f"Unsupported graph mode: {mode}")
+
+    workflow = StateGraph(State)
+
+    tool_node_dicts = nodes.get_tool_nodes()
+
+    # Define nodes
+    if mode == "fast":
+        workflow.add_node("schema_context", RunnableLambda(nodes.schema_context_node, afunc=nodes.aschema_context_node))
+    else:
+        workflow.add_node("first_tool_call", first_tool_call)
+        workflow.add_node("list_tables_tool", tool_node_dicts["list_tables_tool_node"])
+        workflow.add_node("get_schema_tool", RunnableLambda(nodes.get_schema_node, afunc=nodes.aget_schema_node))
+        # LLM nodes get a native coroutine so ainvoke never blocks the event loop
+        workflow.add_node("model_get_schema", RunnableLambda(nodes.model_get_schema, afunc=nodes.amodel_get_schema))
+    workflow.add_node("query_gen", RunnableLambda(nodes.query_gen_node, afunc=nodes.aquery_gen_node))
+    workflow.add_node("compact", compact_node)
+    if QUERY_CHECK_MODE == "llm":
+        workflow.add_node("correct_query", RunnableLambda(nodes.model_check_query, afunc=nodes.amodel_check_query))
+    else:
+        workflow.add_node("correct_query", RunnableLambda(nodes.check_query_node, afunc=nodes.acheck_query_node))
+    # Runs query_db itself rather than through a ToolNode so the SQL budget can cap it
+    workflow.add_node("execute_query", RunnableLambda(nodes.execute_query_node, afunc=nodes.aexecute_query_node))
+    workflow.add_node("give_up", nodes.give_up_node)
+    templates = TEMPLATE_REUSE and nodes.examples is not None
+    if templates:
+        workflow.add_node("template", RunnableLambda(nodes.template_node, afunc=nodes.atemplate_node))
+    if nodes.candidates:
+        workflow.add_node("speculate", RunnableLambda(nodes.speculate_node, afunc=nodes.aspeculate_node))
+
+    # Define edges
+    first_node = "schema_context" if mode == "fast" else "first_tool_call"
+
+    def route_start(state: State) -> str:
+        # Follow-ups in a thread go straight to query_gen with the earlier schema context
+        return "query_gen" if nodes.reuses_schema(state) else first_node
+
+    if templates:
+        # A question that fits a verified template is answered by the template node alone
+        workflow.add_edge(START, "template")
+        workflow.add_conditional_edges(
+            "template", lambda state: END if extract_answer(state) else route_start(state),
+            [END, first_node, "query_gen"])
+    else:
+        workflow.add_conditional_edges(START, route_start, [first_node, "query_gen"])
+    if mode == "fast":
+        workflow.add_edge("schema_context", "query_gen")
+    else:
+        workflow.add_edge("first_tool_call", "list_tables_tool")
+        workflow.add_edge("list_tables_tool", "model_get_schema")
+        workflow.add_edge("model_get_schema", "get_schema_tool")
+        workflow.add_edge("get_schema_tool", "query_gen")
+    workflow.add_conditional_edges(
+        "query_gen",
+        should_continue,
+    )
+    if nodes.candidates:
+        # A failed attempt is retried with several candidates at once; query_gen answers from the winner
+        workflow.add_conditional_edges(
+            "compact", lambda state: "speculate" if latest_attempt_failed(state) else "query_gen",
+            ["speculate", "query_gen"])
+        workflow.add_conditional_edges("speculate", after_speculate)
+    else:
+        workflow.add_edge("compact", "query_gen")
+    workflow.add_conditional_edges("correct_query", after_check)
+    workflow.add_conditional_edges("execute_query", after_execute)
+    workflow.add_edge("give_up", END)
+
+    return workflow
+
+
+def build_app(nodes: SQLAgentNodes, mode: str = GRAPH_MODE, checkpointer: Any = None):
+    # Compile the workflow into a runnable; a checkpointer makes it keep conversation threads
+    return build_workflow(nodes, mode).compile(checkpointer=checkpointer)
+
+
+async def aturn_inputs(app: Any, inputs: Dict[str, Any], budget: RequestBudget,
+                       config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Adds the request budget to the graph input.
+
+    In a conversation thread the counters carry over from earlier turns, so the budget
+    starts from what the thread has already spent, and the previous turn's give-up
+    reason is cleared.
+
+    Args:
+        app: The compiled LangGraph app.
+        inputs (Dict[str, Any]): Graph input, e.g. {"messages": [("user", question)]}.
+        budget (RequestBudget): Limits for this request.
+        config (Dict[str, Any], optional): Runnable config; a thread_id selects the thread.
+
+    Returns:
+        Dict[str, Any]: The input to run the graph with.
+    """
+    if not is_thread(config):
+        return {**inputs, "budget": budget.to_state()}
+    snapshot = await app.aget_state(config)
+    return {**inputs, "budget": budget.to_state(snapshot.values), "budget_exhausted": None}
+
+
+async def asave_partial_answer(app: Any, config: Optional[Dict[str, Any]], answer: Any, reason: str) -> None:
+    """
+    Records the partial answer of a turn cut off by the deadline in its thread, so the
+    next turn sees how this one ended. Does nothing outside a thread.
+    """
+    if is_thread(config):
+        await app.aupdate_state(config, {"messages": [answer], "budget_exhausted": reason}, as_node="give_up")
+
+
+async def arun_graph(app: Any, inputs: Dict[str, Any], budget: RequestBudget,
+                     config: Optional[Dict[str, Any]] = None) -> State:
+    """
+    Runs the graph within a request budget.
+
+    Iteration, token and SQL limits are enforced inside the graph; the wall-clock
+    timeout cancels whatever node is running and falls back to a partial answer built
+    from the last state reached.
+
+    Args:
+        app: The compiled LangGraph app.
+        inputs (Dict[str, Any]): Graph input, e.g. {"messages": [("user", question)]}.
+        budget (RequestBudget): Limits for this request.
+        config (Dict[str, Any], optional): Extra runnable config, e.g. callbacks, or a
+            thread_id (see threads.thread_config) to continue a conversation thread.
+
+    Returns:
+        State: The final graph state.
+    """
+    inputs = await aturn_inputs(app, inputs, budget, config)
+    config = {**(config or {}), "recursion_limit": budget.recursion_limit()}
+    state = None
+
+    async def run():
+        nonlocal state
+        async for state in app.astream(inputs, config=config, stream_mode="values"):
+            pass
+
+    try:
+        await asyncio.wait_for(run(), timeout=remaining_seconds(inputs))
+    except asyncio.TimeoutError:
+        reason = "ran out of time"
+        messages = (state or {}).get("messages", [])
+        answer = budget_exhausted_answer(messages, reason)
+        await asave_partial_answer(app, config, answer, reason)
+        state = {**(state or {}), "messages": messages + [answer], "budget_exhausted": reason}
+    return state
+
+
+def extract_answer(state: State) -> Optional[Dict[str, Any]]:
+    """
+    Pulls the final answer and the last executed SQL out of a finished graph state.
+
+    Returns:
+        Optional[Dict[str, Any]]: {"response": ..., "sql": ..., "partial": ...}, or None
+        if the graph did not finish with SubmitFinalAnswer. "partial" is True when the
+        request budget ran out before the model submitted an answer.
+    """
+    messages = state["messages"]
+    answer = None
+    for tc in getattr(messages[-1], "tool_calls", None) or []:
+        if tc["name"] == "SubmitFinalAnswer":
+            answer = tc["args"].get("final_answer")
+    if answer is None:
+        return None
+
+    # Only this turn's queries; earlier turns of a thread have their own answers
+    call, _ = answer_query(messages)
+    sql = next(iter(call["args"].values()), None) if call is not None else None
+    return {"response": answer, "sql": sql, "partial": bool(state.get("budget_exhausted"))}
+
+
+def get_app(profile):
+    """
+    Returns the compiled graph for a connection profile from the process-wide registry.
+
+    Args:
+        profile (ConnectionProfile): The connection profile to serve.
+    """
+    from .registry import registry
+    return registry.get(profile).app
@@ -0,0 +1,388 @@
+"""
+Shared LLM clients and the scheduler that keeps them within the provider's rate limits.
+
+Every graph node of every connection profile used to get its own ChatOpenAI, with its own
+HTTP connection pool and the SDK's own retries, and nothing coordinated them: under load
+the provider answered with bursts of 429s and the retries of all requests fired together.
+
+Now there is one client per (API key, model), and every call first takes from that
+key's token buckets: requests per minute and tokens per minute. Batch work leaves a share
+of each budget to interactive requests and steps back while they wait. Rate-limited and
+transient failures are retried with jittered exponential backoff, and a 429 pauses all
+callers of the key rather than just the one that saw it.
+
+Point OPENAI_BASE_URL at any OpenAI-compatible server, e.g. bench/fakeopenai.py, to run
+against it.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import openai
+from langchain_core.messages import BaseMessage
+from langchain_openai import ChatOpenAI
+
+from .metrics import LLM_QUEUE_SECONDS, LLM_RETRIES
+from .settings import (LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS, LLM_BATCH_RESERVE, LLM_MAX_RETRIES,
+                       LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Clients and rate limiters kept, one each per (API key, model); the least recently used
+# is dropped past this
+POOL_MAX_CLIENTS = 64
+# Completion tokens charged up front when the model has no max_tokens; corrected after the call
+COMPLETION_TOKENS_ESTIMATE = 500
+# Longest single sleep while waiting for a budget, so a freed budget is noticed soon
+MAX_WAIT_STEP_SECONDS = 1.0
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("seaquiller_llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """
+    Runs the LLM calls made inside the block, including those of graph nodes it starts,
+    at ``priority`` (INTERACTIVE or BATCH).
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """
+        A budget that refills continuously at ``per_minute`` and holds at most one minute's worth.
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount: float, reserve: float) -> float:
+        """Seconds until ``amount`` can be taken while leaving ``reserve`` in the bucket."""
+        # A call larger than the whole budget waits for a full bucket rather than forever
+        needed = min(amount + reserve, self.capacity) - self.level
+        return max(needed, 0.0) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE, batch_reserve: float = LLM_BATCH_RESERVE,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = LLM_BACKOFF_MAX_SECONDS):
+        """
+        Request and token budgets of one API key and model, shared by every caller in the process.
+
+        Args:
+            requests_per_minute (int): Request budget; 0 leaves requests unlimited.
+            tokens_per_minute (int): Token budget, prompt plus completion; 0 leaves tokens unlimited.
+            batch_reserve (float): Share of each budget batch calls may not use.
+            max_retries (int): Retries of a rate-limited or transiently failed call.
+            backoff_base (float): Backoff of the first retry, in seconds; it doubles per retry.
+            backoff_max (float): Upper bound on one backoff, in seconds.
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.batch_reserve = batch_reserve
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.paused_until = 0.0
+        self.waiting = {INTERACTIVE: 0, BATCH: 0}
+        self._lock = threading.Lock()
+
+    def _try_take(self, tokens: int, priority: str) -> float:
+        """Takes the budget for one call and returns 0, or returns the seconds to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.paused_until - now, 0.0)
+            if priority == BATCH and self.waiting[INTERACTIVE]:
+                wait = max(wait, MAX_WAIT_STEP_SECONDS)
+            reserve = self.batch_reserve if priority == BATCH else 0.0
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait(amount, reserve * bucket.capacity))
+            if wait > 0:
+                return wait
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None:
+                    bucket.level -= amount
+            return 0.0
+
+    def _waits(self, tokens: int, priority: Optional[str]) -> Iterator[float]:
+        """Yields the sleeps to take before the call may go out; the budget is taken when it ends."""
+        priority = priority or _priority.get()
+        started = time.monotonic()
+        queued = False
+        try:
+            while True:
+                wait = self._try_take(tokens, priority)
+                if not wait:
+                    break
+                if not queued:
+                    with self._lock:
+                        self.waiting[priority] += 1
+                    queued = True
+                # Jitter keeps callers that queued together from waking together
+                yield min(wait, MAX_WAIT_STEP_SECONDS) * random.uniform(1.0, 1.2)
+        finally:
+            if queued:
+                with self._lock:
+                    self.waiting[priority] -= 1
+        LLM_QUEUE_SECONDS.labels(priority).observe(time.monotonic() - started)
+
+    def acquire(self, tokens: int, priority: Optional[str] = None) -> None:
+        """
+        Blocks until the budgets allow a call of about ``tokens`` tokens, then takes them.
+
+        Args:
+            tokens (int): Estimated prompt plus completion tokens.
+            priority (str, optional): INTERACTIVE or BATCH; defaults to the llm_priority in effect.
+        """
+        for wait in self._waits(tokens, priority):
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int, priority: Optional[str] = None) -> None:
+        """Async version of acquire."""
+        for wait in self._waits(tokens, priority):
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, used: int) -> None:
+        """Corrects the token budget once a call reports the tokens it really used."""
+        if self.tokens is None or not used:
+            return
+        with self._lock:
+            self.tokens.level = max(self.tokens.level + estimated - used, -self.tokens.capacity)
+
+    def retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """
+        Decides whether a failed call is retried, and after how long.
+
+        The backoff doubles per attempt and is jittered over its upper half. A 429 also
+        pauses every caller of this limiter for the same time and empties the request
+        budget, so the retries that follow are spread out instead of synchronized.
+
+        Args:
+            error (BaseException): What the call raised.
+            attempt (int): Retries made so far.
+
+        Returns:
+            Optional[float]: Seconds to wait before retrying, or None to give up.
+        """
+        reason = _retry_reason(error)
+        if reason is None or attempt >= self.max_retries:
+            return None
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        delay = random.uniform(backoff / 2, backoff)
+        if reason == "rate_limited":
+            delay = max(delay, _retry_after(error) or 0.0)
+            with self._lock:
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                if self.requests is not None:
+                    self.requests.level = min(self.requests.level, 0.0)
+        LLM_RETRIES.labels(reason).inc()
+        logger.info(f"LLM call failed ({reason}), retry {attempt + 1} in {delay:.2f}s: {error}")
+        return delay
+
+
+def _retry_reason(error: BaseException) -> Optional[str]:
+    if isinstance(error, openai.RateLimitError):
+        # An exhausted quota does not come back by waiting
+        return None if getattr(error, "code", None) == "insufficient_quota" else "rate_limited"
+    if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+        return "server_error"
+    return None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def estimate_tokens(messages: List[BaseMessage], max_tokens: Optional[int], kwargs: Dict[str, Any]) -> int:
+    """Prompt tokens, about four characters each and tool schemas included, plus the completion."""
+    chars = len(json.dumps(kwargs.get("tools") or [], default=str))
+    for message in messages:
+        chars += len(str(message.content)) + len(json.dumps(getattr(message, "tool_calls", None) or [],
+                                                            default=str))
+    return chars // 4 + (max_tokens or COMPLETION_TOKENS_ESTIMATE)
+
+
+def _used_tokens(message: Any) -> int:
+    return (getattr(message, "usage_metadata", None) or {}).get("total_tokens", 0)
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """
+    ChatOpenAI whose calls go through the RateLimiter of its API key and model.
+
+    The SDK's own retries are turned off (see shared_chat_model); this class retries
+    instead, coordinated across callers. A streamed call is only retried before its
+    first chunk.
+    """
+
+    @property
+    def limiter(self) -> RateLimiter:
+        api_key = self.openai_api_key.get_secret_value() if self.openai_api_key else None
+        return _limiter(api_key, self.model_name)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter, estimated = self.limiter, estimate_tokens(messages, self.max_tokens, kwargs)
+        attempt = 0
+        while True:
+            limiter.acquire(estimated)
+            try:
+                result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                delay = limiter.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            limiter.settle(estimated, sum(_used_tokens(g.message) for g in result.generations))
+            return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter, estimated = self.limiter, estimate_tokens(messages, self.max_tokens, kwargs)
+        attempt = 0
+        while True:
+            await limiter.aacquire(estimated)
+            try:
+                result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                delay = limiter.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            limiter.settle(estimated, sum(_used_tokens(g.message) for g in result.generations))
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter, estimated = self.limiter, estimate_tokens(messages, self.max_tokens, kwargs)
+        attempt = 0
+        while True:
+            limiter.acquire(estimated)
+            chunks = super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                delay = limiter.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            break
+        used = 0
+        if first is not None:
+            used = _used_tokens(first.message)
+            yield first
+            for chunk in chunks:
+                used += _used_tokens(chunk.message)
+                yield chunk
+        limiter.settle(estimated, used)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter, estimated = self.limiter, estimate_tokens(messages, self.max_tokens, kwargs)
+        attempt = 0
+        while True:
+            await limiter.aacquire(estimated)
+            chunks = super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = await anext(chunks, None)
+            except Exception as e:
+                delay = limiter.retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            break
+        used = 0
+        if first is not None:
+            used = _used_tokens(first.message)
+            yield first
+            async for chunk in chunks:
+                used += _used_tokens(chunk.message)
+                yield chunk
+        limiter.settle(estimated, used)
+
+
+def _key_digest(api_key: Optional[str]) -> str:
+    # The pool is keyed on a digest so keys are not kept as dict keys in plain text
+    return hashlib.sha256((api_key or "").encode()).hexdigest()
+
+
+_pool: "OrderedDict[Tuple[str, str], ScheduledChatOpenAI]" = OrderedDict()
+_limiters: "OrderedDict[Tuple[str, str], RateLimiter]" = OrderedDict()
+_pool_lock = threading.Lock()
+
+
+def _limiter(api_key: Optional[str], model: str) -> RateLimiter:
+    key = (_key_digest(api_key), model)
+    with _pool_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter()
+        _limiters.move_to_end(key)
+        while len(_limiters) > POOL_MAX_CLIENTS:
+            _limiters.popitem(last=False)
+        return limiter
+
+
+def shared_chat_model(model: str, api_key: Optional[str] = None) -> ScheduledChatOpenAI:
+    """
+    Returns the process-wide chat model of an API key and model, creating it on first use.
+
+    The model, and with it the HTTP connection pools of its OpenAI clients, is shared
+    by every node and connection profile using the same key and model.
+
+    Args:
+        model (str): OpenAI model name.
+        api_key (str, optional): OpenAI API key; falls back to OPENAI_API_KEY when omitted.
+
+    Returns:
+        ScheduledChatOpenAI: The shared model.
+    """
+    key = (_key_digest(api_key), model)
+    with _pool_lock:
+        llm = _pool.get(key)
+        if llm is not None:
+            _pool.move_to_end(key)
+            return llm
+    # Outside the lock: building the clients reads the environment and may take a moment
+    llm = ScheduledChatOpenAI(model=model, temperature=0, api_key=api_key, max_retries=0)
+    with _pool_lock:
+        llm = _pool.setdefault(key, llm)
+        _pool.move_to_end(key)
+        while len(_pool) > POOL_MAX_CLIENTS:
+            _pool.popitem(last=False)
+        return llm
@@ -0,0 +1,213 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+from .settings import SLOW_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("seaquiller.slow")
+
+# Seconds: from sub-millisecond local steps up to multi-minute LLM retries.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram("seaquiller_request_seconds", "End-to-end time to answer a question.",
+                            ["endpoint", "outcome"], buckets=LATENCY_BUCKETS)
+NODE_SECONDS = Histogram("seaquiller_node_seconds", "Time spent in each graph node.",
+                         ["node"], buckets=LATENCY_BUCKETS)
+LLM_SECONDS = Histogram("seaquiller_llm_seconds", "LLM call latency by calling node.",
+                        ["node"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter("seaquiller_llm_tokens", "LLM tokens by calling node.", ["node", "kind"])
+LLM_ERRORS = Counter("seaquiller_llm_errors", "Failed LLM calls by calling node.", ["node"])
+LLM_QUEUE_SECONDS = Histogram("seaquiller_llm_queue_seconds", "Time LLM calls waited for the rate-limit budget.",
+                              ["priority"], buckets=LATENCY_BUCKETS)
+LLM_RETRIES = Counter("seaquiller_llm_retries", "LLM calls retried after a failure, by reason.", ["reason"])
+SQL_SECONDS = Histogram("seaquiller_sql_seconds", "Execution time of generated SQL.",
+                        buckets=LATENCY_BUCKETS)
+SQL_ROWS = Histogram("seaquiller_sql_rows", "Rows returned by generated SQL.",
+                     buckets=(0, 1, 5, 10, 100, 1000, 10000, 100000))
+SQL_ERRORS = Counter("seaquiller_sql_errors", "Generated SQL that failed to execute.")
+SQL_GUARD = Counter("seaquiller_sql_guard", "Generated SQL the cost guard rejected or limited.", ["action"])
+ITERATIONS = Histogram("seaquiller_query_iterations", "query_gen rounds needed per question.",
+                       buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 25))
+ATTEMPTS = Histogram("seaquiller_sql_attempts", "SQL attempts per question; 1 means the first query was used.",
+                     ["dialect"], buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 25))
+
+
+class RequestMetrics(BaseCallbackHandler):
+    """
+    Callback handler that times one graph run: every node, every LLM call and its tokens.
+
+    Observations go to the Prometheus metrics as they happen; the per-stage breakdown
+    is kept for the slow-request log.
+    """
+
+    # Called on the event loop thread rather than through a thread pool hop per callback.
+    run_inline = True
+
+    def __init__(self, endpoint: str, question: str = "", dialect: str = "unknown"):
+        self.endpoint = endpoint
+        self.question = question
+        self.dialect = dialect
+        self.started = time.perf_counter()
+        self.node_seconds: Dict[str, float] = defaultdict(float)
+        self.llm_seconds: Dict[str, float] = defaultdict(float)
+        self.tokens: Dict[str, int] = defaultdict(int)
+        self.llm_calls = 0
+        self.iterations = 0
+        self.attempts = 0
+        self._runs: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: Any, kind: str, node: str) -> None:
+        with self._lock:
+            self._runs[run_id] = (kind, node, time.perf_counter())
+
+    def _stop(self, run_id: Any) -> Optional[tuple]:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        kind, node, started = run
+        return kind, node, time.perf_counter() - started
+
+    def on_chain_start(self, serialized: Any, inputs: Any, *, run_id: Any,
+                       metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # Only the node's own run, not the runnables nested inside it
+        if node and not node.startswith("__") and kwargs.get("name") == node:
+            self._start(run_id, "node", node)
+
+    def on_chain_end(self, outputs: Any, *, run_id: Any, **kwargs: Any) -> None:
+        stopped = self._stop(run_id)
+        if stopped is not None:
+            _, node, seconds = stopped
+            NODE_SECONDS.labels(node).observe(seconds)
+            self.node_seconds[node] += seconds
+            if node in ("query_gen", "speculate"):
+                self.iterations += 1
+            # Every query the model writes is checked once; a speculative round counts as one attempt
+            if node in ("correct_query", "speculate"):
+                self.attempts += 1
+
+    def on_chain_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        self.on_chain_end(None, run_id=run_id)
+
+    def on_chat_model_start(self, serialized: Any, messages: List[Any], *, run_id: Any,
+                            metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        self._start(run_id, "llm", (metadata or {}).get("langgraph_node") or "unknown")
+
+    def on_llm_end(self, response: Any, *, run_id: Any, **kwargs: Any) -> None:
+        stopped = self._stop(run_id)
+        if stopped is None:
+            return
+        _, node, seconds = stopped
+        LLM_SECONDS.labels(node).observe(seconds)
+        self.llm_seconds[node] += seconds
+        self.llm_calls += 1
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for kind, key in (("prompt", "input_tokens"), ("completion", "output_tokens")):
+                    if usage.get(key):
+                        LLM_TOKENS.labels(node, kind).inc(usage[key])
+                        self.tokens[kind] += usage[key]
+
+    def on_llm_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        stopped = self._stop(run_id)
+        if stopped is not None:
+            LLM_ERRORS.labels(stopped[1]).inc()
+
+    def finish(self, outcome: str, sql: Optional[str] = None) -> float:
+        """
+        Records the request outcome and writes the slow-request log entry if it was slow.
+
+        Args:
+            outcome (str): "ok", "partial", "cached" or "error".
+            sql (str, optional): The executed SQL, for the slow-request log.
+
+        Returns:
+            float: The request duration in seconds.
+        """
+        seconds = time.perf_counter() - self.started
+        REQUEST_SECONDS.labels(self.endpoint, outcome).observe(seconds)
+        if self.iterations:
+            ITERATIONS.observe(self.iterations)
+        if self.attempts:
+            ATTEMPTS.labels(self.dialect).observe(self.attempts)
+        if SLOW_REQUEST_SECONDS and seconds >= SLOW_REQUEST_SECONDS:
+            slow_logger.warning(json.dumps({
+                "endpoint": self.endpoint,
+                "outcome": outcome,
+                "seconds": round(seconds, 3),
+                "question": self.question,
+                "sql": sql,
+                "iterations": self.iterations,
+                "attempts": self.attempts,
+                "llm_calls": self.llm_calls,
+                "tokens": dict(self.tokens),
+                "nodes": {node: round(s, 3) for node, s in self.node_seconds.items()},
+                "llm": {node: round(s, 3) for node, s in self.llm_seconds.items()},
+            }))
+        return seconds
+
+
+def answer_outcome(result: Dict[str, Any]) -> str:
+    if result.get("cached"):
+        return "cached"
+    return "partial" if result.get("partial") else "ok"
+
+
+class _StateCollector:
+    """Reads cache and connection-pool state at scrape time."""
+
+    def describe(self):
+        # Registering would otherwise call collect() at import time, before the registry exists.
+        return []
+
+    def collect(self):
+        from .cache import answer_cache
+        from .registry import registry
+        from .resultcache import result_cache
+
+        cache_lookups = CounterMetricFamily("seaquiller_cache_lookups", "Cache lookups by cache and result.",
+                                            labels=["cache", "result"])
+        for name, cache in (("answer", answer_cache), ("result", result_cache)):
+            cache_lookups.add_metric([name, "hit"], cache.hits)
+            cache_lookups.add_metric([name, "miss"], cache.misses)
+        yield cache_lookups
+
+        entries = registry.entries()
+        yield GaugeMetricFamily("seaquiller_registry_entries", "Warm connection profiles.", value=len(entries))
+
+        pool_size = GaugeMetricFamily("seaquiller_pool_size", "Connection pool size.", labels=["database"])
+        checked_out = GaugeMetricFamily("seaquiller_pool_checked_out", "Connections in use.", labels=["database"])
+        overflow = GaugeMetricFamily("seaquiller_pool_overflow", "Connections above the pool size.",
+                                     labels=["database"])
+        for entry in entries:
+            pool = entry.database_tools.engine.pool
+            label = [entry.database_tools.cache_scope]
+            for family, method in ((pool_size, "size"), (checked_out, "checkedout"), (overflow, "overflow")):
+                if hasattr(pool, method):
+                    # QueuePool reports overflow as negative while the pool is not yet full
+                    family.add_metric(label, max(getattr(pool, method)(), 0))
+        yield pool_size
+        yield checked_out
+        yield overflow
+
+
+REGISTRY.register(_StateCollector())
+
+
+def render_metrics() -> tuple:
+    """
+    Returns:
+        tuple: (body, content type) of the Prometheus exposition.
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
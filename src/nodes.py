@@ -1,10 +1,24 @@
+import asyncio
+import logging
+import operator
+import time
+import uuid
+from concurrent.futures import as_completed
 from typing_extensions import TypedDict
-from typing import Annotated, Literal
+from typing import Annotated, Any, Callable, Dict, List, Literal, Optional, Tuple
 
-from databasetools import DatabaseTool
-from prompts import QUERY_CHECK_SYSTEM_PROMPT, QUERY_GEN_SYSTEM_PROMPT
+from .budget import budget_exhausted, sql_timeout
+from .databasetools import DatabaseTool, StatementCancel, render_schema, render_tables
+from .dialects import prompt_dialect
+from .examples import example_index, render_examples, result_answer
+from .llmpool import shared_chat_model
+from .prompts import QUERY_CHECK_SYSTEM_PROMPT, QUERY_GEN_SYSTEM_PROMPT, SPECULATIVE_GEN_SYSTEM_PROMPT
+from .results import QueryResult
+from .settings import EXAMPLES_AUTO_SAVE, SPECULATIVE_CANDIDATES
+from .validator import INVALID, UNKNOWN, ValidationResult
+from .valueindex import render_value_hints
 
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages.tool import ToolMessage
 from langchain_openai import ChatOpenAI
@@ -13,44 +27,28 @@ from langchain_openai import ChatOpenAI
 from langgraph.graph.message import AnyMessage, add_messages
 from langgraph.prebuilt import ToolNode
 from pydantic import BaseModel, Field
-import json
 
-with open('config.json', 'r') as f:
-    config = json.load(f)
+logger = logging.getLogger(__name__)
 
-print(config)
-
-llm_db = ChatOpenAI(model=config["model"], temperature=0, api_key=config["api_key"])
-database_tools = DatabaseTool(llm=llm_db, 
-                              db_type=config["db_type"], 
-                              database=config["database"],
-                              user=config["user"],
-                              password=config["password"],
-                              host=config["host"],
-                              port=config["port"])
-
-db_tools = database_tools.create_tools()
-
-tools = [db_tools[tool] for tool in db_tools]
-
-def get_tool_nodes() -> dict[str, ToolNode]:
-    tools_node = ToolNode(tools)
-
-    return {
-        "tools_node": tools_node,
-        "list_tables_tool_node": ToolNode([db_tools["list_tables"]]),
-        "get_table_schema_tool_node": ToolNode([db_tools["get_table_schema"]]),
-        "query_db_tool_node": ToolNode([db_tools["query_db"]]),
-        "check_query_tool_node": ToolNode([db_tools["check_query"]]),
-        "get_full_schema_tool_node": ToolNode([db_tools["get_full_schema"]]),
-    }
 
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
+    # Request budget from RequestBudget.to_state() and what has been spent against it
+    budget: dict
+    iterations: Annotated[int, operator.add]
+    tokens_used: Annotated[int, operator.add]
+    sql_seconds: Annotated[float, operator.add]
+    budget_exhausted: Optional[str]
+    # Table list and schema computed once for a batch of questions (see shared_schema_context)
+    shared_schema: dict
 
 class SubmitFinalAnswer(BaseModel):
     final_answer: str = Field(..., description="The final answer to the user")
 
+class SQLCandidates(BaseModel):
+    queries: List[str] = Field(..., description="Different SQL queries that could answer the question, "
+                                                "most promising first")
+
 def first_tool_call(state: State) -> dict[str, list[AIMessage]]:
     return {
         "messages": [
@@ -67,39 +65,601 @@ def first_tool_call(state: State) -> dict[str, list[AIMessage]]:
     }
 
 
+def chat_openai(model: str, api_key: Optional[str] = None) -> ChatOpenAI:
+    # One rate-limited client per (api_key, model), shared by every node and profile
+    return shared_chat_model(model, api_key)
+
+
+def token_usage(message: Any) -> int:
+    return (getattr(message, "usage_metadata", None) or {}).get("total_tokens", 0)
+
+
+def budget_exhausted_answer(messages: list[AnyMessage], reason: str) -> AIMessage:
+    """
+    Builds a SubmitFinalAnswer call from the best result gathered before the budget ran out.
+
+    Args:
+        messages (list[AnyMessage]): The conversation so far; only the current turn is used.
+        reason (str): Which limit was hit.
+
+    Returns:
+        AIMessage: The final-answer tool call.
+    """
+    answer = f"I could not finish answering because the request {reason}."
+    messages = current_turn(messages)
+    tool_call_ids = {}
+    for message in messages:
+        for tc in getattr(message, "tool_calls", None) or []:
+            if tc["name"] == "query_db":
+                tool_call_ids[tc["id"]] = next(iter(tc["args"].values()), "")
+    for message in reversed(messages):
+        if (isinstance(message, ToolMessage) and message.tool_call_id in tool_call_ids
+                and not str(message.content).startswith("Error:")):
+            answer += (f" The last successful query was:\n{tool_call_ids[message.tool_call_id]}\n"
+                       f"and it returned:\n{message.content}")
+            break
+    return AIMessage(content="", tool_calls=[{
+        "name": "SubmitFinalAnswer",
+        "args": {"final_answer": answer},
+        "id": f"tool_budget_{uuid.uuid4().hex[:8]}",
+        "type": "tool_call",
+    }])
+
+
+def query_result_message(result: QueryResult, tool_call_id: str) -> ToolMessage:
+    # The row count rides along as the artifact: the model never sees it, but it tells
+    # an answer built from rows apart from one built from an empty result
+    return ToolMessage(content=result.to_prompt(), name="query_db", tool_call_id=tool_call_id,
+                       artifact={"row_count": result.row_count})
+
+
+def answer_query(messages: list[AnyMessage]) -> Tuple[Optional[dict], Optional[ToolMessage]]:
+    """
+    Finds the query an answer is based on: the last query_db call of the current turn.
+
+    Returns:
+        Tuple[Optional[dict], Optional[ToolMessage]]: The tool call and its result, either
+        None when missing.
+    """
+    turn = current_turn(messages)
+    for message in reversed(turn):
+        calls = [tc for tc in getattr(message, "tool_calls", None) or [] if tc["name"] == "query_db"]
+        if calls:
+            call = calls[-1]
+            result = next((m for m in turn if isinstance(m, ToolMessage) and m.tool_call_id == call["id"]), None)
+            return call, result
+    return None, None
+
+
+def schema_searches(message: AIMessage) -> list[dict]:
+    """The search_schema calls of a query_gen message; none when it also submits the answer."""
+    calls = message.tool_calls or []
+    if any(tc["name"] == "SubmitFinalAnswer" for tc in calls):
+        return []
+    return [tc for tc in calls if tc["name"] == "search_schema"]
+
+
+def latest_question(messages: list[AnyMessage]) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content
+    return ""
+
+
+# Characters of an earlier turn's query result kept in the prompt of a follow-up question
+PREVIOUS_RESULT_CHARS = 1000
+
+SCHEMA_TOOLS = ("list_tables", "get_full_schema")
+
+
+def turn_start(messages: list[AnyMessage]) -> int:
+    """Index of the question that starts the current turn of a conversation thread."""
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return index
+    return 0
+
+
+def current_turn(messages: list[AnyMessage]) -> list[AnyMessage]:
+    return messages[turn_start(messages):]
+
+
+def _split_turns(messages: list[AnyMessage]) -> list[list[AnyMessage]]:
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _turn_summary(turn: list[AnyMessage]) -> str:
+    queries, answer, result = {}, None, None
+    for message in turn:
+        for tc in getattr(message, "tool_calls", None) or []:
+            if tc["name"] == "query_db":
+                queries[tc["id"]] = next(iter(tc["args"].values()), "")
+            elif tc["name"] == "SubmitFinalAnswer":
+                answer = tc["args"].get("final_answer")
+        if (isinstance(message, ToolMessage) and message.tool_call_id in queries
+                and not str(message.content).startswith("Error:")):
+            result = (queries[message.tool_call_id], str(message.content))
+    parts = []
+    if result is not None:
+        sql, rows = result
+        if len(rows) > PREVIOUS_RESULT_CHARS:
+            rows = rows[:PREVIOUS_RESULT_CHARS] + " ..."
+        parts.append(f"SQL:\n{sql}\nResult:\n{rows}")
+    parts.append(f"Answer: {answer}" if answer else "Answer: (none, the question was not answered)")
+    return "\n".join(parts)
+
+
+def _schema_pairs(messages: list[AnyMessage]) -> list[AnyMessage]:
+    """The latest list_tables and get_full_schema tool calls with their results."""
+    pairs = {}
+    calls = {}
+    for message in messages:
+        for tc in getattr(message, "tool_calls", None) or []:
+            if tc["name"] in SCHEMA_TOOLS:
+                calls[tc["id"]] = message
+        if isinstance(message, ToolMessage) and message.name in SCHEMA_TOOLS and message.tool_call_id in calls:
+            call = calls[message.tool_call_id]
+            tool_call = next(tc for tc in call.tool_calls if tc["id"] == message.tool_call_id)
+            pairs[message.name] = [AIMessage(content=call.content, tool_calls=[tool_call]), message]
+    return [message for name in SCHEMA_TOOLS for message in pairs.get(name, [])]
+
+
+def turn_prompt(messages: list[AnyMessage]) -> list[AnyMessage]:
+    """
+    Builds the prompt for the current turn of a conversation thread.
+
+    Earlier turns are condensed to their question and an assistant message with the SQL,
+    its result and the answer, which keeps follow-ups short and leaves no unanswered tool
+    calls in the prompt. A turn that skipped the schema steps gets the latest earlier
+    table list and schema context instead.
+
+    Args:
+        messages (list[AnyMessage]): The whole thread, ending with the current turn.
+
+    Returns:
+        list[AnyMessage]: The messages to send to the model.
+    """
+    start = turn_start(messages)
+    if start == 0:
+        return messages
+    earlier, turn = messages[:start], messages[start:]
+    prompt = []
+    for previous in _split_turns(earlier):
+        if isinstance(previous[0], HumanMessage):
+            prompt.append(previous[0])
+        prompt.append(AIMessage(content=_turn_summary(previous)))
+    prompt.append(turn[0])
+    if not any(isinstance(m, ToolMessage) and m.name in SCHEMA_TOOLS for m in turn):
+        prompt.extend(_schema_pairs(earlier))
+    return prompt + turn[1:]
+
+
+# {dialect} and {dialect_notes} are bound per database (see dialects.py)
 query_check_prompt = ChatPromptTemplate.from_messages(
     [("system", QUERY_CHECK_SYSTEM_PROMPT), ("placeholder", "{messages}")]
 )
 
+# {examples} holds the few-shot examples retrieved for the question, {value_hints} the
+# question literals found in the value index, if any
 query_gen_prompt = ChatPromptTemplate.from_messages(
-    [("system", QUERY_GEN_SYSTEM_PROMPT), ("placeholder", "{messages}")]
+    [("system", QUERY_GEN_SYSTEM_PROMPT + "{examples}{value_hints}"), ("placeholder", "{messages}")]
+).partial(examples="", value_hints="")
+
+speculative_prompt = ChatPromptTemplate.from_messages(
+    [("system", SPECULATIVE_GEN_SYSTEM_PROMPT), ("placeholder", "{messages}")]
 )
 
-llm_query_check = ChatOpenAI(model=config["model"], temperature=0)
-llm_query_gen = ChatOpenAI(model=config["model"], temperature=0)
-llm_get_schema = ChatOpenAI(model=config["model"], temperature=0)
 
-query_check = query_check_prompt | llm_query_check.bind_tools(tools, tool_choice="auto")
-query_gen = query_gen_prompt | llm_query_gen.bind_tools([SubmitFinalAnswer])
+def wins_race(result: QueryResult) -> bool:
+    """A speculative candidate wins by returning rows without an error."""
+    return result.ok and result.row_count > 0
 
-def model_check_query(state: State) -> dict[str, list[AIMessage]]:
-    return {"messages": [query_check.invoke({"messages": [state["messages"][-1]]})]}
 
-def model_get_schema(state: State) -> dict[str, list[AIMessage]]:
-    return {"messages": [llm_get_schema.invoke(state["messages"])]}
+class SQLAgentNodes:
+    def __init__(self, database_tools: DatabaseTool, model: str, api_key: str = None,
+                 llm_factory: Optional[Callable[[str, Optional[str]], Any]] = None,
+                 candidates: int = SPECULATIVE_CANDIDATES):
+        """
+        Builds the LLM-backed graph nodes for one DatabaseTool.
 
-def query_gen_node(state: State):
-    message = query_gen.invoke(state)
+        Args:
+            database_tools (DatabaseTool): The database the nodes query.
+            model (str): OpenAI model name used by every node.
+            api_key (str, optional): OpenAI API key; falls back to OPENAI_API_KEY when omitted.
+            llm_factory (Callable, optional): Builds a chat model from (model, api_key);
+                defaults to ChatOpenAI. Used to run the graph against a local stand-in.
+            candidates (int): SQL candidates raced after a failed attempt (see speculate_node);
+                0 or 1 disables speculation.
+        """
+        self.database_tools = database_tools
+        self.db_tools = database_tools.create_tools()
+        self.tools = [self.db_tools[tool] for tool in self.db_tools]
 
-    tool_messages = []
-    if message.tool_calls:
-        for tc in message.tool_calls:
-            if tc["name"] != "SubmitFinalAnswer":
-                tool_messages.append(
-                    ToolMessage(
-                        content=f"Error: The wrong tool was called: {tc['name']}. Please fix your mistakes. Remember to only call SubmitFinalAnswer to submit the final answer. Generated queries should be outputted WITHOUT a tool call.",
-                        tool_call_id=tc["id"],
-                    )
-                )
-    return {"messages": [message] + tool_messages}
+        llm_factory = llm_factory or chat_openai
+        llm_query_check = llm_factory(model, api_key)
+        llm_query_gen = llm_factory(model, api_key)
+        llm_get_schema = llm_factory(model, api_key)
+
+        dialect = prompt_dialect(database_tools.db_type)
+        self.query_check = query_check_prompt.partial(**dialect) | llm_query_check.bind_tools(self.tools,
+                                                                                              tool_choice="auto")
+        # search_schema reaches the tables a pruned schema context leaves out
+        self.query_gen = query_gen_prompt.partial(**dialect) | llm_query_gen.bind_tools(
+            [SubmitFinalAnswer, self.db_tools["search_schema"]])
+        self.get_schema = llm_get_schema.bind_tools([self.db_tools["get_full_schema"]])
+        # Verified question -> SQL pairs of this database (see examples.py)
+        self.examples = example_index(database_tools)
+
+        self.candidates = candidates if candidates > 1 else 0
+        self.speculate = None
+        if self.candidates:
+            llm_speculate = llm_factory(model, api_key)
+            self.speculate = speculative_prompt.partial(**dialect) | llm_speculate.bind_tools(
+                [SQLCandidates], tool_choice="SQLCandidates")
+
+    def get_tool_nodes(self) -> dict[str, ToolNode]:
+        db_tools = self.db_tools
+        return {
+            "tools_node": ToolNode(self.tools),
+            "list_tables_tool_node": ToolNode([db_tools["list_tables"]]),
+            "get_table_schema_tool_node": ToolNode([db_tools["get_table_schema"]]),
+            "query_db_tool_node": ToolNode([db_tools["query_db"]]),
+            "check_query_tool_node": ToolNode([db_tools["check_query"]]),
+            "get_full_schema_tool_node": ToolNode([db_tools["get_full_schema"]]),
+        }
+
+    def schema_context_node(self, state: State) -> dict[str, list]:
+        """
+        Fast path: puts the table list and schema context into the history without an LLM call.
+
+        The messages are the same ones the agentic path produces, so query_gen sees an
+        identical conversation.
+        """
+        question = latest_question(state["messages"])
+        shared = state.get("shared_schema") or {}
+        tables = shared.get("tables") or self.database_tools.list_tables()
+        schema = shared.get("schema") or self.database_tools.get_relevant_schema(question)
+        return {"messages": self._schema_context_messages(tables, schema)}
+
+    async def aschema_context_node(self, state: State) -> dict[str, list]:
+        question = latest_question(state["messages"])
+        shared = state.get("shared_schema") or {}
+        if shared.get("tables") and shared.get("schema"):
+            return {"messages": self._schema_context_messages(shared["tables"], shared["schema"])}
+        if shared.get("tables"):
+            tables, schema = shared["tables"], await self.database_tools.aget_relevant_schema(question)
+        else:
+            tables, schema = await asyncio.gather(self.database_tools.alist_tables(),
+                                                  self.database_tools.aget_relevant_schema(question))
+        return {"messages": self._schema_context_messages(tables, schema)}
+
+    def shared_schema_context(self) -> dict:
+        """
+        Computes the schema context once for many questions against this database.
+
+        Returns:
+            dict: {"tables": ..., "schema": ...} for the State's shared_schema. "schema" is
+            None when the schema is pruned per question, which then still happens in the node.
+        """
+        tables = self.database_tools.list_tables()
+        schema = None if self.database_tools.prunes_schema else self.database_tools.full_schema
+        return {"tables": tables, "schema": schema}
+
+    def _schema_context_messages(self, tables, schema) -> list:
+        messages = []
+        for name, args, output in (("list_tables", {"input": ""}, render_tables(tables)),
+                                   ("get_full_schema", {"input": ""}, render_schema(schema))):
+            tool_call_id = f"tool_{name}"
+            messages.append(AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": tool_call_id, "type": "tool_call"}]))
+            messages.append(ToolMessage(content=output, name=name, tool_call_id=tool_call_id))
+        return messages
+
+    def reuses_schema(self, state: State) -> bool:
+        """
+        True when a follow-up question in a thread can reuse the schema context of an
+        earlier turn. Pruned schemas depend on the question, so they are fetched again.
+        """
+        if self.database_tools.prunes_schema:
+            return False
+        return any(isinstance(m, ToolMessage) and m.name == "get_full_schema" for m in state["messages"])
+
+    def get_schema_node(self, state: State) -> dict[str, list]:
+        """
+        Answers the schema tool call with only the tables relevant to the question.
+        """
+        schema = (state.get("shared_schema") or {}).get("schema")
+        if schema is None:
+            schema = self.database_tools.get_relevant_schema(latest_question(state["messages"]))
+        return self._schema_messages(state, schema)
+
+    async def aget_schema_node(self, state: State) -> dict[str, list]:
+        schema = (state.get("shared_schema") or {}).get("schema")
+        if schema is None:
+            schema = await self.database_tools.aget_relevant_schema(latest_question(state["messages"]))
+        return self._schema_messages(state, schema)
+
+    def _schema_messages(self, state: State, schema) -> dict[str, list]:
+        messages = []
+        tool_calls = getattr(state["messages"][-1], "tool_calls", None)
+        if not tool_calls:
+            # The model answered without calling the tool; fetch the schema on its behalf.
+            tool_calls = [{"name": "get_full_schema", "args": {"input": ""}, "id": "tool_schema1", "type": "tool_call"}]
+            messages.append(AIMessage(content="", tool_calls=tool_calls))
+        for tc in tool_calls:
+            messages.append(ToolMessage(content=render_schema(schema), name=tc["name"], tool_call_id=tc["id"]))
+        return {"messages": messages}
+
+    def check_query_node(self, state: State) -> dict[str, list]:
+        """
+        Validates the candidate query locally and only asks the LLM checker when undecided.
+        """
+        result = self.database_tools.validator.validate(state["messages"][-1].content)
+        if result.status == UNKNOWN:
+            return self.model_check_query(state)
+        return {"messages": self._checked_query_messages(result)}
+
+    async def acheck_query_node(self, state: State) -> dict[str, list]:
+        result = await self.database_tools._run_in_executor(
+            self.database_tools.validator.validate, state["messages"][-1].content)
+        if result.status == UNKNOWN:
+            return await self.amodel_check_query(state)
+        return {"messages": self._checked_query_messages(result)}
+
+    def _checked_query_messages(self, result: ValidationResult) -> list:
+        tool_call_id = f"tool_check_{uuid.uuid4().hex[:8]}"
+        messages = [AIMessage(content="", tool_calls=[{
+            "name": "query_db",
+            "args": {"query_string": result.sql},
+            "id": tool_call_id,
+            "type": "tool_call",
+        }])]
+        if result.status == INVALID:
+            # Answer the tool call with the error so the graph goes straight back to query_gen
+            messages.append(ToolMessage(content=f"Error: {result.message}\nPlease fix your query.",
+                                        name="query_db", tool_call_id=tool_call_id))
+        return messages
+
+    def model_check_query(self, state: State) -> dict[str, list[AIMessage]]:
+        message = self.query_check.invoke({"messages": [state["messages"][-1]]})
+        return {"messages": [message], "tokens_used": token_usage(message)}
+
+    def model_get_schema(self, state: State) -> dict[str, list[AIMessage]]:
+        message = self.get_schema.invoke(turn_prompt(state["messages"]))
+        return {"messages": [message], "tokens_used": token_usage(message)}
+
+    async def amodel_check_query(self, state: State) -> dict[str, list[AIMessage]]:
+        message = await self.query_check.ainvoke({"messages": [state["messages"][-1]]})
+        return {"messages": [message], "tokens_used": token_usage(message)}
+
+    async def amodel_get_schema(self, state: State) -> dict[str, list[AIMessage]]:
+        message = await self.get_schema.ainvoke(turn_prompt(state["messages"]))
+        return {"messages": [message], "tokens_used": token_usage(message)}
+
+    def query_gen_node(self, state: State):
+        message = self.query_gen.invoke({"messages": turn_prompt(state["messages"]), "examples": self._few_shot(state),
+                                         "value_hints": self._value_hints(state)})
+        searched = [self._run_search(tc) for tc in schema_searches(message)]
+        return self._handle_query_gen(message, state, searched)
 
+    async def aquery_gen_node(self, state: State):
+        message = await self.query_gen.ainvoke({"messages": turn_prompt(state["messages"]),
+                                                "examples": self._few_shot(state),
+                                                "value_hints": self._value_hints(state)})
+        searched = await asyncio.gather(*(self._arun_search(tc) for tc in schema_searches(message)))
+        return self._handle_query_gen(message, state, list(searched))
+
+    def _run_search(self, tool_call: dict) -> ToolMessage:
+        try:
+            return self.db_tools["search_schema"].invoke(tool_call)
+        except Exception as e:
+            return ToolMessage(content=f"Error: {e}", name="search_schema", tool_call_id=tool_call["id"])
+
+    async def _arun_search(self, tool_call: dict) -> ToolMessage:
+        try:
+            return await self.db_tools["search_schema"].ainvoke(tool_call)
+        except Exception as e:
+            return ToolMessage(content=f"Error: {e}", name="search_schema", tool_call_id=tool_call["id"])
+
+    def _few_shot(self, state: State) -> str:
+        if self.examples is None:
+            return ""
+        return render_examples(self.examples.search(latest_question(state["messages"])))
+
+    def _value_hints(self, state: State) -> str:
+        value_index = self.database_tools.value_index
+        if value_index is None:
+            return ""
+        return render_value_hints(value_index.lookup(latest_question(state["messages"])))
+
+    def template_node(self, state: State) -> dict[str, list]:
+        """
+        Answers without any LLM call when the question matches a verified one except for
+        a literal: the stored SQL runs with the new literal and the rows are the answer.
+
+        Adds nothing when no template fits or the filled-in query returns no rows, and the
+        graph continues as usual.
+        """
+        question = latest_question(state["messages"])
+        match = self.examples.match_template(question, self.database_tools.validator.dialect)
+        if match is None:
+            return {"messages": []}
+        example, sql = match
+        result = self.database_tools.query(sql, timeout=sql_timeout(state))
+        if not result.ok:
+            # The stored query stopped working, e.g. after a schema change
+            logger.info(f"Dropping example {example.question!r}: {result.error}")
+            self.examples.remove(example.question)
+            return {"messages": []}
+        if not result.row_count:
+            return {"messages": []}
+        tool_call_id = f"tool_template_{uuid.uuid4().hex[:8]}"
+        return {"messages": [
+            AIMessage(content="", tool_calls=[{"name": "query_db", "args": {"query_string": sql},
+                                               "id": tool_call_id, "type": "tool_call"}]),
+            query_result_message(result, tool_call_id),
+            AIMessage(content="", tool_calls=[{"name": "SubmitFinalAnswer",
+                                               "args": {"final_answer": result_answer(result)},
+                                               "id": f"tool_answer_{uuid.uuid4().hex[:8]}", "type": "tool_call"}]),
+        ]}
+
+    async def atemplate_node(self, state: State) -> dict[str, list]:
+        return await self.database_tools._run_in_executor(self.template_node, state)
+
+    def _remember(self, state: State) -> None:
+        """
+        Stores the question and the SQL its answer reports as an example, when
+        EXAMPLES_AUTO_SAVE is on. Otherwise only /feedback stores examples.
+
+        Only the query extract_answer reports is stored, and only if it returned rows.
+        """
+        messages = state["messages"]
+        if self.examples is None or not EXAMPLES_AUTO_SAVE or turn_start(messages):
+            # Follow-ups in a thread only make sense with the earlier turns
+            return
+        call, result = answer_query(messages)
+        if call is None or result is None or not (result.artifact or {}).get("row_count"):
+            return
+        self.database_tools.executor.submit(self.examples.add, latest_question(messages),
+                                            next(iter(call["args"].values()), ""))
+
+    def execute_query_node(self, state: State) -> dict[str, Any]:
+        """
+        Runs the checked query, capped by the SQL time and deadline left in the budget.
+        """
+        timeout = sql_timeout(state)
+        messages, started = [], time.perf_counter()
+        for tc in state["messages"][-1].tool_calls:
+            messages.append(self._query_tool_message(tc, lambda sql: self.database_tools.query(sql, timeout=timeout)))
+        return {"messages": messages, "sql_seconds": time.perf_counter() - started}
+
+    async def aexecute_query_node(self, state: State) -> dict[str, Any]:
+        timeout = sql_timeout(state)
+        messages, started = [], time.perf_counter()
+        for tc in state["messages"][-1].tool_calls:
+            result = None
+            if tc["name"] == "query_db":
+                result = await self.database_tools.aquery(next(iter(tc["args"].values()), ""), timeout=timeout)
+            messages.append(self._query_tool_message(tc, lambda sql: result))
+        return {"messages": messages, "sql_seconds": time.perf_counter() - started}
+
+    def _query_tool_message(self, tc: dict, run) -> ToolMessage:
+        if tc["name"] != "query_db":
+            content = f"Error: {tc['name']} is not a valid tool, try one of [query_db]."
+        else:
+            return query_result_message(run(next(iter(tc["args"].values()), "")), tc["id"])
+        return ToolMessage(content=content, name=tc["name"], tool_call_id=tc["id"])
+
+    def speculate_node(self, state: State) -> dict[str, Any]:
+        """
+        Retries with several SQL candidates at once instead of one.
+
+        One LLM call proposes ``candidates`` different queries; they are validated and run
+        concurrently on the SQL thread pool, the first to return rows wins and the others
+        are cancelled. The outcome is recorded as ordinary attempts (failed candidates
+        first, then the winner), so query_gen answers from it as from any executed query.
+        """
+        message = self.speculate.invoke({"messages": turn_prompt(state["messages"]), "n": self.candidates})
+        queries = self._candidate_queries(message)
+        timeout, cancel, started = sql_timeout(state), StatementCancel(), time.perf_counter()
+        outcomes, winner = {}, None
+        futures = {self.database_tools.executor.submit(self._run_candidate, sql, timeout, cancel): index
+                   for index, sql in enumerate(queries)}
+        try:
+            for future in as_completed(futures):
+                outcomes[futures[future]] = future.result()
+                if wins_race(outcomes[futures[future]][1]):
+                    winner = futures[future]
+                    break
+        finally:
+            cancel.cancel()
+        return self._speculation_update(message, outcomes, winner, time.perf_counter() - started)
+
+    async def aspeculate_node(self, state: State) -> dict[str, Any]:
+        message = await self.speculate.ainvoke({"messages": turn_prompt(state["messages"]), "n": self.candidates})
+        queries = self._candidate_queries(message)
+        timeout, cancel, started = sql_timeout(state), StatementCancel(), time.perf_counter()
+        outcomes, winner = {}, None
+        tasks = {asyncio.ensure_future(self.database_tools._run_in_executor(self._run_candidate, sql, timeout, cancel)):
+                 index for index, sql in enumerate(queries)}
+        pending = set(tasks)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    outcomes[tasks[task]] = task.result()
+                    if winner is None and wins_race(outcomes[tasks[task]][1]):
+                        winner = tasks[task]
+        finally:
+            cancel.cancel()
+            for task in pending:
+                task.cancel()
+        return self._speculation_update(message, outcomes, winner, time.perf_counter() - started)
+
+    def _candidate_queries(self, message: AIMessage) -> List[str]:
+        queries = []
+        for tc in message.tool_calls or []:
+            if tc["name"] == "SQLCandidates":
+                queries.extend(tc["args"].get("queries") or [])
+        if not queries and message.content:
+            # The model answered with a single query instead of calling the tool
+            queries = [message.content]
+        queries = [query.strip() for query in queries if isinstance(query, str) and query.strip()]
+        return list(dict.fromkeys(queries))[:self.candidates]
+
+    def _run_candidate(self, sql: str, timeout: Optional[float],
+                       cancel: StatementCancel) -> Tuple[str, QueryResult]:
+        validation = self.database_tools.validator.validate(sql)
+        if validation.status == INVALID:
+            return validation.sql, QueryResult.failed(f"{validation.message}. Please fix your query.")
+        return validation.sql, self.database_tools.query(validation.sql, timeout=timeout, cancel=cancel)
+
+    def _speculation_update(self, message: AIMessage, outcomes: Dict[int, Tuple[str, QueryResult]],
+                            winner: Optional[int], seconds: float) -> dict[str, Any]:
+        if winner is None:
+            # No candidate returned rows: an empty but error-free result is still an answer
+            winner = next((index for index in sorted(outcomes) if outcomes[index][1].ok), None)
+        messages = []
+        for index in sorted(outcomes, key=lambda index: index == winner):
+            sql, result = outcomes[index]
+            if index != winner and result.ok:
+                continue
+            tool_call_id = f"tool_speculate_{uuid.uuid4().hex[:8]}"
+            messages += [
+                AIMessage(content=sql),
+                AIMessage(content="", tool_calls=[{"name": "query_db", "args": {"query_string": sql},
+                                                   "id": tool_call_id, "type": "tool_call"}]),
+                query_result_message(result, tool_call_id),
+            ]
+        if not outcomes:
+            messages.append(AIMessage(content="Error: No candidate queries were proposed. Please write a query."))
+        return {"messages": messages, "iterations": 1, "tokens_used": token_usage(message), "sql_seconds": seconds}
+
+    def give_up_node(self, state: State) -> dict[str, Any]:
+        """
+        Ends the request with the best partial answer once the budget is spent.
+        """
+        reason = budget_exhausted(state) or "ran out of budget"
+        return {"messages": [budget_exhausted_answer(state["messages"], reason)], "budget_exhausted": reason}
+
+    def _handle_query_gen(self, message: AIMessage, state: State, searched: Optional[list] = None):
+        tool_messages = []
+        searched = {m.tool_call_id: m for m in searched or []}
+        if message.tool_calls:
+            for tc in message.tool_calls:
+                if tc["name"] == "SubmitFinalAnswer":
+                    self._remember(state)
+                elif tc["id"] in searched:
+                    tool_messages.append(searched[tc["id"]])
+                else:
+                    tool_messages.append(
+                        ToolMessage(
+                            content=f"Error: The wrong tool was called: {tc['name']}. Please fix your mistakes. Remember to only call SubmitFinalAnswer to submit the final answer. Generated queries should be outputted WITHOUT a tool call.",
+                            tool_call_id=tc["id"],
+                        )
+                    )
+        return {"messages": [message] + tool_messages, "iterations": 1, "tokens_used": token_usage(message)}
@@ -0,0 +1,261 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from .databasetools import DatabaseTool
+from .engineoptions import EngineOptions
+from .settings import REGISTRY_MAX_SIZE, REGISTRY_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionProfile(BaseModel):
+    """
+    Everything needed to connect to one database with one model.
+
+    Secrets are excluded from the repr and only enter the registry key as a digest.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    db_type: str
+    database: Optional[str] = None
+    host: Optional[str] = None
+    port: Optional[str] = None
+    user: Optional[str] = None
+    model: Optional[str] = None
+    password: Optional[str] = Field(default=None, repr=False)
+    api_key: Optional[str] = Field(default=None, repr=False)
+    engine_options: EngineOptions = Field(default_factory=EngineOptions)
+
+    @property
+    def key(self) -> Tuple[Optional[str], ...]:
+        """
+        Registry key for this profile.
+
+        Returns:
+            Tuple[Optional[str], ...]: (db_type, database, host, port, user, model, secrets digest,
+            engine options).
+        """
+        secrets = f"{self.password or ''}\x00{self.api_key or ''}".encode()
+        digest = hashlib.sha256(secrets).hexdigest()[:16]
+        options = tuple(self.engine_options.model_dump().values())
+        return (self.db_type, self.database, self.host, self.port, self.user, self.model, digest, options)
+
+
+@dataclass
+class RegistryEntry:
+    """A warm DatabaseTool together with its tool set, graph nodes and compiled graph."""
+    profile: ConnectionProfile
+    database_tools: DatabaseTool
+    tools: Dict[str, Any]
+    app: Any
+    nodes: Any = None
+    # The same graph compiled with the conversation-thread checkpointer; None if threads are disabled
+    thread_app: Any = None
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    # Requests currently using the entry; a retired entry is disposed when the last one is done
+    users: int = 0
+    retired: bool = False
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def dispose(self) -> None:
+        self.database_tools.close()
+
+    def acquire(self) -> "RegistryEntry":
+        with self._lock:
+            self.users += 1
+        return self
+
+    def release(self) -> None:
+        with self._lock:
+            self.users -= 1
+            dispose = self.retired and not self.users
+        if dispose:
+            self.dispose()
+
+    def retire(self) -> None:
+        """Disposes the entry now, or once the requests still using it have released it."""
+        with self._lock:
+            if self.retired:
+                return
+            self.retired = True
+            dispose = not self.users
+        if dispose:
+            self.dispose()
+
+
+def build_entry(profile: ConnectionProfile, llm_factory=None) -> RegistryEntry:
+    """
+    Connects to the database, reflects it and compiles the graph for a profile.
+
+    Args:
+        profile (ConnectionProfile): The connection profile to build.
+        llm_factory (Callable, optional): Builds a chat model from (model, api_key);
+            defaults to ChatOpenAI.
+
+    Returns:
+        RegistryEntry: The freshly built entry.
+    """
+    from .graph import build_app
+    from .nodes import SQLAgentNodes, chat_openai
+    from .threads import get_checkpointer
+
+    llm_factory = llm_factory or chat_openai
+    llm_db = llm_factory(profile.model, profile.api_key)
+    database_tools = DatabaseTool(llm=llm_db,
+                                  db_type=profile.db_type,
+                                  database=profile.database,
+                                  user=profile.user,
+                                  password=profile.password,
+                                  host=profile.host,
+                                  port=profile.port,
+                                  engine_options=profile.engine_options)
+    nodes = SQLAgentNodes(database_tools, model=profile.model, api_key=profile.api_key, llm_factory=llm_factory)
+    checkpointer = get_checkpointer()
+    return RegistryEntry(profile=profile,
+                         database_tools=database_tools,
+                         tools=nodes.db_tools,
+                         app=build_app(nodes),
+                         nodes=nodes,
+                         thread_app=build_app(nodes, checkpointer=checkpointer) if checkpointer else None)
+
+
+class AppRegistry:
+    """
+    Process-wide LRU/TTL cache of RegistryEntry objects keyed by ConnectionProfile.key.
+
+    Entries are built at most once per key even under concurrent requests. Evicted and
+    expired entries have their engine disposed as soon as no request holds them (see
+    acquire).
+    """
+
+    def __init__(self, max_size: int = REGISTRY_MAX_SIZE, ttl: float = REGISTRY_TTL_SECONDS,
+                 builder=build_entry):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.builder = builder
+        self._entries: "OrderedDict[tuple, RegistryEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[tuple, threading.Lock] = {}
+
+    def get(self, profile: ConnectionProfile) -> RegistryEntry:
+        """
+        Returns the warm entry for a profile, building it on first use.
+
+        Args:
+            profile (ConnectionProfile): The connection profile to look up.
+
+        Returns:
+            RegistryEntry: The entry for the profile.
+        """
+        return self._get(profile, hold=False)
+
+    def acquire(self, profile: ConnectionProfile) -> RegistryEntry:
+        """
+        Like get, but holds the entry for a request: it is not disposed, even if evicted
+        or expired meanwhile, until the request calls ``entry.release()``.
+        """
+        return self._get(profile, hold=True)
+
+    def _get(self, profile: ConnectionProfile, hold: bool) -> RegistryEntry:
+        key = profile.key
+        entry = self._lookup(key, hold)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        try:
+            with build_lock:
+                # Another request may have built it while we were waiting.
+                entry = self._lookup(key, hold)
+                if entry is not None:
+                    return entry
+                logger.info(f"Building registry entry for {profile!r}")
+                entry = self.builder(profile)
+                with self._lock:
+                    self._entries[key] = entry
+                    if hold:
+                        entry.acquire()
+                    evicted = self._evict_overflow()
+        finally:
+            # Also after a failed build, so failing profiles do not leave their lock behind
+            with self._lock:
+                self._build_locks.pop(key, None)
+        for old in evicted:
+            old.retire()
+        return entry
+
+    def peek(self, profile: ConnectionProfile) -> Optional[RegistryEntry]:
+        """Returns the entry for a profile if it is already warm, without building it."""
+        return self._lookup(profile.key, hold=False)
+
+    def evict(self, profile: ConnectionProfile) -> bool:
+        """
+        Drops a profile from the registry and disposes its engine once no request holds it.
+
+        Returns:
+            bool: True if an entry was evicted.
+        """
+        with self._lock:
+            entry = self._entries.pop(profile.key, None)
+        if entry is None:
+            return False
+        entry.retire()
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.retire()
+
+    def entries(self) -> list:
+        with self._lock:
+            return list(self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: tuple, hold: bool) -> Optional[RegistryEntry]:
+        with self._lock:
+            expired = self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                self._entries.move_to_end(key)
+                if hold:
+                    entry.acquire()
+        for old in expired:
+            logger.info(f"Registry entry for {old.profile!r} expired")
+            old.retire()
+        return entry
+
+    def _expire(self) -> list:
+        # Every idle entry past the TTL, not only the one being looked up
+        if not self.ttl:
+            return []
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items()
+                   if not entry.users and now - entry.last_used > self.ttl]
+        return [self._entries.pop(key) for key in expired]
+
+    def _evict_overflow(self) -> list:
+        evicted = []
+        while len(self._entries) > self.max_size:
+            _, entry = self._entries.popitem(last=False)
+            logger.info(f"Evicting registry entry for {entry.profile!r}")
+            evicted.append(entry)
+        return evicted
+
+
+registry = AppRegistry()
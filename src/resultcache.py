@@ -0,0 +1,228 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from sqlalchemy import text
+
+from .settings import (RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRIES,
+                       RESULT_CACHE_PROBE_INTERVAL_SECONDS, RESULT_CACHE_TTL_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+# String literals, quoted identifiers and everything in between.
+_SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\])|([^'\"`\[]+)|(.)", re.DOTALL)
+_READ_ONLY = re.compile(r"^\s*(select|with|values)\b", re.IGNORECASE)
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Canonicalizes SQL text so formatting-only differences share a cache entry.
+
+    Whitespace runs outside literals and quoted identifiers are collapsed and
+    trailing semicolons dropped; literals are left untouched.
+
+    Args:
+        sql (str): The SQL to canonicalize.
+
+    Returns:
+        str: The canonical SQL text.
+    """
+    parts = []
+    for quoted, bare, other in _SQL_TOKENS.findall(sql.strip()):
+        parts.append(quoted or other or re.sub(r"\s+", " ", bare))
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def is_read_only(sql: str) -> bool:
+    return bool(_READ_ONLY.match(sql))
+
+
+class DataVersionProbe:
+    """
+    Reports an opaque value that changes whenever the database's data may have changed.
+
+    Probes are rate limited to one real check per ``interval`` seconds.
+    """
+
+    def __init__(self, interval: float = RESULT_CACHE_PROBE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._version: Hashable = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def version(self) -> Hashable:
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at and now - self._checked_at < self.interval:
+                return self._version
+            try:
+                self._version = self._probe()
+            except Exception as e:
+                # Unknown version: never serve a cached result against it.
+                logger.warning(f"Data version probe failed: {e}")
+                self._version = object()
+            self._checked_at = now
+            return self._version
+
+    def _probe(self) -> Hashable:
+        raise NotImplementedError
+
+
+class StaticDataVersion(DataVersionProbe):
+    """Fallback for dialects without a cheap change counter: entries only expire via TTL."""
+
+    def _probe(self) -> Hashable:
+        return 0
+
+
+class SQLiteDataVersion(DataVersionProbe):
+    """
+    Uses the database and WAL file mtimes and sizes.
+
+    ``PRAGMA data_version`` is only meaningful per connection, and pooled connections
+    rotate, so the files themselves are the cheaper and more reliable signal.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def _probe(self) -> Hashable:
+        version = []
+        for path in (self.path, f"{self.path}-wal"):
+            try:
+                st = os.stat(path)
+                version.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+
+class PostgresDataVersion(DataVersionProbe):
+    """Uses the per-database tuple write counters from pg_stat_database."""
+
+    QUERY = text(
+        "SELECT tup_inserted + tup_updated + tup_deleted, stats_reset "
+        "FROM pg_stat_database WHERE datname = current_database()"
+    )
+
+    def __init__(self, engine: Any, **kwargs):
+        super().__init__(**kwargs)
+        self.engine = engine
+
+    def _probe(self) -> Hashable:
+        with self.engine.connect() as conn:
+            return tuple(conn.execute(self.QUERY).one())
+
+
+def make_data_version_probe(db_type: str, engine: Any, database: Optional[str]) -> DataVersionProbe:
+    """
+    Picks the cheapest reliable change detector for a dialect.
+
+    Args:
+        db_type (str): DatabaseTool.db_type.
+        engine: The SQLAlchemy engine.
+        database (str, optional): Database name or SQLite file path.
+
+    Returns:
+        DataVersionProbe: The probe to use.
+    """
+    if db_type == "sqlite" and database and database != ":memory:":
+        return SQLiteDataVersion(database)
+    if db_type == "postgresql":
+        return PostgresDataVersion(engine)
+    return StaticDataVersion()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 max_bytes: int = RESULT_CACHE_MAX_BYTES, ttl: float = RESULT_CACHE_TTL_SECONDS):
+        """
+        Process-wide LRU cache of SQL results keyed on (connection, canonical SQL).
+
+        An entry is only served while the connection's data version matches the one
+        recorded when it was stored, and never after ``ttl`` seconds.
+
+        Args:
+            max_entries (int): Maximum number of cached results.
+            max_bytes (int): Maximum total size of cached results, in characters.
+            ttl (float): Upper bound on entry age in seconds; 0 disables expiry.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope: str, sql: str, version: Hashable) -> Optional[Any]:
+        key = (scope, canonicalize_sql(sql))
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                result, stored_version, size, expires_at = item
+                if stored_version == version and (not expires_at or expires_at > time.monotonic()):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, scope: str, sql: str, version: Hashable, result: Any) -> None:
+        size = len(str(result))
+        if size > self.max_bytes:
+            return
+        key = (scope, canonicalize_sql(sql))
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, version, size, expires_at)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def get_or_run(self, scope: str, sql: str, probe: DataVersionProbe,
+                   run: Callable[[str], Any], cacheable: Callable[[Any], bool] = lambda result: True) -> Any:
+        """
+        Serves a read-only query from the cache or runs it and stores the result.
+
+        Args:
+            scope (str): Identifies the connection, e.g. the engine URL without password.
+            sql (str): The SQL to run.
+            probe (DataVersionProbe): Data version probe for the connection.
+            run: Executes the SQL and returns its result.
+            cacheable: Decides whether a result may be stored (e.g. not an error).
+
+        Returns:
+            Any: The query result.
+        """
+        if not is_read_only(sql):
+            return run(sql)
+        version = probe.version()
+        result = self.get(scope, sql, version)
+        if result is not None:
+            return result
+        result = run(sql)
+        if cacheable(result):
+            self.put(scope, sql, version, result)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: tuple) -> None:
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+result_cache = ResultCache()
@@ -0,0 +1,253 @@
+import csv
+import io
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_community.utilities.sql_database import truncate_word
+
+from .resultcache import canonicalize_sql
+from .settings import (RESULT_PREVIEW_MAX_BYTES, RESULT_PREVIEW_MAX_ROWS,
+                       RESULT_STORE_MAX_ENTRIES, RESULT_STORE_TTL_SECONDS)
+
+# Same per-value cap the SQLDatabase toolkit applies to what the model sees.
+MAX_STRING_LENGTH = 300
+
+
+class QueryResult:
+    def __init__(self, columns: Sequence[str], rows: List[tuple], row_count: int,
+                 exact_count: bool = True, max_rows: int = RESULT_PREVIEW_MAX_ROWS,
+                 max_bytes: int = RESULT_PREVIEW_MAX_BYTES, error: Optional[str] = None,
+                 notice: Optional[str] = None):
+        """
+        Bounded preview of a query result.
+
+        Args:
+            columns (Sequence[str]): Column names.
+            rows (List[tuple]): The first rows, at most ``max_rows`` of them.
+            row_count (int): Rows the query returned, or a lower bound when not exact.
+            exact_count (bool): False when counting stopped before the end of the result.
+            max_rows (int): Rows shown to the model.
+            max_bytes (int): Characters of row data shown to the model.
+            error (str, optional): Why the query did not run; the result is then empty.
+            notice (str, optional): A note for the model shown after the rows.
+        """
+        self.columns = list(columns)
+        self.rows = rows
+        self.row_count = row_count
+        self.exact_count = exact_count
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.error = error
+        self.notice = notice
+
+    @classmethod
+    def failed(cls, error: str) -> "QueryResult":
+        return cls([], [], 0, error=error)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def truncated(self) -> bool:
+        return self.row_count > len(self.rows) or not self.exact_count
+
+    def to_prompt(self) -> str:
+        """
+        Renders the preview the way the SQLDatabase toolkit renders results, so prompts
+        are unchanged for small results, with a row-count note when rows were left out.
+
+        Returns:
+            str: The preview text, or "Error: ..." for a failed query.
+        """
+        if self.error is not None:
+            return f"Error: {self.error}"
+        parts, size = [], 2
+        for row in self.rows[:self.max_rows]:
+            text = repr(tuple(truncate_word(value, length=MAX_STRING_LENGTH) for value in row))
+            if parts and size + len(text) > self.max_bytes:
+                break
+            parts.append(text[:self.max_bytes])
+            size += len(text) + 2
+        preview = "[" + ", ".join(parts) + "]" if parts else ""
+        if parts and (len(parts) < self.row_count or not self.exact_count):
+            total = f"{self.row_count}" if self.exact_count else f"more than {self.row_count}"
+            preview += f"\n(Showing the first {len(parts)} of {total} rows.)"
+        if self.notice:
+            preview = f"{preview}\n{self.notice}" if preview else self.notice
+        return preview
+
+    def __str__(self) -> str:
+        return self.to_prompt()
+
+
+class StoredResult:
+    def __init__(self, database_tools: Any, sql: str, key: Tuple[str, str]):
+        """
+        What is needed to stream a full result again: the database and the SQL.
+
+        Only a weak reference to the DatabaseTool is kept, so an evicted connection is
+        not held open by old result ids.
+        """
+        self._database_tools = weakref.ref(database_tools)
+        self.sql = sql
+        self.key = key
+        self.created_at = time.monotonic()
+
+    @property
+    def database_tools(self) -> Optional[Any]:
+        return self._database_tools()
+
+
+class ResultStore:
+    def __init__(self, max_entries: int = RESULT_STORE_MAX_ENTRIES, ttl: float = RESULT_STORE_TTL_SECONDS):
+        """
+        Maps result ids to the query that produced them, for paged full-result export.
+
+        Rows are not kept: an export re-runs the query and streams it, so memory use does
+        not grow with result size. Ids are random, so they cannot be derived from the
+        database and the SQL; the id works as a capability for the result.
+
+        Args:
+            max_entries (int): Maximum number of result ids remembered.
+            ttl (float): Seconds a result id stays valid; 0 disables expiry.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, StoredResult]" = OrderedDict()
+        # (scope, canonical SQL) -> id, so a repeated query keeps its id
+        self._ids: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def _drop(self, result_id: str) -> None:
+        stored = self._entries.pop(result_id)
+        if self._ids.get(stored.key) == result_id:
+            del self._ids[stored.key]
+
+    def register(self, database_tools: Any, sql: str) -> str:
+        """
+        Remembers a query and returns its result id; the same query on the same database
+        keeps its id while it is remembered.
+
+        Args:
+            database_tools (DatabaseTool): The database the query runs against.
+            sql (str): The query.
+
+        Returns:
+            str: The result id.
+        """
+        key = (database_tools.cache_scope, canonicalize_sql(sql))
+        with self._lock:
+            result_id = self._ids.get(key)
+            if result_id is not None:
+                self._drop(result_id)
+            else:
+                result_id = secrets.token_urlsafe(24)
+            self._entries[result_id] = StoredResult(database_tools, sql, key)
+            self._ids[key] = result_id
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+        return result_id
+
+    def get(self, result_id: str) -> Optional[StoredResult]:
+        with self._lock:
+            stored = self._entries.get(result_id)
+            if stored is None:
+                return None
+            if (self.ttl and time.monotonic() - stored.created_at > self.ttl) or stored.database_tools is None:
+                self._drop(result_id)
+                return None
+            self._entries.move_to_end(result_id)
+            return stored
+
+
+def iter_csv(columns: Sequence[str], batches: Iterable[List[tuple]]) -> Iterator[str]:
+    """
+    Encodes row batches as CSV, one chunk per batch.
+
+    Args:
+        columns (Sequence[str]): Header row.
+        batches (Iterable[List[tuple]]): Row batches.
+
+    Yields:
+        str: CSV text.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _arrow_array(pa: Any, values: list, type_: Any = None) -> Any:
+    if type_ is not None and pa.types.is_string(type_):
+        return pa.array([None if v is None else str(v) for v in values], type=type_)
+    try:
+        array = pa.array(values, type=type_)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        if type_ is not None:
+            raise
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+    if type_ is None and pa.types.is_null(array.type):
+        # Nothing to infer from yet; strings accept whatever later batches hold.
+        return pa.array(values, type=pa.string())
+    return array
+
+
+def iter_arrow(columns: Sequence[str], batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """
+    Encodes row batches as an Arrow IPC stream.
+
+    Column types are inferred from the first batch; columns that are empty or mixed
+    there are sent as strings.
+
+    Args:
+        columns (Sequence[str]): Column names.
+        batches (Iterable[List[tuple]]): Row batches.
+
+    Yields:
+        bytes: Arrow IPC stream chunks.
+
+    Raises:
+        ImportError: If pyarrow is not installed.
+    """
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+
+    def flush() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    for batch in batches:
+        values = list(zip(*batch)) if batch else [()] * len(columns)
+        if schema is None:
+            arrays = [_arrow_array(pa, list(column)) for column in values]
+            schema = pa.schema([pa.field(name, array.type) for name, array in zip(columns, arrays)])
+            writer = pa.ipc.new_stream(sink, schema)
+        else:
+            arrays = [_arrow_array(pa, list(column), field.type) for column, field in zip(values, schema)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield flush()
+
+    if writer is None:
+        schema = pa.schema([pa.field(name, pa.string()) for name in columns])
+        writer = pa.ipc.new_stream(sink, schema)
+    writer.close()
+    yield flush()
+
+
+result_store = ResultStore()
@@ -0,0 +1,192 @@
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .settings import SCHEMA_MAX_TABLES, SCHEMA_TOP_K
+
+logger = logging.getLogger(__name__)
+
+# Field weights: a hit on a table name says more than a hit on a column or comment.
+TABLE_WEIGHT = 3.0
+COLUMN_WEIGHT = 1.0
+COMMENT_WEIGHT = 0.5
+# Weight of fuzzy trigram matches relative to exact token matches.
+TRIGRAM_WEIGHT = 0.5
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "did", "do", "does", "for", "from", "give",
+    "has", "have", "how", "i", "in", "is", "it", "list", "me", "many", "most", "of", "on",
+    "or", "show", "the", "their", "there", "to", "was", "were", "what", "which", "who",
+    "whom", "with", "all", "about", "details", "top", "than", "that", "this", "those",
+}
+_SUFFIXES = ("ings", "ing", "ers", "ies", "ed", "er", "es", "s")
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits identifiers and prose into lowercase stemmed tokens.
+
+    CamelCase, snake_case and digits are split, so "InvoiceLine" and "invoice_line"
+    both become ["invoice", "line"].
+
+    Args:
+        text (str): Identifier or free text.
+
+    Returns:
+        List[str]: The tokens, stopwords removed.
+    """
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text or "")
+    text = re.sub(r"([A-Z]+)([A-Z][a-z])", r"\1 \2", text)
+    words = re.findall(r"[a-z]+|\d+", text.lower())
+    return [_stem(w) for w in words if w not in _STOPWORDS]
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TableDoc:
+    def __init__(self, name: str, columns: Iterable[str] = (), comments: Iterable[str] = (),
+                 references: Iterable[str] = ()):
+        """
+        Searchable description of one table.
+
+        Args:
+            name (str): Table name.
+            columns (Iterable[str]): Column names.
+            comments (Iterable[str]): Table and column comments.
+            references (Iterable[str]): Names of tables this table has foreign keys to.
+        """
+        self.name = name
+        self.columns = list(columns)
+        self.references = set(references)
+        self.fields: Dict[str, float] = defaultdict(float)
+        for token in tokenize(name):
+            self.fields[token] = max(self.fields[token], TABLE_WEIGHT)
+        for column in self.columns:
+            for token in tokenize(column):
+                self.fields[token] = max(self.fields[token], COLUMN_WEIGHT)
+        for comment in comments:
+            for token in tokenize(comment):
+                self.fields[token] = max(self.fields[token], COMMENT_WEIGHT)
+
+
+class SchemaIndex:
+    def __init__(self, tables: Iterable[TableDoc]):
+        """
+        Lexical index over table names, column names, comments and the foreign-key graph.
+
+        Args:
+            tables (Iterable[TableDoc]): The tables to index.
+        """
+        self.tables: Dict[str, TableDoc] = {table.name: table for table in tables}
+        self.postings: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+        self.trigram_postings: Dict[str, Set[str]] = defaultdict(set)
+        self.neighbours: Dict[str, Set[str]] = defaultdict(set)
+
+        for table in self.tables.values():
+            for token, weight in table.fields.items():
+                self.postings[token].append((table.name, weight))
+            for ref in table.references:
+                if ref in self.tables:
+                    self.neighbours[table.name].add(ref)
+                    self.neighbours[ref].add(table.name)
+
+        n = max(len(self.tables), 1)
+        self.idf = {token: math.log(1 + n / len(posting)) for token, posting in self.postings.items()}
+        for token in self.postings:
+            for gram in trigrams(token):
+                self.trigram_postings[gram].add(token)
+
+    @classmethod
+    def from_metadata(cls, metadata, table_names: Optional[Iterable[str]] = None) -> "SchemaIndex":
+        """
+        Builds the index from reflected SQLAlchemy MetaData.
+
+        Args:
+            metadata (sqlalchemy.MetaData): Reflected metadata.
+            table_names (Iterable[str], optional): Restrict the index to these tables.
+        """
+        allowed = set(table_names) if table_names is not None else None
+        docs = []
+        for table in metadata.sorted_tables:
+            if allowed is not None and table.name not in allowed:
+                continue
+            comments = [table.comment] if table.comment else []
+            comments += [column.comment for column in table.columns if column.comment]
+            references = {fk.column.table.name for fk in table.foreign_keys}
+            docs.append(TableDoc(table.name, [c.name for c in table.columns], comments, references))
+        return cls(docs)
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Returns indexed tokens matching a query token, with a similarity in (0, 1]."""
+        if token in self.postings:
+            return [(token, 1.0)]
+        grams = trigrams(token)
+        candidates = Counter()
+        for gram in grams:
+            for indexed in self.trigram_postings.get(gram, ()):
+                candidates[indexed] += 1
+        matches = []
+        for indexed, shared in candidates.items():
+            similarity = shared / len(grams | trigrams(indexed))
+            if similarity >= 0.4:
+                matches.append((indexed, similarity * TRIGRAM_WEIGHT))
+        return matches
+
+    def search(self, question: str, k: int = SCHEMA_TOP_K) -> List[Tuple[str, float]]:
+        """
+        Scores tables against a question.
+
+        Args:
+            question (str): The user question.
+            k (int): Number of tables to return.
+
+        Returns:
+            List[Tuple[str, float]]: Up to k (table name, score) pairs, best first.
+        """
+        scores: Dict[str, float] = defaultdict(float)
+        for token in set(tokenize(question)):
+            for indexed, similarity in self._expand(token):
+                idf = self.idf[indexed]
+                for table, weight in self.postings[indexed]:
+                    scores[table] += similarity * idf * weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:k]
+
+    def relevant_tables(self, question: str, k: int = SCHEMA_TOP_K,
+                        max_tables: int = SCHEMA_MAX_TABLES) -> List[str]:
+        """
+        Picks the top-k tables for a question plus their foreign-key neighbours.
+
+        Args:
+            question (str): The user question.
+            k (int): Number of directly matched tables.
+            max_tables (int): Upper bound on the result including neighbours.
+
+        Returns:
+            List[str]: Table names, most relevant first. Falls back to the most connected
+            tables when nothing in the question matches.
+        """
+        hits = [name for name, _ in self.search(question, k)]
+        if not hits:
+            hits = sorted(self.tables, key=lambda name: (-len(self.neighbours[name]), name))[:k]
+
+        selected = list(hits)
+        for name in hits:
+            for neighbour in sorted(self.neighbours[name]):
+                if len(selected) >= max_tables:
+                    return selected
+                if neighbour not in selected:
+                    selected.append(neighbour)
+        return selected[:max_tables]
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import MetaData, inspect
+
+from .settings import SCHEMA_SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pickled layout changes so old snapshots are ignored instead of misread.
+SNAPSHOT_VERSION = 2
+
+
+def table_fingerprints(engine: Any, table_names: Optional[list] = None) -> Dict[str, str]:
+    """
+    Hashes each table's definition (columns, types, primary and foreign keys) from the catalog.
+
+    This only reads catalog metadata in bulk, which is far cheaper than full reflection
+    plus sample-row queries.
+
+    Args:
+        engine: The SQLAlchemy engine.
+        table_names (list, optional): Tables to fingerprint; defaults to all tables.
+
+    Returns:
+        Dict[str, str]: Table name to definition hash.
+    """
+    inspector = inspect(engine)
+    names = table_names if table_names is not None else inspector.get_table_names()
+    if not names:
+        return {}
+    columns = inspector.get_multi_columns(filter_names=names)
+    pks = inspector.get_multi_pk_constraint(filter_names=names)
+    fks = inspector.get_multi_foreign_keys(filter_names=names)
+
+    fingerprints = {}
+    for name in names:
+        key = (None, name)
+        payload = json.dumps([
+            [(c["name"], str(c["type"]), c.get("nullable"), c.get("comment")) for c in columns.get(key, [])],
+            pks.get(key),
+            fks.get(key),
+        ], sort_keys=True, default=str)
+        fingerprints[name] = hashlib.sha256(payload.encode()).hexdigest()
+    return fingerprints
+
+
+class SchemaSnapshot:
+    def __init__(self, metadata: MetaData, tables: Dict[str, Tuple[str, str]], sampled_at: Optional[float] = None):
+        """
+        Reflected schema plus the rendered table info of every table.
+
+        Args:
+            metadata (MetaData): Reflected SQLAlchemy metadata.
+            tables (Dict[str, Tuple[str, str]]): Table name to (definition fingerprint, table info).
+            sampled_at (float, optional): Unix time the sample rows of all tables were last
+                read; defaults to now.
+        """
+        self.version = SNAPSHOT_VERSION
+        self.metadata = metadata
+        self.tables = tables
+        self.created_at = time.time()
+        self.sampled_at = sampled_at if sampled_at is not None else self.created_at
+
+    @property
+    def table_info(self) -> Dict[str, str]:
+        return {name: info for name, (_, info) in self.tables.items()}
+
+    @property
+    def fingerprints(self) -> Dict[str, str]:
+        return {name: fingerprint for name, (fingerprint, _) in self.tables.items()}
+
+
+class SchemaSnapshotStore:
+    # Version a stored object must carry to be loaded
+    version = SNAPSHOT_VERSION
+
+    def __init__(self, path: str):
+        """
+        Reads and writes the schema snapshot of one connection.
+
+        Args:
+            path (str): Snapshot file path.
+        """
+        self.path = path
+
+    @classmethod
+    def for_scope(cls, scope: str, directory: str = SCHEMA_SNAPSHOT_DIR) -> Optional["SchemaSnapshotStore"]:
+        """
+        Returns the store for a connection, or None when snapshots are disabled.
+
+        Args:
+            scope (str): Connection identity, e.g. the engine URL without password.
+            directory (str): Snapshot directory; empty disables snapshots.
+        """
+        if not directory:
+            return None
+        name = hashlib.sha256(scope.encode()).hexdigest()[:32]
+        return cls(os.path.join(directory, f"{name}.pickle"))
+
+    def load(self) -> Optional[SchemaSnapshot]:
+        try:
+            with open(self.path, "rb") as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable schema snapshot {self.path}: {e}")
+            return None
+        if getattr(snapshot, "version", None) != self.version:
+            return None
+        return snapshot
+
+    def save(self, snapshot: SchemaSnapshot) -> None:
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial snapshot.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,180 @@
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Maximum number of connection profiles kept warm in the registry.
+REGISTRY_MAX_SIZE = _env_int("SEAQUILLER_REGISTRY_MAX_SIZE", 16)
+# Seconds an idle registry entry is kept before its engine is disposed.
+REGISTRY_TTL_SECONDS = _env_float("SEAQUILLER_REGISTRY_TTL_SECONDS", 3600.0)
+
+# Worker threads per DatabaseTool for running blocking SQL from the async path.
+SQL_MAX_WORKERS = _env_int("SEAQUILLER_SQL_MAX_WORKERS", 8)
+# Questions a single process answers concurrently; further requests wait for a slot.
+MAX_CONCURRENT_QUERIES = _env_int("SEAQUILLER_MAX_CONCURRENT_QUERIES", 32)
+# Seconds a request may wait for a free slot before being rejected with 503.
+QUERY_QUEUE_TIMEOUT_SECONDS = _env_float("SEAQUILLER_QUERY_QUEUE_TIMEOUT_SECONDS", 30.0)
+
+# Answer cache backend: "memory", "sqlite" or "none".
+ANSWER_CACHE_BACKEND = os.getenv("SEAQUILLER_ANSWER_CACHE", "memory").lower()
+# SQLite file used when the answer cache backend is "sqlite".
+ANSWER_CACHE_PATH = os.getenv("SEAQUILLER_ANSWER_CACHE_PATH", ".seaquiller/answers.sqlite3")
+# Seconds a cached answer stays valid; 0 keeps it until evicted or the schema changes.
+ANSWER_CACHE_TTL_SECONDS = _env_float("SEAQUILLER_ANSWER_CACHE_TTL_SECONDS", 3600.0)
+# Maximum number of cached answers.
+ANSWER_CACHE_MAX_ENTRIES = _env_int("SEAQUILLER_ANSWER_CACHE_MAX_ENTRIES", 1024)
+
+# Maximum number of cached SQL results across all connections.
+RESULT_CACHE_MAX_ENTRIES = _env_int("SEAQUILLER_RESULT_CACHE_MAX_ENTRIES", 512)
+# Maximum total size of cached SQL results, in characters.
+RESULT_CACHE_MAX_BYTES = _env_int("SEAQUILLER_RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+# Upper bound on the age of a cached SQL result; the only invalidation for dialects without a change counter.
+RESULT_CACHE_TTL_SECONDS = _env_float("SEAQUILLER_RESULT_CACHE_TTL_SECONDS", 300.0)
+# Minimum seconds between two data-version checks of the same connection.
+RESULT_CACHE_PROBE_INTERVAL_SECONDS = _env_float("SEAQUILLER_RESULT_CACHE_PROBE_INTERVAL_SECONDS", 1.0)
+
+# Databases with more tables than this get a question-specific schema instead of the full dump.
+SCHEMA_PRUNE_MIN_TABLES = _env_int("SEAQUILLER_SCHEMA_PRUNE_MIN_TABLES", 30)
+# Tables matched directly against the question when pruning the schema.
+SCHEMA_TOP_K = _env_int("SEAQUILLER_SCHEMA_TOP_K", 8)
+# Upper bound on tables in a pruned schema, foreign-key neighbours included.
+SCHEMA_MAX_TABLES = _env_int("SEAQUILLER_SCHEMA_MAX_TABLES", 20)
+
+# Directory for reflected-schema snapshots that make restarts warm; empty disables them.
+SCHEMA_SNAPSHOT_DIR = os.getenv("SEAQUILLER_SCHEMA_SNAPSHOT_DIR", ".seaquiller/snapshots")
+# Seconds after which a warm start re-reads the sample rows of every table; 0 keeps the saved ones.
+SCHEMA_SAMPLE_REFRESH_SECONDS = _env_float("SEAQUILLER_SCHEMA_SAMPLE_REFRESH_SECONDS", 0.0)
+
+# "fast" injects the table list and schema without an LLM call; "agentic" asks the model for it.
+GRAPH_MODE = os.getenv("SEAQUILLER_GRAPH_MODE", "fast").lower()
+
+# "local" validates generated SQL against the schema and EXPLAIN, using the LLM only when undecided; "llm" always uses the LLM checker.
+QUERY_CHECK_MODE = os.getenv("SEAQUILLER_QUERY_CHECK_MODE", "local").lower()
+
+# Default per-request budget; requests may lower it and 0 means unlimited.
+BUDGET_MAX_ITERATIONS = _env_int("SEAQUILLER_BUDGET_MAX_ITERATIONS", 8)
+BUDGET_TIMEOUT_SECONDS = _env_float("SEAQUILLER_BUDGET_TIMEOUT_SECONDS", 120.0)
+BUDGET_MAX_TOKENS = _env_int("SEAQUILLER_BUDGET_MAX_TOKENS", 0)
+BUDGET_MAX_SQL_SECONDS = _env_float("SEAQUILLER_BUDGET_MAX_SQL_SECONDS", 30.0)
+# Highest budget a request may ask for, by default the defaults above; 0 lets requests ask for unlimited.
+BUDGET_MAX_ITERATIONS_LIMIT = _env_int("SEAQUILLER_BUDGET_MAX_ITERATIONS_LIMIT", BUDGET_MAX_ITERATIONS)
+BUDGET_TIMEOUT_SECONDS_LIMIT = _env_float("SEAQUILLER_BUDGET_TIMEOUT_SECONDS_LIMIT", BUDGET_TIMEOUT_SECONDS)
+BUDGET_MAX_TOKENS_LIMIT = _env_int("SEAQUILLER_BUDGET_MAX_TOKENS_LIMIT", BUDGET_MAX_TOKENS)
+BUDGET_MAX_SQL_SECONDS_LIMIT = _env_float("SEAQUILLER_BUDGET_MAX_SQL_SECONDS_LIMIT", BUDGET_MAX_SQL_SECONDS)
+
+# Rows and characters of a query result shown to the model; the rest is only counted.
+RESULT_PREVIEW_MAX_ROWS = _env_int("SEAQUILLER_RESULT_PREVIEW_MAX_ROWS", 20)
+RESULT_PREVIEW_MAX_BYTES = _env_int("SEAQUILLER_RESULT_PREVIEW_MAX_BYTES", 8192)
+# Rows counted past the preview before the count is reported as a lower bound.
+RESULT_COUNT_MAX_ROWS = _env_int("SEAQUILLER_RESULT_COUNT_MAX_ROWS", 10000)
+# Rows fetched from the cursor per round trip.
+RESULT_FETCH_BATCH_SIZE = _env_int("SEAQUILLER_RESULT_FETCH_BATCH_SIZE", 1000)
+# Result ids remembered for /results export, and for how long.
+RESULT_STORE_MAX_ENTRIES = _env_int("SEAQUILLER_RESULT_STORE_MAX_ENTRIES", 1024)
+RESULT_STORE_TTL_SECONDS = _env_float("SEAQUILLER_RESULT_STORE_TTL_SECONDS", 3600.0)
+# Default and largest page size of /results exports.
+RESULT_PAGE_SIZE = _env_int("SEAQUILLER_RESULT_PAGE_SIZE", 10000)
+RESULT_PAGE_MAX_SIZE = _env_int("SEAQUILLER_RESULT_PAGE_MAX_SIZE", 100000)
+
+# Questions accepted by one /query/batch call, and how many of them run at once by default.
+BATCH_MAX_QUESTIONS = _env_int("SEAQUILLER_BATCH_MAX_QUESTIONS", 1000)
+BATCH_CONCURRENCY = _env_int("SEAQUILLER_BATCH_CONCURRENCY", 8)
+
+# Requests slower than this many seconds are logged with their SQL and per-stage timings; 0 disables the log.
+SLOW_REQUEST_SECONDS = _env_float("SEAQUILLER_SLOW_REQUEST_SECONDS", 0.0)
+
+# Connection pool of each profile; profiles may override these per request.
+POOL_SIZE = _env_int("SEAQUILLER_POOL_SIZE", SQL_MAX_WORKERS)
+POOL_MAX_OVERFLOW = _env_int("SEAQUILLER_POOL_MAX_OVERFLOW", 4)
+POOL_TIMEOUT_SECONDS = _env_float("SEAQUILLER_POOL_TIMEOUT_SECONDS", 30.0)
+# Connections older than this are reopened, before a server or proxy idle timeout drops them; -1 never.
+POOL_RECYCLE_SECONDS = _env_int("SEAQUILLER_POOL_RECYCLE_SECONDS", 1800)
+POOL_PRE_PING = _env_bool("SEAQUILLER_POOL_PRE_PING", True)
+# Largest pool a request's engine_options may ask for.
+POOL_SIZE_LIMIT = _env_int("SEAQUILLER_POOL_SIZE_LIMIT", max(POOL_SIZE, 32))
+POOL_MAX_OVERFLOW_LIMIT = _env_int("SEAQUILLER_POOL_MAX_OVERFLOW_LIMIT", max(POOL_MAX_OVERFLOW, 16))
+# Open database sessions read-only; the generated SQL never needs to write. Requests cannot turn it off.
+DB_READ_ONLY = _env_bool("SEAQUILLER_DB_READ_ONLY", True)
+# Time limit for any single statement, applied by the database; 0 disables it. Requests may only lower it.
+SQL_STATEMENT_TIMEOUT_SECONDS = _env_float("SEAQUILLER_SQL_STATEMENT_TIMEOUT_SECONDS", 60.0)
+
+# Cost guard for generated SQL: "limit" adds a LIMIT when that makes an expensive query cheap and
+# rejects it otherwise, "reject" always rejects, "off" runs everything.
+SQL_GUARD_MODE = os.getenv("SEAQUILLER_SQL_GUARD_MODE", "limit").lower()
+# Largest row estimate any step of the EXPLAIN plan may have; 0 disables the check.
+SQL_GUARD_MAX_ROWS = _env_float("SEAQUILLER_SQL_GUARD_MAX_ROWS", 50_000_000)
+# Largest PostgreSQL/MySQL planner cost; 0 disables the check.
+SQL_GUARD_MAX_COST = _env_float("SEAQUILLER_SQL_GUARD_MAX_COST", 10_000_000)
+# Rows kept when the guard adds a LIMIT.
+SQL_GUARD_LIMIT = _env_int("SEAQUILLER_SQL_GUARD_LIMIT", 1000)
+
+# Connection profiles to connect, reflect and compile in the background at startup: a JSON list
+# of /query connection fields, or the path of a JSON file with one.
+WARMUP_PROFILES = os.getenv("SEAQUILLER_WARMUP_PROFILES", "")
+
+# SQLite file holding conversation threads (LangGraph checkpoints); empty disables thread_id support.
+THREADS_PATH = os.getenv("SEAQUILLER_THREADS_PATH", ".seaquiller/threads.sqlite3")
+# Threads not continued for this long are deleted with their checkpoints; 0 disables the TTL.
+THREADS_TTL_SECONDS = _env_float("SEAQUILLER_THREADS_TTL_SECONDS", 7 * 86400.0)
+# Threads kept, most recently continued first; older ones are deleted. 0 is unlimited.
+THREADS_MAX_ENTRIES = _env_int("SEAQUILLER_THREADS_MAX_ENTRIES", 10000)
+
+# Approximate tokens of any one tool result (query rows, errors) kept in the history; 0 keeps them whole.
+TOOL_RESULT_MAX_TOKENS = _env_int("SEAQUILLER_TOOL_RESULT_MAX_TOKENS", 1000)
+
+# SQL candidates proposed at once after a failed attempt; they run concurrently and the first
+# non-empty result wins. 0 or 1 keeps the one-query-at-a-time retry loop.
+SPECULATIVE_CANDIDATES = _env_int("SEAQUILLER_SPECULATIVE_CANDIDATES", 0)
+
+# SQLite file of verified question -> SQL pairs per database, used as few-shot examples and
+# templates; empty disables both.
+EXAMPLES_PATH = os.getenv("SEAQUILLER_EXAMPLES_PATH", ".seaquiller/examples.sqlite3")
+# Pairs kept per database, newest first.
+EXAMPLES_MAX_ENTRIES = _env_int("SEAQUILLER_EXAMPLES_MAX_ENTRIES", 500)
+# Few-shot examples added to the query_gen prompt, and the similarity they need (0-1).
+EXAMPLES_TOP_K = _env_int("SEAQUILLER_EXAMPLES_TOP_K", 3)
+EXAMPLES_MIN_SIMILARITY = _env_float("SEAQUILLER_EXAMPLES_MIN_SIMILARITY", 0.3)
+# Store every answered question automatically; otherwise only pairs confirmed through /feedback are kept.
+EXAMPLES_AUTO_SAVE = _env_bool("SEAQUILLER_EXAMPLES_AUTO_SAVE", False)
+# Answer questions that match a stored one except for a literal by running its SQL with the new
+# literal, without any LLM call.
+TEMPLATE_REUSE = _env_bool("SEAQUILLER_TEMPLATE_REUSE", True)
+
+# Directory for the persisted column-value index of each database; empty keeps it in memory only.
+VALUE_INDEX_DIR = os.getenv("SEAQUILLER_VALUE_INDEX_DIR", ".seaquiller/values")
+# Bytes of distinct text values indexed per database, across all columns; 0 disables the index.
+VALUE_INDEX_MAX_BYTES = _env_int("SEAQUILLER_VALUE_INDEX_MAX_BYTES", 1000000)
+# Text columns with more distinct values than this (names, free text) are not indexed.
+VALUE_INDEX_MAX_DISTINCT = _env_int("SEAQUILLER_VALUE_INDEX_MAX_DISTINCT", 1000)
+# Minimum seconds between two refreshes; a refresh rescans only tables whose definition or data changed.
+VALUE_INDEX_REFRESH_SECONDS = _env_float("SEAQUILLER_VALUE_INDEX_REFRESH_SECONDS", 600.0)
+
+# Provider budgets shared by all requests using the same API key and model; 0 disables a budget.
+LLM_REQUESTS_PER_MINUTE = _env_int("SEAQUILLER_LLM_REQUESTS_PER_MINUTE", 0)
+LLM_TOKENS_PER_MINUTE = _env_int("SEAQUILLER_LLM_TOKENS_PER_MINUTE", 0)
+# Share of each budget that batch traffic leaves free for interactive requests (0-1).
+LLM_BATCH_RESERVE = _env_float("SEAQUILLER_LLM_BATCH_RESERVE", 0.2)
+# Retries of rate-limited or failed LLM calls, with jittered exponential backoff between them.
+LLM_MAX_RETRIES = _env_int("SEAQUILLER_LLM_MAX_RETRIES", 4)
+LLM_BACKOFF_BASE_SECONDS = _env_float("SEAQUILLER_LLM_BACKOFF_BASE_SECONDS", 0.5)
+LLM_BACKOFF_MAX_SECONDS = _env_float("SEAQUILLER_LLM_BACKOFF_MAX_SECONDS", 30.0)
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.utils.json import parse_partial_json
+
+from .budget import remaining_seconds
+from .graph import asave_partial_answer
+from .nodes import budget_exhausted_answer
+
+logger = logging.getLogger(__name__)
+
+# Tool that carries SQL into the execute_query node.
+QUERY_TOOL_NAME = "query_db"
+ANSWER_TOOL_NAME = "SubmitFinalAnswer"
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    Formats one server-sent event.
+
+    Args:
+        event (str): The event name.
+        data (Dict[str, Any]): JSON-serializable payload.
+
+    Returns:
+        str: The encoded event, terminated by a blank line.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _final_answer(message: Any) -> str:
+    for tc in getattr(message, "tool_calls", None) or []:
+        if tc["name"] == ANSWER_TOOL_NAME:
+            return tc["args"].get("final_answer")
+    return None
+
+
+def _node_update_events(node: str, update: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    yield "node", {"node": node, "status": "completed"}
+    for message in (update or {}).get("messages", []):
+        if isinstance(message, ToolMessage) and node in ("execute_query", "correct_query", "speculate", "template"):
+            status = "error" if str(message.content).startswith("Error:") else "ok"
+            yield "rows", {"status": status, "content": message.content}
+        elif isinstance(message, AIMessage):
+            for tc in message.tool_calls:
+                if tc["name"] == QUERY_TOOL_NAME:
+                    yield "sql", {"node": node, "query": next(iter(tc["args"].values()), "")}
+            answer = _final_answer(message)
+            if answer is not None:
+                yield "answer", {"response": answer, "partial": node == "give_up"}
+            elif node == "query_gen" and not message.tool_calls and message.content:
+                yield "sql", {"node": node, "query": message.content}
+
+
+class _AnswerTokenTracker:
+    """
+    Turns streamed SubmitFinalAnswer tool-call chunks into plain-text answer deltas.
+
+    The answer arrives as JSON argument fragments, so the accumulated arguments are
+    parsed leniently on every chunk and only the newly visible suffix is emitted.
+    """
+
+    def __init__(self):
+        self.args: Dict[str, str] = {}
+        self.emitted: Dict[str, int] = {}
+
+    def feed(self, chunk: AIMessageChunk) -> str:
+        delta = ""
+        for tcc in chunk.tool_call_chunks or []:
+            key = f"{chunk.id}:{tcc.get('index')}"
+            self.args[key] = self.args.get(key, "") + (tcc.get("args") or "")
+            parsed = parse_partial_json(self.args[key]) if self.args[key] else None
+            text = parsed.get("final_answer") if isinstance(parsed, dict) else None
+            if isinstance(text, str):
+                seen = self.emitted.get(key, 0)
+                delta += text[seen:]
+                self.emitted[key] = len(text)
+        return delta
+
+
+async def stream_events(app: Any, inputs: Dict[str, Any],
+                        config: Optional[Dict[str, Any]] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Runs the graph and yields progress events as they happen.
+
+    Event names are ``node`` (a node finished), ``sql`` (a candidate or checked query),
+    ``rows`` (execution result or error), ``token`` (final-answer text as the LLM writes it),
+    ``answer`` (the complete final answer) and finally ``done``. If the request budget in
+    ``inputs`` has a deadline and it passes, the run is cancelled and a partial ``answer``
+    is emitted instead.
+
+    Args:
+        app: The compiled LangGraph app.
+        inputs (Dict[str, Any]): Graph input, e.g. {"messages": [("user", question)]}.
+        config (Dict[str, Any], optional): Runnable config such as the recursion limit.
+
+    Yields:
+        Tuple[str, Dict[str, Any]]: (event name, payload) pairs.
+    """
+    tracker = _AnswerTokenTracker()
+    messages = []
+    stream = app.astream(inputs, config=config, stream_mode=["updates", "messages"])
+    try:
+        while True:
+            try:
+                mode, payload = await asyncio.wait_for(stream.__anext__(), timeout=remaining_seconds(inputs))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                answer = budget_exhausted_answer(messages, "ran out of time")
+                await asave_partial_answer(app, config, answer, "ran out of time")
+                yield "answer", {"response": _final_answer(answer), "partial": True}
+                break
+            if mode == "messages":
+                chunk, metadata = payload
+                if isinstance(chunk, AIMessageChunk) and metadata.get("langgraph_node") == "query_gen":
+                    delta = tracker.feed(chunk)
+                    if delta:
+                        yield "token", {"text": delta}
+            elif mode == "updates":
+                for node, update in payload.items():
+                    messages.extend((update or {}).get("messages", []))
+                    for event in _node_update_events(node, update):
+                        yield event
+    finally:
+        await stream.aclose()
+    yield "done", {}
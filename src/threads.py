@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from .settings import THREADS_MAX_ENTRIES, THREADS_PATH, THREADS_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two sweeps for expired and surplus threads
+PRUNE_INTERVAL_SECONDS = 60.0
+# Thread ids deleted per statement
+PRUNE_BATCH_SIZE = 500
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+
+def _threaded_saver_class():
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class ThreadedSqliteSaver(SqliteSaver):
+        """
+        SqliteSaver whose async methods run the sync ones on a worker thread.
+
+        One connection serves every graph and event loop in the process (the saver
+        serializes access with its own lock), unlike AsyncSqliteSaver, which is bound to
+        the event loop that opened it.
+
+        It also records when each thread was last written, and deletes threads idle
+        for longer than ``ttl`` and the least recently written ones past ``max_threads``.
+        """
+
+        def __init__(self, conn, max_threads: int = THREADS_MAX_ENTRIES, ttl: float = THREADS_TTL_SECONDS, **kwargs):
+            super().__init__(conn, **kwargs)
+            self.max_threads = max_threads
+            self.ttl = ttl
+            self._pruned_at = 0.0
+
+        def setup(self) -> None:
+            if self.is_setup:
+                return
+            super().setup()
+            self.conn.execute("CREATE TABLE IF NOT EXISTS thread_activity "
+                              "(thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS thread_activity_updated ON thread_activity (updated_at)")
+            # Threads written before activity was tracked start their TTL now
+            self.conn.execute("INSERT OR IGNORE INTO thread_activity (thread_id, updated_at) "
+                              "SELECT DISTINCT thread_id, ? FROM checkpoints", (time.time(),))
+            self.conn.commit()
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            now = time.time()
+            with self.cursor() as cur:
+                cur.execute("INSERT OR REPLACE INTO thread_activity (thread_id, updated_at) VALUES (?, ?)",
+                            (str(config["configurable"]["thread_id"]), now))
+                if now - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+                    self._pruned_at = now
+                    self._prune(cur, now)
+            return saved
+
+        def _prune(self, cur, now: float) -> int:
+            expired = set()
+            if self.ttl:
+                cur.execute("SELECT thread_id FROM thread_activity WHERE updated_at < ?", (now - self.ttl,))
+                expired.update(row[0] for row in cur.fetchall())
+            if self.max_threads:
+                cur.execute("SELECT thread_id FROM thread_activity ORDER BY updated_at DESC LIMIT -1 OFFSET ?",
+                            (self.max_threads,))
+                expired.update(row[0] for row in cur.fetchall())
+            if not expired:
+                return 0
+            ids = sorted(expired)
+            for start in range(0, len(ids), PRUNE_BATCH_SIZE):
+                batch = [(thread_id,) for thread_id in ids[start:start + PRUNE_BATCH_SIZE]]
+                for table in ("writes", "checkpoints", "thread_activity"):
+                    cur.executemany(f"DELETE FROM {table} WHERE thread_id = ?", batch)
+            logger.info(f"Deleted {len(ids)} expired conversation threads.")
+            return len(ids)
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[Any]:
+            for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before,
+                                                                       limit=limit))):
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+    return ThreadedSqliteSaver
+
+
+def get_checkpointer(path: str = THREADS_PATH) -> Optional[Any]:
+    """
+    Returns the process-wide checkpointer that persists conversation threads.
+
+    Args:
+        path (str): SQLite file for the checkpoints; empty disables threads.
+
+    Returns:
+        Optional[BaseCheckpointSaver]: The checkpointer, or None when threads are disabled.
+    """
+    global _checkpointer
+    if not path:
+        return None
+    with _checkpointer_lock:
+        if _checkpointer is None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            _checkpointer = _threaded_saver_class()(conn)
+            logger.info(f"Conversation threads are stored in {path}")
+        return _checkpointer
+
+
+def thread_config(profile_key: tuple, thread_id: str) -> Dict[str, Any]:
+    """
+    Runnable config that selects a conversation thread.
+
+    Threads are scoped to the connection profile, so the same thread_id used against
+    another database starts a separate conversation.
+
+    Args:
+        profile_key (tuple): ConnectionProfile.key of the connection.
+        thread_id (str): Client-chosen thread id.
+
+    Returns:
+        Dict[str, Any]: {"configurable": {"thread_id": ...}}.
+    """
+    scope = hashlib.sha256(repr(profile_key).encode()).hexdigest()[:16]
+    return {"configurable": {"thread_id": f"{scope}:{thread_id}"}}
+
+
+def is_thread(config: Optional[Dict[str, Any]]) -> bool:
+    return bool((config or {}).get("configurable", {}).get("thread_id"))
@@ -0,0 +1,173 @@
+import logging
+import re
+from typing import Any, Dict, Optional, Set
+
+import sqlglot
+from sqlglot import exp
+from sqlalchemy.exc import DBAPIError
+
+from .dialects import with_hint
+from .resultcache import is_read_only
+
+logger = logging.getLogger(__name__)
+
+VALID = "valid"
+INVALID = "invalid"
+UNKNOWN = "unknown"
+
+SQLGLOT_DIALECTS = {
+    "sqlite": "sqlite",
+    "postgresql": "postgres",
+    "mysql": "mysql",
+    "mssql": "tsql",
+    "oracle": "oracle",
+}
+
+_WRITE = re.compile(
+    r"^\s*(insert|update|delete|merge|replace|upsert|drop|create|alter|truncate|grant|revoke|attach|detach|pragma|vacuum)\b",
+    re.IGNORECASE,
+)
+_FENCE = re.compile(r"```(?:sql)?\s*(.*?)```", re.IGNORECASE | re.DOTALL)
+
+
+def extract_sql(text: str) -> str:
+    """
+    Pulls the SQL out of a model reply, dropping markdown fences and a trailing semicolon.
+
+    Args:
+        text (str): The model output.
+
+    Returns:
+        str: The SQL text.
+    """
+    match = _FENCE.search(text or "")
+    sql = match.group(1) if match else (text or "")
+    return sql.strip().rstrip(";").strip()
+
+
+class ValidationResult:
+    def __init__(self, status: str, sql: str, message: str = "", definite: bool = True):
+        """
+        Outcome of validating one query.
+
+        Args:
+            status (str): VALID, INVALID or UNKNOWN (the local check could not decide).
+            sql (str): The query that was validated.
+            message (str): Why the query is invalid or undecided.
+            definite (bool): False when the database itself should have the last word,
+                e.g. column checks that depend on dialect quoting rules.
+        """
+        self.status = status
+        self.sql = sql
+        self.message = message
+        self.definite = definite
+
+    def __repr__(self) -> str:
+        return f"ValidationResult({self.status!r}, {self.message!r})"
+
+
+class SQLValidator:
+    def __init__(self, database_tools: Any):
+        """
+        Validates generated SQL against the reflected schema and an EXPLAIN dry run.
+
+        Args:
+            database_tools (DatabaseTool): The database to validate against.
+        """
+        self.database_tools = database_tools
+        self.dialect = SQLGLOT_DIALECTS.get(database_tools.db_type)
+
+    def validate(self, sql: str) -> ValidationResult:
+        """
+        Checks a query without calling an LLM.
+
+        The query must be a single read-only statement whose tables and columns exist,
+        and EXPLAIN must accept it where the dialect supports a side-effect free EXPLAIN.
+
+        Args:
+            sql (str): The query to check.
+
+        Returns:
+            ValidationResult: VALID, INVALID with the reason, or UNKNOWN.
+        """
+        sql = extract_sql(sql)
+        if not sql:
+            return ValidationResult(UNKNOWN, sql, "No SQL found.")
+        if _WRITE.match(sql):
+            return ValidationResult(INVALID, sql, "Only read-only SELECT queries are allowed.")
+        if not is_read_only(sql):
+            # Probably prose rather than SQL; let the LLM checker make sense of it.
+            return ValidationResult(UNKNOWN, sql, "Not a SELECT statement.")
+
+        static = self._check_identifiers(sql)
+        if static.status == INVALID and static.definite:
+            return static
+        if static.status == UNKNOWN and ";" in sql:
+            # Never hand EXPLAIN something that might be several statements.
+            return static
+
+        try:
+            explained = self.database_tools.explain(sql)
+        except DBAPIError as e:
+            if e.connection_invalidated:
+                return ValidationResult(UNKNOWN, sql, str(e.orig))
+            return ValidationResult(INVALID, sql, with_hint(self.database_tools.db_type, str(e.orig).strip()))
+        except Exception as e:
+            logger.warning(f"EXPLAIN dry run failed: {e}")
+            return ValidationResult(UNKNOWN, sql, str(e))
+
+        if explained is None:
+            # No safe EXPLAIN for this dialect: rely on the static check alone.
+            return static
+        # The database accepted the plan, which overrides any soft static complaint.
+        return ValidationResult(VALID, sql)
+
+    def _check_identifiers(self, sql: str) -> ValidationResult:
+        try:
+            statements = sqlglot.parse(sql, read=self.dialect)
+        except sqlglot.errors.SqlglotError as e:
+            return ValidationResult(UNKNOWN, sql, f"Could not parse query: {e}")
+        statements = [statement for statement in statements if statement is not None]
+        if len(statements) != 1:
+            return ValidationResult(INVALID, sql, "Submit exactly one SQL statement.")
+        statement = statements[0]
+
+        db = self.database_tools.db
+        existing = {name.lower() for name in db.get_usable_table_names()}
+        tables = {name.lower(): table for name, table in db._metadata.tables.items()}
+        ctes = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+
+        sources: Dict[str, Optional[Set[str]]] = {}
+        for table in statement.find_all(exp.Table):
+            name = table.name.lower()
+            if name in ctes or table.db:
+                columns = None
+            elif name in tables:
+                columns = {column.name.lower() for column in tables[name].columns}
+            elif name in existing:
+                # Not reflected yet; let the database check its columns.
+                columns = None
+            else:
+                return ValidationResult(INVALID, sql, f"no such table: {table.name}")
+            sources[table.alias_or_name.lower()] = columns
+        for subquery in statement.find_all(exp.Subquery):
+            if subquery.alias:
+                sources[subquery.alias.lower()] = None
+
+        aliases = {alias.alias.lower() for alias in statement.find_all(exp.Alias)}
+        unqualified_known = all(columns is not None for columns in sources.values())
+        all_columns = set().union(*[columns for columns in sources.values() if columns])
+
+        for column in statement.find_all(exp.Column):
+            name = column.name.lower()
+            if not name or name == "*":
+                continue
+            qualifier = column.table.lower()
+            if qualifier:
+                columns = sources.get(qualifier)
+                if qualifier in sources and columns is not None and name not in columns:
+                    return ValidationResult(INVALID, sql, f"no such column: {column.table}.{column.name}",
+                                            definite=False)
+            elif unqualified_known and name not in all_columns and name not in aliases:
+                return ValidationResult(INVALID, sql, f"no such column: {column.name}", definite=False)
+        return ValidationResult(VALID, sql)
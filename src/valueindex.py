@@ -0,0 +1,479 @@
+"""
+Index of the distinct values in each database's low-cardinality text columns.
+
+Questions name things by value ("the track 'Go Down'", "Rock songs"), and the model has
+to guess which table and column hold them; a wrong guess costs LIKE scans and retries.
+A background thread reads the distinct values of every text column with at most
+VALUE_INDEX_MAX_DISTINCT of them, and literals in the question are resolved against them
+(exact, prefix or trigram matches) before SQL generation.
+
+The scanned columns are persisted per connection. A refresh rescans only the tables
+whose definition or data changed since they were read: the database-wide data version
+says whether anything changed at all, and a cheap per-table marker (row count and
+highest rowid on SQLite, write counters on PostgreSQL) says which tables did.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.sql import sqltypes
+
+from .schemaindex import tokenize, trigrams
+from .schemasnapshot import SchemaSnapshotStore, table_fingerprints
+from .settings import (VALUE_INDEX_DIR, VALUE_INDEX_MAX_BYTES, VALUE_INDEX_MAX_DISTINCT,
+                       VALUE_INDEX_REFRESH_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+# Bump when the pickled layout changes so old indexes are rebuilt instead of misread.
+VALUE_INDEX_VERSION = 2
+
+# Longer values are prose rather than names and are not indexed
+VALUE_MAX_CHARS = 80
+# Seconds one column scan may run
+COLUMN_SCAN_TIMEOUT_SECONDS = 10.0
+# Columns are rescanned after this long even when no change was detected, for dialects
+# without change markers and for in-place updates the SQLite markers do not see
+COLUMN_MAX_AGE_SECONDS = 86400.0
+# Longest run of question words looked up as one value
+MAX_PHRASE_WORDS = 4
+# Matches shown to the model, and columns listed per literal
+MAX_HINTS = 8
+MAX_COLUMNS_PER_LITERAL = 3
+# Shortest literal matched by prefix, and the trigram similarity a fuzzy match needs
+MIN_PREFIX_CHARS = 3
+MIN_TRIGRAM_SIMILARITY = 0.5
+
+EXACT = "exact"
+PREFIX = "prefix"
+FUZZY = "fuzzy"
+
+# Quotes must not touch a word character on the outside, so "Who's" opens no literal
+_QUOTED = re.compile(r"(?<!\w)'([^']+)'(?!\w)|(?<!\w)\"([^\"]+)\"(?!\w)|‘([^’]+)’|“([^”]+)”")
+_WORD = re.compile(r"[\w&.'-]+")
+
+
+def normalize_value(value: str) -> str:
+    return " ".join(value.casefold().split()).strip(" .,;:!?")
+
+
+class ColumnValues:
+    def __init__(self, table: str, column: str, values: Optional[List[str]], fingerprint: Optional[str],
+                 marker: Optional[Hashable], scanned_at: float):
+        """
+        The distinct values of one text column at the time it was scanned.
+
+        Args:
+            table (str): Table name.
+            column (str): Column name.
+            values (List[str], optional): The values; None when the column had too many to index.
+            fingerprint (str, optional): Definition fingerprint of the table when scanned.
+            marker (Hashable, optional): Change marker of the table when scanned; None when
+                the dialect has none.
+            scanned_at (float): Unix time of the scan.
+        """
+        self.table = table
+        self.column = column
+        self.values = values
+        self.fingerprint = fingerprint
+        self.marker = marker
+        self.scanned_at = scanned_at
+
+
+class ValueSnapshot:
+    def __init__(self, columns: Dict[Tuple[str, str], ColumnValues], data_version: Optional[Hashable] = None):
+        """
+        What is persisted: every scanned column, keyed by (table, column), and the
+        database-wide data version the table markers were read at.
+        """
+        self.version = VALUE_INDEX_VERSION
+        self.columns = columns
+        self.data_version = data_version
+
+
+class ValueIndexStore(SchemaSnapshotStore):
+    """Reads and writes the value index of one connection."""
+
+    version = VALUE_INDEX_VERSION
+
+    @classmethod
+    def for_scope(cls, scope: str, directory: str = VALUE_INDEX_DIR) -> Optional["ValueIndexStore"]:
+        return super().for_scope(scope, directory)
+
+
+class ValueMatch:
+    def __init__(self, literal: str, table: str, column: str, value: str, kind: str):
+        """
+        A question literal resolved to a stored value.
+
+        Args:
+            literal (str): The text of the question that matched.
+            table (str): Table holding the value.
+            column (str): Column holding the value.
+            value (str): The value as stored.
+            kind (str): EXACT, PREFIX or FUZZY.
+        """
+        self.literal = literal
+        self.table = table
+        self.column = column
+        self.value = value
+        self.kind = kind
+
+    def __repr__(self) -> str:
+        return f"ValueMatch({self.literal!r} -> {self.table}.{self.column} = {self.value!r}, {self.kind})"
+
+
+class ValueLookup:
+    def __init__(self, columns: Iterable[ColumnValues]):
+        """
+        Read-only search structures over the indexed values; rebuilt and swapped in whole
+        on every refresh, so lookups never take a lock.
+
+        Args:
+            columns (Iterable[ColumnValues]): The scanned columns.
+        """
+        self.entries: List[Tuple[str, str, str]] = []
+        self.exact: Dict[str, List[int]] = {}
+        grams: Dict[str, List[int]] = {}
+        for column in columns:
+            for value in column.values or ():
+                index = len(self.entries)
+                self.entries.append((column.table, column.column, value))
+                key = normalize_value(value)
+                self.exact.setdefault(key, []).append(index)
+                for gram in trigrams(key):
+                    grams.setdefault(gram, []).append(index)
+        self.prefixes = sorted(self.exact)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in grams.items()}
+        self.gram_counts = np.zeros(len(self.entries), dtype=np.int32)
+        for ids in self.postings.values():
+            self.gram_counts[ids] += 1
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def find_exact(self, key: str) -> List[int]:
+        return self.exact.get(key, [])
+
+    def find_prefix(self, key: str) -> List[int]:
+        ids = []
+        start = bisect.bisect_left(self.prefixes, key)
+        for indexed in self.prefixes[start:start + MAX_COLUMNS_PER_LITERAL]:
+            if not indexed.startswith(key):
+                break
+            ids.extend(self.exact[indexed])
+        return ids
+
+    def find_fuzzy(self, key: str) -> List[int]:
+        """Values sharing most trigrams with ``key``, most similar first."""
+        query = trigrams(key)
+        postings = [self.postings[gram] for gram in query if gram in self.postings]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.entries))
+        similarity = shared / (len(query) + self.gram_counts - shared)
+        best = np.flatnonzero(similarity >= MIN_TRIGRAM_SIMILARITY)
+        return best[np.argsort(-similarity[best], kind="stable")][:MAX_COLUMNS_PER_LITERAL].tolist()
+
+
+def _text_columns(table: Any) -> List[Any]:
+    return [column for column in table.columns if isinstance(column.type, sqltypes.String)]
+
+
+def _value_bytes(column: ColumnValues) -> int:
+    return sum(len(value.encode("utf-8")) for value in column.values or ())
+
+
+def question_phrases(question: str) -> Tuple[List[str], List[str]]:
+    """
+    Splits a question into the literals worth looking up.
+
+    Returns:
+        Tuple[List[str], List[str]]: Quoted literals, then runs of up to MAX_PHRASE_WORDS
+        words, longest first. Single words that are stopwords are left out.
+    """
+    quoted = [next(group for group in match.groups() if group) for match in _QUOTED.finditer(question)]
+    words = [word.strip(".'-") for word in _WORD.findall(question)]
+    words = [word for word in words if word]
+    phrases = []
+    for size in range(min(MAX_PHRASE_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            phrase = " ".join(words[start:start + size])
+            if size == 1 and (len(phrase) < 3 or not tokenize(phrase)):
+                continue
+            phrases.append(phrase)
+    return quoted, phrases
+
+
+class ValueIndex:
+    def __init__(self, database_tools: Any, max_bytes: int = VALUE_INDEX_MAX_BYTES,
+                 max_distinct: int = VALUE_INDEX_MAX_DISTINCT, refresh_seconds: float = VALUE_INDEX_REFRESH_SECONDS):
+        """
+        Column-value index of one database, built and refreshed on a background thread.
+
+        Args:
+            database_tools (DatabaseTool): The database to index.
+            max_bytes (int): UTF-8 bytes of values kept across all columns; columns past the
+                cap are left out.
+            max_distinct (int): Columns with more distinct values are not indexed.
+            refresh_seconds (float): Minimum seconds between two refreshes.
+        """
+        self.database_tools = database_tools
+        self.max_bytes = max_bytes
+        self.max_distinct = max_distinct
+        self.refresh_seconds = refresh_seconds
+        self.store = ValueIndexStore.for_scope(database_tools.cache_scope)
+        snapshot = self.store.load() if self.store else None
+        self.columns: Dict[Tuple[str, str], ColumnValues] = snapshot.columns if snapshot else {}
+        self.data_version: Optional[Hashable] = snapshot.data_version if snapshot else None
+        self.lookup_index = ValueLookup(self._capped(self.columns))
+        self.refreshed_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._closed = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Refreshes on a background thread unless a refresh is running or one ran recently."""
+        if self._closed or self._refresh_lock.locked():
+            return
+        if self.refreshed_at and time.monotonic() - self.refreshed_at < self.refresh_seconds:
+            return
+        self.thread = threading.Thread(target=self._refresh_logged, name="seaquiller-values", daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        """Stops a running refresh after its current column."""
+        self._closed = True
+
+    def _refresh_logged(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"Value index refresh failed: {e}")
+
+    def refresh(self) -> int:
+        """
+        Rescans the columns that are new, whose table definition changed, or whose table
+        data changed, then swaps in the new lookup structures and persists them.
+
+        Table markers are only read when the database-wide data version moved since the
+        last refresh. A column that fails to scan keeps its previous values and is
+        retried on the next refresh.
+
+        Returns:
+            int: Columns rescanned.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return 0
+        try:
+            self.refreshed_at = time.monotonic()
+            db = self.database_tools.db
+            usable = set(db.get_usable_table_names())
+            tables = [table for table in db._metadata.sorted_tables if table.name in usable and _text_columns(table)]
+            fingerprints = table_fingerprints(self.database_tools.engine, [table.name for table in tables])
+            data_version = self.database_tools.data_version.version()
+            if not isinstance(data_version, (int, str, tuple)):
+                data_version = None
+            wanted = {(table.name, column.name) for table in tables for column in _text_columns(table)}
+            columns = {key: column for key, column in self.columns.items() if key in wanted}
+
+            # Unchanged tables whose data may have moved; the rest are rescanned anyway or have no values
+            candidates = [table.name for table in tables
+                          if any(self._needs_marker(columns.get((table.name, column.name)), fingerprints.get(table.name))
+                                 for column in _text_columns(table))]
+            if data_version is not None and data_version == self.data_version:
+                markers = {}
+            else:
+                markers = self._table_markers(candidates)
+
+            scanned, failed = 0, 0
+            for table in tables:
+                fingerprint = fingerprints.get(table.name)
+                for column in _text_columns(table):
+                    if self._closed:
+                        return scanned
+                    current = columns.get((table.name, column.name))
+                    marker = markers.get(table.name, current.marker if current is not None else None)
+                    if current is not None and not self._stale(current, fingerprint, marker):
+                        continue
+                    try:
+                        values = self._scan(table, column)
+                    except Exception as e:
+                        logger.warning(f"Value index: could not scan {table.name}.{column.name}: {e}")
+                        failed += 1
+                        continue
+                    columns[(table.name, column.name)] = ColumnValues(
+                        table.name, column.name, values, fingerprint, marker, time.time())
+                    scanned += 1
+
+            # A failed scan must be retried, so the data version is only advanced without failures
+            advanced = not failed and data_version != self.data_version
+            if advanced:
+                self.data_version = data_version
+            changed = scanned or len(columns) != len(self.columns)
+            if changed:
+                self.columns = columns
+                self.lookup_index = ValueLookup(self._capped(columns))
+            if self.store is not None and (changed or advanced):
+                self.store.save(ValueSnapshot(self.columns, self.data_version))
+            logger.info(f"Value index: {scanned} columns scanned, {len(self.lookup_index)} values indexed.")
+            return scanned
+        finally:
+            self._refresh_lock.release()
+
+    @staticmethod
+    def _needs_marker(column: Optional[ColumnValues], fingerprint: Optional[str]) -> bool:
+        # New columns and changed definitions are scanned regardless, and need the marker to store with them
+        return column is None or column.fingerprint != fingerprint or column.values is not None
+
+    @staticmethod
+    def _stale(column: ColumnValues, fingerprint: Optional[str], marker: Optional[Hashable]) -> bool:
+        if column.fingerprint != fingerprint:
+            return True
+        # A column over the distinct-value cap stays over it through ordinary writes
+        if column.values is not None and column.marker is not None and column.marker != marker:
+            return True
+        return time.time() - column.scanned_at > COLUMN_MAX_AGE_SECONDS
+
+    def _table_markers(self, names: List[str]) -> Dict[str, Hashable]:
+        """
+        Cheap per-table change markers, so only the tables that were written are rescanned.
+
+        Args:
+            names (List[str]): The tables to read markers for.
+
+        Returns:
+            Dict[str, Hashable]: Table name to marker. Tables are missing on dialects
+            without markers, or when reading theirs failed; their columns then rely on
+            COLUMN_MAX_AGE_SECONDS.
+        """
+        markers: Dict[str, Hashable] = {}
+        if not names:
+            return markers
+        db_type = self.database_tools.db_type
+        if db_type == "postgresql":
+            query = text("SELECT relname, n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables "
+                         "WHERE schemaname = current_schema()")
+            try:
+                with self.database_tools.statement_deadline(COLUMN_SCAN_TIMEOUT_SECONDS):
+                    with self.database_tools.engine.connect() as conn:
+                        rows = conn.execute(query).fetchall()
+            except Exception as e:
+                logger.warning(f"Value index: could not read table write counters: {e}")
+                return markers
+            wanted = set(names)
+            return {name: int(count) for name, count in rows if name in wanted}
+        if db_type == "sqlite":
+            for name in names:
+                if self._closed:
+                    break
+                quoted = self.database_tools.engine.dialect.identifier_preparer.quote(name)
+                try:
+                    with self.database_tools.statement_deadline(COLUMN_SCAN_TIMEOUT_SECONDS):
+                        with self.database_tools.engine.connect() as conn:
+                            try:
+                                row = conn.execute(text(f"SELECT COUNT(*), MAX(rowid) FROM {quoted}")).one()
+                            except Exception:
+                                # WITHOUT ROWID tables only have the count
+                                row = conn.execute(text(f"SELECT COUNT(*) FROM {quoted}")).one()
+                    markers[name] = tuple(row)
+                except Exception as e:
+                    logger.warning(f"Value index: could not read the change marker of {name}: {e}")
+        return markers
+
+    def _scan(self, table: Any, column: Any) -> Optional[List[str]]:
+        statement = select(column).where(column.isnot(None)).distinct().limit(self.max_distinct + 1)
+        with self.database_tools.statement_deadline(COLUMN_SCAN_TIMEOUT_SECONDS):
+            with self.database_tools.engine.connect() as conn:
+                rows = conn.execute(statement).fetchall()
+        if len(rows) > self.max_distinct:
+            return None
+        values = {str(row[0]).strip() for row in rows if isinstance(row[0], str)}
+        return sorted(value for value in values if value and len(value) <= VALUE_MAX_CHARS)
+
+    def _capped(self, columns: Dict[Tuple[str, str], ColumnValues]) -> List[ColumnValues]:
+        # Smallest columns first: they are the likeliest to hold categories and names
+        kept, total = [], 0
+        sized = [(_value_bytes(column), column) for column in columns.values() if column.values]
+        for size, column in sorted(sized, key=lambda item: (item[0], item[1].table, item[1].column)):
+            if total + size > self.max_bytes:
+                logger.info(f"Value index is full; {column.table}.{column.column} and larger columns are left out.")
+                break
+            kept.append(column)
+            total += size
+        return kept
+
+    def lookup(self, question: str, max_hints: int = MAX_HINTS) -> List[ValueMatch]:
+        """
+        Resolves the literals of a question to stored values.
+
+        Quoted literals are matched exactly, then by prefix, then by trigram similarity;
+        other runs of words only exactly, longest first, and words already covered by a
+        longer match are not looked up again.
+
+        Args:
+            question (str): The user question.
+            max_hints (int): Maximum matches returned.
+
+        Returns:
+            List[ValueMatch]: The matches, quoted literals first.
+        """
+        self.start()
+        index = self.lookup_index
+        if not len(index):
+            return []
+        quoted, phrases = question_phrases(question)
+        matches: List[ValueMatch] = []
+        seen = set()
+
+        def add(literal: str, ids: List[int], kind: str) -> bool:
+            found = False
+            for value_id in ids[:MAX_COLUMNS_PER_LITERAL]:
+                table, column, value = index.entries[value_id]
+                if (table, column, value) not in seen:
+                    seen.add((table, column, value))
+                    matches.append(ValueMatch(literal, table, column, value, kind))
+                found = True
+            return found
+
+        for literal in quoted:
+            key = normalize_value(literal)
+            if not key:
+                continue
+            if add(literal, index.find_exact(key), EXACT):
+                continue
+            if len(key) >= MIN_PREFIX_CHARS and add(literal, index.find_prefix(key), PREFIX):
+                continue
+            add(literal, index.find_fuzzy(key), FUZZY)
+
+        covered = {word for literal in quoted for word in normalize_value(literal).split()}
+        for phrase in phrases:
+            key = normalize_value(phrase)
+            if key and not set(key.split()) <= covered and add(phrase, index.find_exact(key), EXACT):
+                covered.update(key.split())
+        return matches[:max_hints]
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def render_value_hints(matches: List[ValueMatch]) -> str:
+    """
+    Value matches as a section of the query_gen system prompt; "" when there are none.
+    """
+    if not matches:
+        return ""
+    lines = []
+    for match in matches:
+        line = f"- {match.table}.{match.column} = {_sql_string(match.value)}"
+        if match.kind != EXACT:
+            line += f" (closest stored value to {_sql_string(match.literal)})"
+        lines.append(line)
+    return ("\n\nValues from the question found in the database; filter on these columns and values "
+            "instead of searching with LIKE:\n" + "\n".join(lines))
@@ -0,0 +1,132 @@
+"""
+Background warm-up: the server binds its port first and pays for the heavy imports,
+schema reflection and graph compilation afterwards, on a separate thread.
+
+This module must stay cheap to import; everything heavy is imported inside warm().
+"""
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .settings import WARMUP_PROFILES
+
+logger = logging.getLogger(__name__)
+
+# Imported in this order by the warm-up thread; together they pull in LangChain and LangGraph.
+HEAVY_MODULES = ["nodes", "graph", "registry", "metrics", "streaming", "batch", "results", "cache"]
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def import_heavy_modules() -> None:
+    """Imports HEAVY_MODULES; instant once they are loaded."""
+    for module in HEAVY_MODULES:
+        importlib.import_module(f".{module}", __package__)
+
+
+def load_profiles(value: str = WARMUP_PROFILES) -> List[Dict[str, Any]]:
+    """
+    Reads the profiles to warm up: a JSON list of connection profiles, or the path of
+    a file holding one.
+
+    Args:
+        value (str): JSON text or a file path; empty means none.
+
+    Returns:
+        List[Dict[str, Any]]: ConnectionProfile fields per profile.
+    """
+    value = value.strip()
+    if not value:
+        return []
+    if not value.startswith("["):
+        with open(os.path.expanduser(value)) as f:
+            value = f.read()
+    profiles = json.loads(value)
+    if not isinstance(profiles, list):
+        raise ValueError("SEAQUILLER_WARMUP_PROFILES must be a JSON list of connection profiles.")
+    return profiles
+
+
+class Warmup:
+    """
+    Tracks what the warm-up thread has done, for /readyz.
+    """
+
+    def __init__(self, profiles: Optional[List[Dict[str, Any]]] = None):
+        self.profiles = profiles or []
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._steps: Dict[str, Dict[str, Any]] = {"imports": {"status": PENDING}}
+        for index, profile in enumerate(self.profiles):
+            self._steps[self._profile_step(index, profile)] = {"status": PENDING}
+        self._done = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _profile_step(index: int, profile: Dict[str, Any]) -> str:
+        return f"profile:{index}:{profile.get('db_type')}:{profile.get('database')}"
+
+    def start(self) -> "Warmup":
+        self.thread = threading.Thread(target=self.warm, name="seaquiller-warmup", daemon=True)
+        self.thread.start()
+        return self
+
+    def warm(self) -> None:
+        """
+        Imports the heavy modules, then connects, reflects and compiles the graph of
+        every configured profile into the registry. A failing profile is reported and
+        skipped; it is built again on its first request.
+        """
+        try:
+            with self._step("imports"):
+                import_heavy_modules()
+            from .registry import ConnectionProfile, registry
+
+            for index, fields in enumerate(self.profiles):
+                try:
+                    with self._step(self._profile_step(index, fields)):
+                        registry.get(ConnectionProfile(**fields))
+                except Exception:
+                    logger.exception(f"Warm-up of profile {index} failed")
+        except Exception:
+            logger.exception("Warm-up failed")
+        finally:
+            self._done.set()
+            logger.info(f"Warm-up finished in {time.monotonic() - self.started_at:.2f}s")
+
+    @contextmanager
+    def _step(self, name: str):
+        started = time.monotonic()
+        self._set(name, status=RUNNING)
+        try:
+            yield
+        except Exception as e:
+            self._set(name, status=FAILED, seconds=round(time.monotonic() - started, 3), error=str(e))
+            raise
+        self._set(name, status=DONE, seconds=round(time.monotonic() - started, 3))
+
+    def _set(self, name: str, **fields: Any) -> None:
+        with self._lock:
+            self._steps[name] = fields
+
+    @property
+    def ready(self) -> bool:
+        """True once the imports are done and every profile finished warming up, failed or not."""
+        return self._done.is_set() and self._steps["imports"]["status"] == DONE
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: "ready", seconds since start, and the status of each step.
+        """
+        with self._lock:
+            steps = {name: dict(step) for name, step in self._steps.items()}
+        return {"ready": self.ready, "uptime": round(time.monotonic() - self.started_at, 3), "steps": steps}